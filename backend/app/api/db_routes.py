@@ -1,14 +1,15 @@
 from datetime import datetime
-from uuid import UUID
-from fastapi import APIRouter, Depends
+import zlib
+from uuid import UUID, uuid4
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, Request
 from app.db.models.user import UserLogin, UserCreate
 from fastapi import APIRouter, HTTPException
 from core.config import settings
 from core.config import logger
 from app.db.models.user import Token
-from app.service.auth import create_access_token, get_current_user, oauth2_scheme
+from app.service.auth import create_access_token, get_current_user, oauth2_scheme, require_avatar, revoke_token
 import asyncpg
-from app.core.security import pwd_context
+from app.core.security import hash_password, verify_password
 from app.core.monitoring import metrics
 from app.core.redis_instance import get_redis_client
 import jwt
@@ -18,60 +19,56 @@ from app.db.models.avatar import AvatarCreate, Message
 from bson.objectid import ObjectId
 import json
 from app.core.config import logger
-from app.db.sql import signup_user, update_last_user_login, select_id_with_user_email, login_user, create_avatar_sql, get_all_avatars_per_user
+from app.service import avatar_cache, conversation_cache, conversation_import, conversation_store, retrieval
+from app.service.write_behind import conversation_writer
+from app.db import statements
+from app.db import health as dependency_health
 
 router = APIRouter()
 
 @router.post("/signup", status_code=201)
 async def signup(user: UserCreate):
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = await hash_password(user.password)
     async with db.postgres_pool.acquire() as conn:
         try:
-            await conn.execute(
-                signup_user,
-                user.username,
-                user.email,
-                hashed_password,
-                datetime.now(),
-            )
-            
-            # Retrieve user ID (you can alternatively use RETURNING in the INSERT)
-            row = await conn.fetchrow(select_id_with_user_email, user.email)
-            if not row:
-                raise HTTPException(status_code=500, detail="Failed to retrieve user after creation.")
-
-            user_id = str(row["id"])
-            access_token = create_access_token(data={"sub": user_id})
-
-            # Cache the token in Redis
-            redis_client = await get_redis_client()
-            await redis_client.setex(f"token:{access_token}", settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60, user_id)
-            
-            await conn.execute(
-                update_last_user_login,
-                datetime.now(),
-                user_id
-            )
-
-            logger.info("User created successfully")
-            return {"access_token": access_token, "token_type": "bearer"}
-
+            user_id = await statements.signup_user(conn, user.username, user.email, hashed_password, datetime.now())
         except asyncpg.UniqueViolationError:
             raise HTTPException(status_code=400, detail="Email already registered.")
+
+    user_id = str(user_id)
+    access_token = create_access_token(data={"sub": user_id})
+
+    # Cache the token in Redis
+    redis_client = await get_redis_client()
+    await redis_client.setex(f"token:{access_token}", settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60, user_id)
+
+    logger.info("User created successfully")
+    return {"access_token": access_token, "token_type": "bearer"}
         
 from fastapi.security import OAuth2PasswordRequestForm
 
 @router.post("/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    # The pool connection is released while bcrypt runs so a login burst cannot starve the pool
+    async with db.postgres_pool.acquire() as conn:
+        row = await statements.login_user(conn, form_data.username)
+    if not row:
+        raise HTTPException(status_code=401, detail="Invalid email or password.")
+    valid, new_hash = await verify_password(form_data.password, row["password"])
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid email or password.")
+
+    # One statement stamps last_login and, if BCRYPT_ROUNDS changed since this hash was stored,
+    # upgrades it now that we know the password
     async with db.postgres_pool.acquire() as conn:
-        row = await conn.fetchrow(login_user, form_data.username)
-        if not row or not pwd_context.verify(form_data.password, row["password"]):
-            raise HTTPException(status_code=401, detail="Invalid email or password.")
-        access_token = create_access_token(data={"sub": str(row["id"])})
-        redis_client = await get_redis_client()
-        await redis_client.setex(f"token:{access_token}", settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60, str(row["id"]))
-        await conn.execute(update_last_user_login, datetime.now(), row["id"]) # update the user's last login timef
-        return {"access_token": access_token, "token_type": "bearer"}
+        await statements.record_login(conn, row["id"], datetime.now(), new_hash)
+    if new_hash:
+        metrics.password_rehashes.inc()
+
+    access_token = create_access_token(data={"sub": str(row["id"])})
+    redis_client = await get_redis_client()
+    await redis_client.setex(f"token:{access_token}", settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60, str(row["id"]))
+    return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/logout")
 async def logout(token: str = Depends(oauth2_scheme)):
@@ -80,8 +77,7 @@ async def logout(token: str = Depends(oauth2_scheme)):
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         logger.debug(f"Logout payload: {payload}")
         user_id = payload.get("sub")
-        redis_client = await get_redis_client()
-        await redis_client.delete(f"token:{token}")
+        await revoke_token(token)  # also evicts the token from every process's auth cache
         return {"message": "Logout successful. Please delete the token on client side."}
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired.")
@@ -89,7 +85,7 @@ async def logout(token: str = Depends(oauth2_scheme)):
         raise HTTPException(status_code=401, detail="Invalid token.")
 
 @router.get("/profile")
-async def profile(current_user: asyncpg.Record = Depends(get_current_user)):
+async def profile(current_user: dict = Depends(get_current_user)):
     return {
         "id": str(current_user["id"]),
         "username": str(current_user["username"]),
@@ -103,114 +99,149 @@ async def create_avatar(
     current_user=Depends(get_current_user)
 ):
     async with db.postgres_pool.acquire() as conn:
-        avatar_id: UUID = await conn.fetchval(
-            create_avatar_sql,
-            current_user["id"], avatar.name, avatar.description
-        )
+        avatar_id: UUID = await statements.create_avatar(conn, current_user["id"], avatar.name, avatar.description)
+    redis_client = await get_redis_client()
+    if redis_client:
+        await avatar_cache.invalidate(redis_client, current_user["id"])
     return {"avatar_id": str(avatar_id)}  # return string form of UUID for frontend use
 
 @router.get("/avatars")
-async def get_avatars(current_user=Depends(get_current_user)):
+async def get_avatars(
+    limit: int = Query(settings.AVATAR_PAGE_SIZE, ge=1, le=settings.AVATAR_MAX_PAGE_SIZE),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    current_user=Depends(get_current_user)
+):
+    # Newest first, one keyset page at a time: pass next_cursor back until it is null
+    after = avatar_cache.decode_cursor(cursor) if cursor else None
+    redis_client = await get_redis_client()
+    if redis_client:
+        page = await avatar_cache.get_page(redis_client, current_user["id"], limit, cursor)
+        if page is not None:
+            return page
+
     async with db.postgres_pool.acquire() as conn:
-        rows = await conn.fetch(
-            get_all_avatars_per_user,
-            current_user["id"]
-        )
-    return [dict(row) for row in rows]
+        rows = await statements.list_avatars(conn, current_user["id"], limit + 1, after)
+    next_cursor = avatar_cache.encode_cursor(rows[limit - 1]["created_at"], rows[limit - 1]["id"]) if len(rows) > limit else None
+    page = {
+        "avatars": [
+            {**dict(row), "id": str(row["id"]), "created_at": row["created_at"].isoformat()}
+            for row in rows[:limit]
+        ],
+        "next_cursor": next_cursor,
+    }
+    if redis_client:
+        await avatar_cache.set_page(redis_client, current_user["id"], limit, cursor, page)
+    return page
 
 # Load from Mongodb -> Redis
 @router.get("/avatars/{avatar_id}/select")
-async def select_avatar(avatar_id: int, current_user=Depends(get_current_user)):
+async def select_avatar(
+    avatar_id: UUID,
+    limit: int = Query(settings.CONVERSATION_PAGE_SIZE, ge=1, le=settings.CONVERSATION_HOT_SIZE),
+    before: int = Query(0, ge=0),
+    current_user=Depends(get_current_user)
+):
+    # Returns the `limit` messages preceding cursor `before` (0 = newest) and the cursor of the next older page
+    user_id = str(current_user["id"])
+    avatar_id = await require_avatar(avatar_id, current_user["id"])
     redis_client = await get_redis_client()
-    redis_key = f"avatar:{avatar_id}:messages"
-    
-    cached = await redis_client.get(redis_key)
-    if cached:
-        messages = json.loads(cached)
+    messages = await conversation_cache.read_window(redis_client, user_id, avatar_id, limit, before)
+    if messages is not None:
+        next_cursor = before + len(messages) if len(messages) == limit else None
     else:
-        collection = db.mongo_db["avatar_conversations"]
-        doc = await collection.find_one({
-            "avatar_id": avatar_id,
-            "user_id": str(current_user["id"])
-        })
-        if not doc:
+        await conversation_writer.flush()  # read-your-writes: drain queued messages before reading MongoDB
+        depth = settings.CONVERSATION_HOT_SIZE if before == 0 else limit
+        page = await conversation_store.read_messages(avatar_id, user_id, depth, before)
+        if page is None:
             raise HTTPException(status_code=404, detail="No conversation found for avatar.")
-        messages = doc.get("messages", [])
-        await redis_client.set(redis_key, json.dumps(messages))
+        messages, total = page
+        if before == 0:
+            # Cold avatar: the newest page doubles as the rebuilt hot window
+            await conversation_cache.rebuild(redis_client, user_id, avatar_id, messages, total)
+            messages = messages[-limit:]
+        next_cursor = before + limit if total > before + limit else None
 
-    return {"avatar_id": avatar_id, "messages": messages}
+    return {"avatar_id": avatar_id, "messages": messages, "cursor": next_cursor}
 
 # Send Message
 @router.post("/avatars/message")
-async def post_message(msg: Message, current_user=Depends(get_current_user)):
+async def post_message(msg: Message, background_tasks: BackgroundTasks, current_user=Depends(get_current_user)):
+    message = {"role": msg.role, "content": msg.content}
+
+    user_id = str(current_user["id"])
+    avatar_id = await require_avatar(msg.avatar_id, current_user["id"])
+    # Persist to MongoDB (directly or via the write-behind queue, per MESSAGE_PERSISTENCE)
+    await conversation_writer.persist(avatar_id, user_id, message)
+
     redis_client = await get_redis_client()
-    redis_key = f"avatar:{msg.avatar_id}:messages"
+    await conversation_cache.append_message(redis_client, user_id, avatar_id, message)
+    background_tasks.add_task(retrieval.index_message, user_id, avatar_id, message)
+    return {"status": "message stored"}
 
-    cached = await redis_client.get(redis_key)
-    messages = json.loads(cached) if cached else []
+@router.get("/avatars/{avatar_id}/context")
+async def avatar_context(
+    avatar_id: UUID,
+    q: str = Query(..., min_length=1),
+    k: int = Query(settings.RETRIEVAL_TOP_K, ge=1, le=settings.RETRIEVAL_MAX_K),
+    current_user=Depends(get_current_user)
+):
+    # Top-k snippets from the avatar's messages and documents, instead of the whole history
+    avatar_id = await require_avatar(avatar_id, current_user["id"])
+    results = await retrieval.search(str(current_user["id"]), avatar_id, q, k)
+    return {"avatar_id": avatar_id, "query": q, "results": results}
+
+@router.post("/avatars/{avatar_id}/import")
+async def import_conversation(
+    avatar_id: UUID,
+    request: Request,
+    format: str = Query("ndjson", description="ndjson or whatsapp"),
+    avatar_name: str | None = Query(None, description="WhatsApp sender whose messages become the avatar's"),
+    import_id: str | None = Query(None, regex=r"^[A-Za-z0-9_-]{1,64}$", description="Poll progress at /avatars/imports/{import_id}"),
+    index: bool = Query(False, description="Also add the messages to the avatar's retrieval index"),
+    current_user=Depends(get_current_user)
+):
+    # Streams the request body (optionally Content-Encoding: gzip) straight into MongoDB
+    if db.mongo_db is None:
+        raise HTTPException(status_code=503, detail="MongoDB is not available.")
+    user_id = str(current_user["id"])
+    avatar_id = await require_avatar(avatar_id, current_user["id"])
+    import_id = import_id or uuid4().hex
+    redis_client = await get_redis_client()
 
-    messages.append({"role": msg.role, "content": msg.content})
-    await redis_client.set(redis_key, json.dumps(messages))
+    async def report(progress: dict):
+        if redis_client:
+            key = conversation_import.status_key(user_id, import_id)
+            await redis_client.set(key, json.dumps({"import_id": import_id, **progress}), ex=settings.IMPORT_STATUS_TTL)
 
-    # Persist to MongoDB
-    collection = db.mongo_db["avatar_conversations"]
-    await collection.update_one(
-        {"avatar_id": msg.avatar_id, "user_id": str(current_user["id"])},
-        {"$set": {"last_updated": datetime.utcnow()}, "$push": {"messages": {"role": msg.role, "content": msg.content}}},
-        upsert=True
-    )
-    return {"status": "message stored"}
+    chunks = request.stream()
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        chunks = conversation_import.gunzip(chunks)
+    job = conversation_import.ConversationImport(user_id, avatar_id, index, on_progress=report)
+    try:
+        progress = await job.run(chunks, format, avatar_name)
+    except conversation_import.ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except zlib.error:
+        raise HTTPException(status_code=400, detail={"error": "Invalid gzip body.", "import_id": import_id, **job.progress})
+    return {"import_id": import_id, **progress}
+
+@router.get("/avatars/imports/{import_id}")
+async def import_status(import_id: str, current_user=Depends(get_current_user)):
+    redis_client = await get_redis_client()
+    status = await redis_client.get(conversation_import.status_key(current_user["id"], import_id)) if redis_client else None
+    if status is None:
+        raise HTTPException(status_code=404, detail="Import not found.")
+    return json.loads(status)
 
 @router.get("/db/health")
 async def health():
+    # Served from the background prober's last results (app.db.health); no round trips here
     metrics.health_requests.inc()
-    logger.info(f"[health] Database instance id: {id(db)}, pool={db.postgres_pool}, mongo={db.mongo_client}")
-
-    postgres_ok = False
-    if db.postgres_pool:
-        logger.info("Postgres pool is initialized, attempting test query")
-        try:
-            async with db.postgres_pool.acquire() as conn:
-                result = await conn.execute("SELECT 1")
-                logger.info(f"Postgres test query result: {result}")
-                postgres_ok = True
-        except Exception as e:
-            logger.error(f"PostgreSQL health check failed: {type(e).__name__}: {e}")
-    else:
-        logger.error("Postgres pool is None")
-    # Check MongoDB connection
-    mongo_ok = False
-    if db.mongo_client is not None and db.mongo_db is not None:
-        try:
-            await db.mongo_client.admin.command("ping")
-            mongo_ok = True
-        except Exception as e:
-            logger.error(f"MongoDB health check failed: {e}")
-    
-    # Check Redis connection
-    redis_ok = False
-    redis_client = await get_redis_client()
-    if redis_client:
-        try:
-            await redis_client.ping()
-            redis_ok = True
-        except Exception as e:
-            logger.error(f"Redis health check failed: {e}")
-    else:
-        logger.error("Redis client not initialized yet")
-
-    metrics.db_connection_status.labels(database="redis").set(1 if redis_ok else 0)
-
-    # Update metrics
-    metrics.db_connection_status.labels(database="postgres").set(1 if postgres_ok else 0)
-    metrics.db_connection_status.labels(database="mongodb").set(1 if mongo_ok else 0)
-    metrics.db_connection_status.labels(database="redis").set(1 if redis_ok else 0)
-    
-    status = "healthy" if postgres_ok and mongo_ok and redis_ok else "degraded"
-    
+    checks = dependency_health.snapshot()
     return {
-        "status": status,
-        "postgres": postgres_ok,
-        "mongodb": mongo_ok,
-        "redis": redis_ok
-    }
\ No newline at end of file
+        "status": "healthy" if dependency_health.is_ready(checks) else "degraded",
+        "postgres": checks["postgres"]["ok"],
+        "mongodb": checks["mongodb"]["ok"],
+        "redis": checks["redis"]["ok"],
+        "checks": checks,
+    }
@@ -1,20 +1,161 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from app.db.database import db
+import re
+from urllib.parse import quote
+from uuid import UUID
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Form, HTTPException, Depends, Header, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.service.auth import get_current_user, require_avatar
+from app.service import media_store, retrieval, transcription_jobs
+from app.service.model_registry import model_registry
+from app.core.config import settings
+from app.core.redis_instance import get_redis_client
 router = APIRouter()
 
+TEXT_CONTENT_TYPES = ("text/", "application/json", "application/xml")
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def _parse_range(range_header: str, size: int):
+    # Single byte range only ("bytes=start-end", "bytes=start-", "bytes=-suffix")
+    match = _RANGE_RE.match(range_header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        raise HTTPException(status_code=416, detail="Invalid range.", headers={"Content-Range": f"bytes */{size}"})
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable.", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+def _content_disposition(filename: str) -> str:
+    # The name is user-controlled: a quoted ASCII fallback with anything unsafe replaced, plus the
+    # exact name as RFC 5987 percent-encoded UTF-8 for clients that understand filename*
+    fallback = "".join(c if " " <= c <= "~" and c not in '"\\;' else "_" for c in filename) or "download"
+    return f"inline; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
 @router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    avatar_id: UUID = Form(...),
+    transcribe: bool = Form(False),
+    current_user=Depends(get_current_user)
+):
+    avatar_id = await require_avatar(avatar_id, current_user["id"])
     try:
-        # Read the file content
-        content = await file.read()
-        
-        # Save the file to MongoDB
-        result = await db.mongo_db.media.insert_one({ 
-            "filename": file.filename, 
-            "content": file.content_type, 
-            "data": content}) 
-        
-        # Return the ID of the inserted document
-        return {"id": str(result.inserted_id)}
+        # Hash the upload, store its bytes only if this content is new, and return the ID of the reference
+        saved = await media_store.save_upload(file, str(current_user["id"]), avatar_id)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+    if (file.content_type or "").startswith(TEXT_CONTENT_TYPES) and saved["length"] <= settings.RETRIEVAL_MAX_DOCUMENT_BYTES:
+        background_tasks.add_task(_index_upload, saved["id"], str(current_user["id"]), avatar_id, file.filename)
+    if transcribe and (file.content_type or "").startswith(transcription_jobs.AUDIO_CONTENT_TYPES):
+        saved["transcription"] = await _enqueue_transcription(saved["id"], str(current_user["id"]), model_registry.resolve())
+    return saved
+
+async def _index_upload(ref_id: str, user_id: str, avatar_id: str, filename: str):
+    # Text documents feed the avatar's retrieval index once the upload response has been sent
+    doc = await media_store.find_file(ref_id, user_id)
+    if doc is None or doc["length"] == 0:
+        return
+    data = b"".join([chunk async for chunk in media_store.stream_range(doc["blob_id"], 0, doc["length"] - 1)])
+    await retrieval.index_document(user_id, avatar_id, filename, data.decode("utf-8", errors="replace"), ref_id)
+
+async def _enqueue_transcription(media_id: str, user_id: str, model: str, force: bool = False) -> dict:
+    redis_client = await get_redis_client()
+    if redis_client is None:
+        raise HTTPException(status_code=503, detail="Job queue is not available.")
+    job = await transcription_jobs.enqueue(redis_client, user_id, media_id, model, force)
+    await media_store.set_transcription(media_id, job_id=job["job_id"], model=model, status="queued", error=None)
+    return job
+
+@router.post("/{file_id}/transcribe", status_code=202)
+async def transcribe_file(
+    file_id: str,
+    model: str | None = Query(None),
+    force: bool = Query(False, description="Transcribe again even if this content already has a transcript"),
+    current_user=Depends(get_current_user)
+):
+    # Queues an offline job; poll /media/transcriptions/{job_id} or follow its /events stream
+    user_id = str(current_user["id"])
+    doc = await media_store.find_file(file_id, user_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="File not found.")
+    if not (doc.get("content_type") or "").startswith(transcription_jobs.AUDIO_CONTENT_TYPES):
+        raise HTTPException(status_code=415, detail="Only audio and video files can be transcribed.")
+    try:
+        model = model_registry.resolve(model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    current = doc.get("transcription") or {}
+    if not force and current.get("status") in ("queued", "running") and current.get("model") == model:
+        redis_client = await get_redis_client()
+        job = await transcription_jobs.get_job(redis_client, current["job_id"]) if redis_client else None
+        if job is not None and job["status"] not in transcription_jobs.TERMINAL_STATUSES:
+            return job  # already in progress
+    return await _enqueue_transcription(file_id, user_id, model, force)
+
+async def _get_own_job(job_id: str, user_id: str):
+    redis_client = await get_redis_client()
+    job = await transcription_jobs.get_job(redis_client, job_id) if redis_client else None
+    if job is None or job["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Transcription job not found.")
+    return redis_client, job
+
+@router.get("/transcriptions/{job_id}")
+async def transcription_status(job_id: str, current_user=Depends(get_current_user)):
+    _, job = await _get_own_job(job_id, str(current_user["id"]))
+    return job
+
+@router.get("/transcriptions/{job_id}/events")
+async def transcription_events(job_id: str, current_user=Depends(get_current_user)):
+    # Server-sent events: one "data:" line with the full job state per change, until it finishes
+    redis_client, _ = await _get_own_job(job_id, str(current_user["id"]))
+    if not transcription_jobs.accepting_followers():
+        raise HTTPException(status_code=503, detail="Too many open event streams; poll the job instead.", headers={"Retry-After": "5"})
+    return StreamingResponse(
+        transcription_jobs.follow(redis_client, job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/{file_id}/transcript")
+async def get_transcript(file_id: str, current_user=Depends(get_current_user)):
+    doc = await media_store.find_file(file_id, str(current_user["id"]))
+    if doc is None:
+        raise HTTPException(status_code=404, detail="File not found.")
+    if "transcript" not in doc:
+        return JSONResponse(status_code=404, content={"detail": "No transcript yet.", "transcription": doc.get("transcription")})
+    return {"id": file_id, "transcription": doc.get("transcription"), "transcript": doc["transcript"]}
+
+@router.get("/{file_id}")
+async def download_file(file_id: str, range_header: str | None = Header(None, alias="Range"), current_user=Depends(get_current_user)):
+    doc = await media_store.find_file(file_id, str(current_user["id"]))
+    if doc is None:
+        raise HTTPException(status_code=404, detail="File not found.")
+    size = doc["length"]
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": _content_disposition(doc["filename"] or ""),
+    }
+    media_type = doc.get("content_type") or "application/octet-stream"
+
+    if range_header and size > 0:
+        start, end = _parse_range(range_header, size)
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(media_store.stream_range(doc["blob_id"], start, end), status_code=206, media_type=media_type, headers=headers)
+
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(media_store.stream_range(doc["blob_id"], 0, size - 1), media_type=media_type, headers=headers)
+
+
+@router.delete("/{file_id}")
+async def delete_file(file_id: str, current_user=Depends(get_current_user)):
+    # Drops this reference; the blob itself goes once no avatar references it
+    if not await media_store.delete_ref(file_id, str(current_user["id"])):
+        raise HTTPException(status_code=404, detail="File not found.")
+    return {"status": "deleted"}
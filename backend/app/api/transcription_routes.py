@@ -1,40 +1,133 @@
 from app.core.config import settings
 from fastapi import APIRouter
-from fastapi import WebSocket
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
 from app.core.monitoring import metrics
-from app.service.transcription import transcribe_audio
+from app.service.transcription import transcribe_audio, WHISPER_WINDOW_SECONDS
+from app.service.flow_control import AudioInlet, SessionLimiter
+from app.service.codecs import resolve_codec
+from app.service.streaming import StreamingSegmenter
+from app.service.inference import InferenceBusyError, InferenceTimeoutError
+from app.service.model_registry import model_registry
 from app.core.config import logger
 from app.core.ngrok_instance import get_ngrok_client
+import asyncio
 import json
 
 router = APIRouter()
+# Per-process admission control for transcription sessions
+session_limiter = SessionLimiter()
+# receive (waiting for buffered audio)/buffer/send are timed here; decode/inference in app.service.transcription
+STAGE = metrics.transcription_stage_seconds
 
 @router.get("/websocket-url")
 async def get_websocket_url():
     metrics.websocket_url_requests.inc()
-    ngrok_state = await get_ngrok_client()
-    logger.info(f"Websocket URL requested: {ngrok_state + '/transcription/ws'}")
-    return {"websocket_url": ngrok_state + '/transcription/ws' or f"ws://localhost:{settings.WEBSOCKET_PORT} + '/transcription/ws'"}
+    ngrok_url = await get_ngrok_client()
+    websocket_url = (ngrok_url or f"ws://localhost:{settings.WEBSOCKET_PORT}") + "/transcription/ws"
+    logger.info(f"Websocket URL requested: {websocket_url}")
+    return {"websocket_url": websocket_url}
+
+@router.get("/models")
+async def get_models():
+    return {
+        "ready": model_registry.ready,
+        "default": settings.WHISPER_DEFAULT_MODEL,
+        "available": settings.WHISPER_MODELS,
+        "loaded": model_registry.stats,
+    }
+
+@router.get("/ready")
+async def transcription_ready():
+    # Readiness probe: stays 503 until the startup warmup has loaded the Whisper models
+    status_code = 200 if model_registry.ready else 503
+    return JSONResponse(status_code=status_code, content={"ready": model_registry.ready})
 
 @router.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, mode: str = settings.TRANSCRIPTION_MODE, model: str = None, policy: str = None, codec: str = None):
     await websocket.accept()
     metrics.active_websockets.inc()
+    admitted = False
     try:
-        buffer = bytearray()
-        while True:
-            data = await websocket.receive_bytes()
-            buffer.extend(data)
-            chunk_size = settings.SAMPLE_RATE * settings.CHUNK_DURATION * 2  # 16-bit mono
-            while len(buffer) >= chunk_size:
-                chunk = buffer[:chunk_size]
-                buffer = buffer[chunk_size:]
-                result = await transcribe_audio(chunk)
-                await websocket.send_text(json.dumps(result))
-                metrics.transcriptions_processed.inc()
+        model_name = model_registry.resolve(model)
+        codec = resolve_codec(codec)
+        # Chunk mode needs whole CHUNK_DURATION blocks to fit, or a full buffer could never drain
+        buffer_seconds = max(settings.WS_BUFFER_SECONDS, 2 * settings.CHUNK_DURATION) if mode == "chunk" else None
+        inlet = AudioInlet(websocket, policy, buffer_seconds, codec)
+        admitted = await session_limiter.acquire(
+            on_queued=lambda position: websocket.send_text(json.dumps({"type": "queued", "position": position}))
+        )
+        if not admitted:
+            await websocket.send_text(json.dumps({"type": "busy", "error": "Transcription capacity is full; retry later"}))
+            await websocket.close(code=1013)  # Try Again Later
+            return
+        await websocket.send_text(json.dumps({"type": "ready", "codec": codec, "sample_rate": settings.SAMPLE_RATE}))
+        receiver = asyncio.create_task(inlet.receive_loop())
+        try:
+            if mode == "chunk":
+                await _chunked_session(websocket, inlet, model_name)
+            else:
+                await _streaming_session(websocket, inlet, model_name)
+        finally:
+            receiver.cancel()
+    except WebSocketDisconnect:
+        logger.info("WebSocket client disconnected")
+    except ValueError as e:
+        await websocket.send_text(json.dumps({"type": "error", "error": str(e)}))
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
         metrics.websocket_errors.inc()
     finally:
-        await websocket.close()
-        metrics.active_websockets.dec()
\ No newline at end of file
+        if admitted:
+            await session_limiter.release()
+        try:
+            await websocket.close()
+        except RuntimeError:
+            pass  # already closed by the client
+        metrics.active_websockets.dec()
+
+async def _chunked_session(websocket: WebSocket, inlet: AudioInlet, model_name: str):
+    # Legacy mode: fixed CHUNK_DURATION blocks, one result per block. When coalescing under
+    # pressure, queued blocks are merged into one decode of up to Whisper's 30 s window.
+    chunk_size = settings.SAMPLE_RATE * settings.CHUNK_DURATION * 2  # 16-bit mono
+    max_merge = max(1, WHISPER_WINDOW_SECONDS // settings.CHUNK_DURATION)
+    while True:
+        merge = max_merge if inlet.policy == "coalesce" and inlet.pressured else 1
+        with STAGE.labels(stage="receive").time():
+            chunk = await inlet.get(chunk_size, chunk_size * merge, multiple=chunk_size)
+        await _send_segment(websocket, "final", chunk, model_name)
+
+async def _streaming_session(websocket: WebSocket, inlet: AudioInlet, model_name: str):
+    # VAD mode: silence is skipped, partials are sent while speaking, finals at pauses
+    segmenter = StreamingSegmenter()
+    skipped_reported = 0.0
+    while True:
+        with STAGE.labels(stage="receive").time():
+            data = await inlet.get()
+        with STAGE.labels(stage="buffer").time():
+            events = segmenter.feed(data)
+        if inlet.policy == "coalesce" and inlet.pressured:
+            events = [event for event in events if event[0] == "final"]  # behind: skip partials
+        for kind, segment in events:
+            await _send_segment(websocket, kind, segment, model_name)
+        metrics.vad_skipped_seconds.inc(segmenter.skipped_seconds - skipped_reported)
+        skipped_reported = segmenter.skipped_seconds
+
+async def _send_segment(websocket: WebSocket, kind: str, segment: bytes, model_name: str):
+    try:
+        result = await transcribe_audio(segment, model_name)
+    except InferenceBusyError as e:
+        if kind == "partial":
+            return  # partials are best effort; the next one or the final supersedes it
+        await websocket.send_text(json.dumps({"type": "busy", "error": str(e)}))
+        return
+    except InferenceTimeoutError as e:
+        await websocket.send_text(json.dumps({"type": "error", "error": str(e)}))
+        return
+    result["type"] = kind
+    with STAGE.labels(stage="send").time():
+        await websocket.send_text(json.dumps(result))
+    if kind == "final":
+        metrics.transcriptions_processed.inc()
+    else:
+        metrics.transcription_partials.inc()
@@ -1,5 +1,4 @@
 from pydantic import BaseSettings
-import torch
 import logging
 
 # Logging config
@@ -17,21 +16,62 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str
     POSTGRES_HOST: str  # no default
     POSTGRES_PORT: int = 5432
+    POSTGRES_POOL_MIN: int = 1
+    POSTGRES_POOL_MAX: int = 10
+    POSTGRES_POOL_MAX_IDLE_SECONDS: float = 300.0
+    POSTGRES_POOL_ADAPTIVE: bool = False  # grow/shrink the pool limit from observed acquire wait
+    POSTGRES_POOL_ADAPTIVE_MAX: int = 40
+    POSTGRES_POOL_TARGET_WAIT_MS: float = 5.0
 
     # MongoDB
     MONGO_DB: str
     MONGO_HOST: str
     MONGO_PORT: int = 27017
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_MAX_POOL_SIZE: int = 100
+
+    # Media (GridFS)
+    MEDIA_BUCKET: str = "media_fs"
+    MEDIA_CHUNK_SIZE: int = 255 * 1024  # GridFS chunk size, also the upload read size
 
     # Redis
     REDIS_HOST: str
     REDIS_PORT: int = 6379
     REDIS_PASSWORD: str
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: float = 5.0
+
+    # Pool metrics sampling / adaptive sizing interval
+    POOL_METRICS_INTERVAL: float = 5.0
+
+    # Startup connections (retried with exponential backoff and jitter) and dependency probing
+    STARTUP_CONNECT_ATTEMPTS: int = 5
+    STARTUP_BACKOFF_SECONDS: float = 0.5  # doubles per attempt
+    STARTUP_BACKOFF_MAX_SECONDS: float = 8.0
+    HEALTH_PROBE_INTERVAL: float = 5.0
+    HEALTH_PROBE_TIMEOUT: float = 2.0
+
+    # Conversation cache
+    CONVERSATION_HOT_SIZE: int = 200  # messages kept per conversation in the Redis list
+    CONVERSATION_HOT_MAX_BYTES: int = 256 * 1024  # encoded JSON per cached conversation
+    CONVERSATION_CACHE_TTL: int = 3600  # seconds; sliding, refreshed on read and append
+    CONVERSATION_CACHE_STATS_INTERVAL: float = 60.0
+    CONVERSATION_PAGE_SIZE: int = 50
+    CONVERSATION_BUCKET_SIZE: int = 200  # messages per MongoDB bucket document
+    CONVERSATION_BUCKET_MAX_BYTES: int = 8 * 1024 * 1024  # estimated BSON per bucket part, well under 16 MB
+
+    # Message persistence to MongoDB: "sync", "async" (write-behind) or "hybrid" (group commit)
+    MESSAGE_PERSISTENCE: str = "async"
+    WRITE_BEHIND_BATCH_SIZE: int = 500
+    WRITE_BEHIND_INTERVAL_MS: int = 200
+    WRITE_BEHIND_HYBRID_TIMEOUT: float = 2.0
 
     # Ngrok / WebSocket
     FASTAPI_PORT: int = 8765
     WEBSOCKET_PORT: int = 8765
     NGROK_AUTH_TOKEN: str
+    NGROK_ENABLED: bool = True  # set false for local runs without a public tunnel
+    LEADER_LOCK_TTL: float = 15.0  # seconds; the tunnel leader renews its Redis lease every TTL/3
     REGISTRY_ENDPOINT: str
 
     # JWT
@@ -39,12 +79,101 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
 
+    # Avatar listing (keyset pages, cached per user in Redis)
+    AVATAR_PAGE_SIZE: int = 50
+    AVATAR_MAX_PAGE_SIZE: int = 200
+    AVATAR_LIST_CACHE_TTL: int = 300
+    AVATAR_OWNER_CACHE_SIZE: int = 10000  # confirmed (user, avatar) pairs kept per process
+    AVATAR_OWNER_CACHE_TTL: float = 300.0
+
+    # Bulk conversation import (POST /avatars/{avatar_id}/import, app.db.import_conversations)
+    IMPORT_BATCH_SIZE: int = 5000  # messages validated and written per bulk_write
+    IMPORT_MAX_INFLIGHT: int = 4  # batches being written while the next one is parsed
+    IMPORT_WRITE_ATTEMPTS: int = 3  # failed bucket updates are retried with the batch's reserved seqs
+    IMPORT_MAX_LINE_BYTES: int = 1024 * 1024
+    IMPORT_MAX_CONTENT_CHARS: int = 100_000
+    IMPORT_MAX_ERRORS: int = 20  # invalid lines listed in the report; all of them are counted
+    IMPORT_STATUS_TTL: int = 86400
+
+    # Offline transcription jobs (Redis stream consumed by app.service.transcription_worker processes)
+    TRANSCRIPTION_JOB_CONCURRENCY: int = 1  # jobs per worker process
+    TRANSCRIPTION_JOB_THREADS: int = 2  # inference threads per worker process, each with its own model copy
+    TRANSCRIPTION_BATCH_SIZE: int = 8  # segments per Whisper forward pass
+    TRANSCRIPTION_SEGMENT_SECONDS: float = 30.0  # capped at Whisper's 30 s window
+    TRANSCRIPTION_CUT_SEARCH_SECONDS: float = 5.0  # how far back a segment cut may move to find a pause
+    TRANSCRIPTION_SEGMENT_TIMEOUT: float = 600.0
+    TRANSCRIPTION_JOB_MAX_ATTEMPTS: int = 3
+    TRANSCRIPTION_JOB_CLAIM_IDLE_SECONDS: float = 120.0  # a job without a heartbeat this long is reclaimed
+    TRANSCRIPTION_JOB_TTL: int = 7 * 86400
+    TRANSCRIPTION_STREAM_MAXLEN: int = 100_000
+    TRANSCRIPTION_EVENTS_KEEPALIVE: float = 15.0
+    TRANSCRIPTION_EVENTS_MAX_FOLLOWERS: int = 500  # open event streams per process; they share one Redis subscription
+
+    # Retrieval index (per user/avatar, over messages and uploaded text documents)
+    RETRIEVAL_INDEX_DIR: str = "data/retrieval"
+    RETRIEVAL_EMBEDDING_MODEL: str = ""  # sentence-transformers model run on CPU; empty = hashing embedder
+    RETRIEVAL_HASH_DIM: int = 512
+    RETRIEVAL_VECTOR_WEIGHT: float = 0.6  # blend of cosine similarity vs normalised BM25
+    RETRIEVAL_TOP_K: int = 5
+    RETRIEVAL_MAX_K: int = 50
+    RETRIEVAL_PASSAGE_CHARS: int = 800
+    RETRIEVAL_MAX_DOCUMENT_BYTES: int = 2 * 1024 * 1024
+    RETRIEVAL_WORKERS: int = 2
+    RETRIEVAL_OPEN_INDEXES: int = 256
+    RETRIEVAL_INDEX_IDLE_SECONDS: float = 600.0
+
+    # Password hashing
+    BCRYPT_ROUNDS: int = 12  # changing it rehashes users on their next login
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE_SIZE: int = 32
+
+    # Auth cache (in-process LRU in front of Redis)
+    AUTH_LOCAL_CACHE_SIZE: int = 10000
+    AUTH_LOCAL_CACHE_TTL: float = 30.0
+    AUTH_PROFILE_CACHE_TTL: int = 300
+
     # Torch
-    DEVICE: str = "cuda" if torch.cuda.is_available() else "cpu"
+    DEVICE: str = "auto"  # "auto" picks cuda when available, resolved on first model load
+
+    # Whisper models
+    WHISPER_MODELS: list[str] = ["tiny", "base", "small"]
+    WHISPER_DEFAULT_MODEL: str = "base"
+    WHISPER_WARMUP_MODELS: list[str] = ["base"]
 
     # Transcription
     SAMPLE_RATE = 16000
     CHUNK_DURATION = 5
+
+    # Streaming transcription (VAD segmentation + partial results)
+    TRANSCRIPTION_MODE: str = "stream"  # "stream" or "chunk"
+    VAD_FRAME_MS: int = 30
+    VAD_ENERGY_THRESHOLD: float = 0.01
+    VAD_NOISE_RATIO: float = 3.0
+    VAD_PREROLL_MS: int = 210
+    VAD_END_SILENCE_MS: int = 600
+    VAD_MIN_SPEECH_MS: int = 240
+    PARTIAL_INTERVAL_MS: int = 600
+    MAX_SEGMENT_DURATION: int = 15
+
+    # Websocket codecs ("pcm16", or "webm-opus" decoded by ffmpeg)
+    FFMPEG_BINARY: str = "ffmpeg"
+
+    # Websocket flow control and admission
+    WS_BUFFER_SECONDS: float = 10.0  # audio buffered per connection
+    WS_OVERLOAD_POLICY: str = "slow_down"  # "drop_oldest", "coalesce" or "slow_down"
+    WS_HIGH_WATERMARK: float = 0.75  # fraction of the buffer
+    WS_LOW_WATERMARK: float = 0.25
+    # Admission is per worker process, matching its own inference executor: N workers admit N times this
+    WS_MAX_SESSIONS_PER_WORKER: int = 0  # 0 = INFERENCE_WORKERS * BATCH_MAX_SIZE
+    WS_ADMISSION_QUEUE: int = 8  # sessions allowed to wait for a slot, per worker
+    WS_ADMISSION_TIMEOUT: float = 10.0
+
+    # Inference executor
+    INFERENCE_WORKERS: int = 1  # each worker thread holds its own model copy
+    INFERENCE_QUEUE_SIZE: int = 4
+    INFERENCE_TIMEOUT: float = 30.0
+    BATCH_MAX_SIZE: int = 8  # 1 disables cross-connection batching
+    BATCH_WAIT_MS: int = 50
     
     # GITHUB
     GITHUB_TOKEN: str
@@ -0,0 +1,53 @@
+import os
+import socket
+import uuid
+from app.core.redis_instance import get_redis_client
+
+# Redis lease used to elect one process for once-per-deployment work (ngrok tunnel, gist update)
+# when several uvicorn/gunicorn workers or hosts run the app. The lease is SET NX PX with a
+# per-process token and must be renewed before it expires; renew/release only act on our own
+# token, so a process that stalled past its lease cannot clobber the new leader.
+
+_RENEW = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaderLock:
+    def __init__(self, name: str, ttl: float):
+        self.key = f"leader:{name}"
+        self.ttl_ms = int(ttl * 1000)
+        self.is_leader = False
+
+    async def acquire(self) -> bool:
+        redis_client = await get_redis_client()
+        self.is_leader = bool(await redis_client.set(self.key, WORKER_ID, nx=True, px=self.ttl_ms))
+        return self.is_leader
+
+    async def renew(self) -> bool:
+        redis_client = await get_redis_client()
+        self.is_leader = bool(await redis_client.eval(_RENEW, 1, self.key, WORKER_ID, self.ttl_ms))
+        return self.is_leader
+
+    async def release(self):
+        if not self.is_leader:
+            return
+        redis_client = await get_redis_client()
+        await redis_client.eval(_RELEASE, 1, self.key, WORKER_ID)
+        self.is_leader = False
+
+    async def holder(self) -> str | None:
+        redis_client = await get_redis_client()
+        return await redis_client.get(self.key)
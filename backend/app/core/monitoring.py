@@ -1,17 +1,25 @@
-from prometheus_client import Counter, Gauge, REGISTRY
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
 
-def get_or_create_metric(name, description, metric_type="counter", labelnames="None"):
+def get_or_create_metric(name, description, metric_type="counter", labelnames="None", buckets=Histogram.DEFAULT_BUCKETS):
     registry = REGISTRY._names_to_collectors
     labelnames = labelnames or []
     if name in registry:
         return registry[name]
     if metric_type == "counter":
-        return Counter(name, description)
+        if labelnames == "None":
+            return Counter(name, description)
+        else:
+            return Counter(name, description, labelnames=labelnames)
     elif metric_type == "gauge":
         if labelnames == "None":
             return Gauge(name, description)
         else:
             return Gauge(name, description, labelnames=labelnames)
+    elif metric_type == "histogram":
+        if labelnames == "None":
+            return Histogram(name, description, buckets=buckets)
+        else:
+            return Histogram(name, description, labelnames=labelnames, buckets=buckets)
     else:
         raise ValueError(f"Unsupported metric type: {metric_type}")
 
@@ -26,6 +34,55 @@ websocket_errors = get_or_create_metric("websocket_errors_total", "Total WebSock
 db_connection_status = get_or_create_metric("db_connection_status", "Database connection status (1=up, 0=down)", "gauge",  labelnames=["database"])
 github_gist_update_errors = get_or_create_metric("github_gist_update_errors_total", "Total Github Gist update errors")
 github_gist_url_updated = get_or_create_metric("github_gist_url_updated", "Github Gist URL updated with Ngrok URL (1=success, 0=not_set)", "gauge", labelnames=["database"])
+transcription_partials = get_or_create_metric("transcription_partials_total", "Total interim (partial) transcriptions sent")
+vad_skipped_seconds = get_or_create_metric("vad_skipped_audio_seconds_total", "Seconds of silent audio skipped by VAD before inference")
+inference_queue_depth = get_or_create_metric("inference_queue_depth", "Inference jobs waiting for a worker", "gauge")
+inference_queue_wait = get_or_create_metric("inference_queue_wait_seconds", "Time inference jobs wait for a worker", "histogram", buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+inference_rejected = get_or_create_metric("inference_rejected_total", "Inference jobs rejected because the queue was full")
+inference_timeouts = get_or_create_metric("inference_timeouts_total", "Inference jobs that exceeded the per-job timeout")
+whisper_model_load_seconds = get_or_create_metric("whisper_model_load_seconds", "Time taken by the last load of a Whisper model", "gauge", labelnames=["model"])
+whisper_model_memory_bytes = get_or_create_metric("whisper_model_memory_bytes", "Parameter memory held by loaded Whisper models", "gauge", labelnames=["model"])
+whisper_models_ready = get_or_create_metric("whisper_models_ready", "Whisper warmup finished (1=ready, 0=warming up)", "gauge")
+inference_batch_size = get_or_create_metric("inference_batch_size", "Chunks decoded per Whisper batch", "histogram", buckets=(1, 2, 4, 8, 16, 32))
+write_behind_queue_length = get_or_create_metric("write_behind_queue_length", "Chat messages queued in Redis awaiting a MongoDB flush", "gauge")
+write_behind_batch_size = get_or_create_metric("write_behind_batch_size", "Messages written per MongoDB bulk_write", "histogram", buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000))
+write_behind_lag = get_or_create_metric("write_behind_lag_seconds", "Age of the oldest message in the last flushed batch", "gauge")
+write_behind_errors = get_or_create_metric("write_behind_errors_total", "Failed write-behind flushes")
+auth_cache_hits = get_or_create_metric("auth_cache_hits_total", "Authenticated requests served from the user cache", labelnames=["tier"])
+auth_cache_misses = get_or_create_metric("auth_cache_misses_total", "Authenticated requests that fell through to Postgres")
+password_hash_queue_wait = get_or_create_metric("password_hash_queue_wait_seconds", "Time password hash jobs wait for a worker", "histogram", buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+password_hash_rejected = get_or_create_metric("password_hash_rejected_total", "Password hash jobs rejected because the queue was full")
+password_rehashes = get_or_create_metric("password_rehashes_total", "Stored password hashes upgraded to the configured cost at login")
+db_pool_size = get_or_create_metric("db_pool_size", "Open connections in the pool", "gauge", labelnames=["database"])
+db_pool_in_use = get_or_create_metric("db_pool_in_use", "Connections currently checked out of the pool", "gauge", labelnames=["database"])
+db_pool_limit = get_or_create_metric("db_pool_limit", "Current maximum connections for the pool", "gauge", labelnames=["database"])
+db_pool_acquire_seconds = get_or_create_metric("db_pool_acquire_seconds", "Time spent waiting to acquire a pooled connection", "histogram", labelnames=["database"], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+sql_statement_seconds = get_or_create_metric("sql_statement_seconds", "Latency of named SQL statements", "histogram", labelnames=["statement"], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+# Latency. Labels are bounded: HTTP routes use the route template (unmatched paths collapse into
+# one label) and status class, stages are a fixed set, models come from WHISPER_MODELS
+http_request_duration = get_or_create_metric("http_request_duration_seconds", "HTTP request latency by route template", "histogram", labelnames=["method", "route", "status"], buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+transcription_stage_seconds = get_or_create_metric("transcription_stage_seconds", "Time spent per transcription stage (receive, buffer, decode, inference, send)", "histogram", labelnames=["stage"], buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+transcription_rtf = get_or_create_metric("transcription_real_time_factor", "Inference time divided by audio duration for the last segment (<1 is faster than real time)", "gauge", labelnames=["model"])
+tunnel_leader = get_or_create_metric("tunnel_leader", "This worker holds the tunnel lease and owns the ngrok URL (1=leader)", "gauge")
+conversation_cache_hits = get_or_create_metric("conversation_cache_hits_total", "Conversation page reads served from the Redis hot window")
+conversation_cache_misses = get_or_create_metric("conversation_cache_misses_total", "Conversation page reads that fell through to MongoDB")
+conversation_cache_conversations = get_or_create_metric("conversation_cache_conversations", "Conversations currently cached in Redis", "gauge")
+conversation_cache_bytes = get_or_create_metric("conversation_cache_bytes", "Encoded message bytes held in cached conversation windows", "gauge")
+ws_audio_dropped_seconds = get_or_create_metric("ws_audio_dropped_seconds_total", "Buffered websocket audio overwritten by the drop_oldest policy")
+ws_slow_down_signals = get_or_create_metric("ws_slow_down_signals_total", "slow_down messages sent to websocket clients")
+ws_admission_rejected = get_or_create_metric("ws_admission_rejected_total", "Transcription sessions rejected because capacity was full")
+ws_admission_waiting = get_or_create_metric("ws_admission_waiting", "Transcription sessions waiting for a free slot", "gauge")
+ws_received_bytes = get_or_create_metric("ws_received_bytes_total", "Audio bytes received on the transcription websocket", labelnames=["codec"])
+retrieval_query_seconds = get_or_create_metric("retrieval_query_seconds", "Latency of avatar context (top-k) queries", "histogram", buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+retrieval_snippets_indexed = get_or_create_metric("retrieval_snippets_indexed_total", "Snippets added to avatar retrieval indexes", labelnames=["source"])
+dependency_probe_seconds = get_or_create_metric("dependency_probe_seconds", "Latency of background health probes", "histogram", labelnames=["database"], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+conversation_import_messages = get_or_create_metric("conversation_import_messages_total", "Messages processed by bulk conversation imports", labelnames=["result"])
+conversation_import_batch_seconds = get_or_create_metric("conversation_import_batch_seconds", "Time to write one bulk import batch to MongoDB", "histogram", buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+transcription_jobs = get_or_create_metric("transcription_jobs_total", "Offline transcription job outcomes", labelnames=["status"])
+transcription_job_seconds = get_or_create_metric("transcription_job_seconds", "Wall time of completed offline transcription jobs", "histogram", buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 3600))
+transcription_job_audio_seconds = get_or_create_metric("transcription_job_audio_seconds_total", "Seconds of audio transcribed by offline jobs")
+transcription_job_segments = get_or_create_metric("transcription_job_segments_total", "Segments processed by offline transcription jobs")
+avatar_list_cache = get_or_create_metric("avatar_list_cache_requests_total", "Avatar list pages served from Redis (hit) or Postgres (miss)", labelnames=["result"])
 class Metrics:
     def __init__(self):
         self.health_requests = health_requests
@@ -38,5 +95,52 @@ class Metrics:
         self.db_connection_status = db_connection_status
         self.github_gist_update_errors = github_gist_update_errors
         self.github_gist_url_updated = github_gist_url_updated
+        self.transcription_partials = transcription_partials
+        self.vad_skipped_seconds = vad_skipped_seconds
+        self.inference_queue_depth = inference_queue_depth
+        self.inference_queue_wait = inference_queue_wait
+        self.inference_rejected = inference_rejected
+        self.inference_timeouts = inference_timeouts
+        self.inference_batch_size = inference_batch_size
+        self.whisper_model_load_seconds = whisper_model_load_seconds
+        self.whisper_model_memory_bytes = whisper_model_memory_bytes
+        self.whisper_models_ready = whisper_models_ready
+        self.write_behind_queue_length = write_behind_queue_length
+        self.write_behind_batch_size = write_behind_batch_size
+        self.write_behind_lag = write_behind_lag
+        self.write_behind_errors = write_behind_errors
+        self.auth_cache_hits = auth_cache_hits
+        self.auth_cache_misses = auth_cache_misses
+        self.password_hash_queue_wait = password_hash_queue_wait
+        self.password_hash_rejected = password_hash_rejected
+        self.password_rehashes = password_rehashes
+        self.db_pool_size = db_pool_size
+        self.db_pool_in_use = db_pool_in_use
+        self.db_pool_limit = db_pool_limit
+        self.db_pool_acquire_seconds = db_pool_acquire_seconds
+        self.sql_statement_seconds = sql_statement_seconds
+        self.http_request_duration = http_request_duration
+        self.transcription_stage_seconds = transcription_stage_seconds
+        self.transcription_rtf = transcription_rtf
+        self.tunnel_leader = tunnel_leader
+        self.conversation_cache_hits = conversation_cache_hits
+        self.conversation_cache_misses = conversation_cache_misses
+        self.conversation_cache_conversations = conversation_cache_conversations
+        self.conversation_cache_bytes = conversation_cache_bytes
+        self.ws_audio_dropped_seconds = ws_audio_dropped_seconds
+        self.ws_slow_down_signals = ws_slow_down_signals
+        self.ws_admission_rejected = ws_admission_rejected
+        self.ws_admission_waiting = ws_admission_waiting
+        self.ws_received_bytes = ws_received_bytes
+        self.retrieval_query_seconds = retrieval_query_seconds
+        self.retrieval_snippets_indexed = retrieval_snippets_indexed
+        self.avatar_list_cache = avatar_list_cache
+        self.dependency_probe_seconds = dependency_probe_seconds
+        self.conversation_import_messages = conversation_import_messages
+        self.conversation_import_batch_seconds = conversation_import_batch_seconds
+        self.transcription_jobs = transcription_jobs
+        self.transcription_job_seconds = transcription_job_seconds
+        self.transcription_job_audio_seconds = transcription_job_audio_seconds
+        self.transcription_job_segments = transcription_job_segments
 
 metrics = Metrics()
\ No newline at end of file
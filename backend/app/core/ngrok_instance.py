@@ -1,21 +1,41 @@
 from pyngrok import ngrok
 from app.core.config import settings, logger
 from app.core.monitoring import metrics
+from app.core.redis_instance import get_redis_client
+from app.core.leader import LeaderLock
 import asyncio
 import httpx
 import json 
 
+# One tunnel per deployment: only the process holding the "tunnel" lease opens ngrok and patches
+# the gist; it publishes the URL under NGROK_URL_KEY, where every other worker reads it. Followers
+# retry the lease each renewal interval, so a new leader takes over if the old one dies.
+# The published URL expires with the lease and is refreshed on every renewal, so a dead
+# leader's URL disappears instead of being served forever.
+NGROK_URL_KEY = "ngrok:url"
+
 _ngrok_tunnel = None
 _ngrok_url = None
 _ngrok_lock = asyncio.Lock()
+_tunnel_lease = LeaderLock("tunnel", settings.LEADER_LOCK_TTL)
+_election_task = None
 
 async def get_ngrok_client():
+    if not settings.NGROK_ENABLED:
+        return None
+    if not _tunnel_lease.is_leader:
+        redis_client = await get_redis_client()
+        return await redis_client.get(NGROK_URL_KEY)
+    return await _open_tunnel()
+
+async def _open_tunnel():
     global _ngrok_url, _ngrok_tunnel
     async with _ngrok_lock:
         if _ngrok_tunnel is None:
             try:
                 ngrok.set_auth_token(settings.NGROK_AUTH_TOKEN)
-                _ngrok_tunnel = ngrok.connect(settings.WEBSOCKET_PORT, "http", bind_tls=True)
+                # pyngrok blocks while it starts the agent; keep the event loop free meanwhile
+                _ngrok_tunnel = await asyncio.to_thread(ngrok.connect, settings.WEBSOCKET_PORT, "http", bind_tls=True)
                 # Explicitly await ngrok URL confirmation (if using async pyngrok wrapper)
                 timeout = 10
                 while not _ngrok_tunnel.public_url and timeout > 0:
@@ -45,6 +65,7 @@ async def get_ngrok_client():
                             response.raise_for_status() 
                             logger.info(f"Registered backend URL: {_ngrok_url}")
                             metrics.github_gist_url_updated.labels(database="github_gist").set(1)
+                            await _publish_url()
                     except Exception as e:
                         metrics.github_gist_update_errors.inc()
                         raise RuntimeError(f"Failed to register backend URL: {e}")
@@ -59,18 +80,70 @@ async def get_ngrok_client():
                 raise RuntimeError(f"Failed to start ngrok: {e}")
     logger.info(f"Websocket URL requested: {_ngrok_url}")
     return _ngrok_url
+
+async def _publish_url():
+    redis_client = await get_redis_client()
+    await redis_client.set(NGROK_URL_KEY, _ngrok_url, px=_tunnel_lease.ttl_ms)
     
 
+async def start_tunnel_election():
+    # The first process to take the lease opens the tunnel during its startup (failures still abort
+    # startup, as before); the rest start as followers
+    global _election_task
+    if await _tunnel_lease.acquire():
+        logger.info("Tunnel lease acquired; this worker registers the ngrok URL")
+        metrics.tunnel_leader.set(1)
+        await _open_tunnel()
+    if _election_task is None or _election_task.done():
+        _election_task = asyncio.create_task(_election_loop())
+
+async def _election_loop():
+    interval = settings.LEADER_LOCK_TTL / 3
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if _tunnel_lease.is_leader:
+                if not await _tunnel_lease.renew():
+                    logger.warning("Tunnel lease lost; another worker now owns the ngrok URL")
+                    await _disconnect()
+                elif _ngrok_url is None:
+                    await _open_tunnel()  # retry a tunnel that failed to open
+                else:
+                    await _publish_url()
+            elif await _tunnel_lease.acquire():
+                logger.info("Tunnel lease taken over; opening ngrok tunnel")
+                await _open_tunnel()
+        except Exception as e:
+            logger.error(f"Tunnel election failed: {e}")
+        metrics.tunnel_leader.set(1 if _tunnel_lease.is_leader else 0)
+
 async def close_ngrok_tunnel():
-    global _ngrok_url, _ngrok_tunnel
-    if _ngrok_url is not None:
+    global _election_task
+    if _election_task is not None:
+        _election_task.cancel()
+        _election_task = None
+    was_leader = _tunnel_lease.is_leader
+    await _disconnect()
+    if was_leader:
         try:
-            await ngrok.disconnect(_ngrok_tunnel)
-            logger.info("Ngrok tunnel disconnected")
-            metrics.ngrok_connections.dec()
-            _ngrok_tunnel = None
-            _ngrok_url = None
+            redis_client = await get_redis_client()
+            await redis_client.delete(NGROK_URL_KEY)
+            await _tunnel_lease.release()
         except Exception as e:
-            logger.error(f"Failed to disconnect ngrok: {e}")
-            metrics.ngrok_errors.inc()
+            logger.error(f"Failed to release tunnel lease: {e}")
+    metrics.tunnel_leader.set(0)
 
+async def _disconnect():
+    global _ngrok_url, _ngrok_tunnel
+    if _ngrok_tunnel is None:
+        return
+    try:
+        await asyncio.to_thread(ngrok.disconnect, _ngrok_tunnel.public_url)
+        logger.info("Ngrok tunnel disconnected")
+    except Exception as e:
+        logger.error(f"Failed to disconnect ngrok: {e}")
+        metrics.ngrok_errors.inc()
+    finally:
+        # Forget the tunnel even if ngrok refused, so a later lease reopens a fresh one
+        _ngrok_tunnel = None
+        _ngrok_url = None
@@ -14,12 +14,18 @@ async def get_redis_client():
     async with _redis_lock:
         if _redis_client is None:
             try:
-                _redis_client = redis.Redis(
+                # Blocking pool: when all REDIS_MAX_CONNECTIONS are busy, callers wait up to
+                # REDIS_POOL_TIMEOUT instead of failing with "Too many connections"
+                pool = redis.BlockingConnectionPool(
                     host=settings.REDIS_HOST,
                     port=settings.REDIS_PORT,
                     password=settings.REDIS_PASSWORD,
                     decode_responses=True,
+                    max_connections=settings.REDIS_MAX_CONNECTIONS,
+                    timeout=settings.REDIS_POOL_TIMEOUT,
                 )
+                _redis_client = redis.Redis(connection_pool=pool)
+                metrics.db_pool_limit.labels(database="redis").set(settings.REDIS_MAX_CONNECTIONS)
                 # Test connection once at startup
                 await _redis_client.ping()
                 logger.info("Redis client initialized.")
@@ -1,3 +1,50 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
 from passlib.context import CryptContext
+from app.core.config import settings
+from app.core.monitoring import metrics
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
\ No newline at end of file
+# min/max rounds pinned to BCRYPT_ROUNDS: any stored hash with a different cost is reported as
+# needing an update, so changing the setting rehashes users transparently on their next login.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+
+# bcrypt costs 100-300 ms of CPU per call and releases the GIL, so it runs on a small dedicated
+# pool instead of the event loop. At most PASSWORD_HASH_WORKERS hashes run and
+# PASSWORD_HASH_QUEUE_SIZE wait; a login burst beyond that gets a 503 instead of stalling.
+_hash_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_pending = 0
+
+async def _run_hash_job(fn, *args):
+    global _hash_pending
+    if _hash_pending >= settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_SIZE:
+        metrics.password_hash_rejected.inc()
+        raise HTTPException(status_code=503, detail="Server busy, please retry.", headers={"Retry-After": "1"})
+    _hash_pending += 1
+    submitted = time.perf_counter()
+
+    def job():
+        metrics.password_hash_queue_wait.observe(time.perf_counter() - submitted)
+        return fn(*args)
+
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, job)
+    finally:
+        _hash_pending -= 1
+
+async def hash_password(password: str) -> str:
+    return await _run_hash_job(pwd_context.hash, password)
+
+async def verify_password(password: str, hashed: str) -> tuple[bool, str | None]:
+    # Returns (valid, new_hash); new_hash is set when the stored hash uses an outdated cost
+    return await _run_hash_job(pwd_context.verify_and_update, password, hashed)
+
+def shutdown_hash_executor():
+    _hash_executor.shutdown(wait=False, cancel_futures=True)
@@ -4,49 +4,114 @@ from app.core.monitoring import metrics
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.db.database import db
 from app.db.sql import init_schema_postgres
+from app.db.migrations import apply_migrations
+from app.db.statements import PreparedConnection, prepare_statements
+from app.db.pool import InstrumentedPool, MongoPoolListener
+from app.service import conversation_store, media_store
 import asyncpg
 import asyncio
+import random
+from app.core.redis_instance import get_redis_client
 
-async def init_postgres():
+SCHEMA_LOCK_ID = 7_041_001
+
+def _postgres_params() -> dict:
+    return dict(
+        user=settings.POSTGRES_USER,
+        password=settings.POSTGRES_PASSWORD,
+        database=settings.POSTGRES_DB,
+        host=settings.POSTGRES_HOST,
+        port=settings.POSTGRES_PORT,
+    )
+
+async def init_postgres() -> bool:
     try:
-        db.postgres_pool = await asyncpg.create_pool(
-            user=settings.POSTGRES_USER,
-            password=settings.POSTGRES_PASSWORD,
-            database=settings.POSTGRES_DB,
-            host=settings.POSTGRES_HOST,
-            port=settings.POSTGRES_PORT,
-            min_size=1,
-            max_size=10
+        # The schema must exist before pool connections prepare their statements. Workers start
+        # concurrently, so the DDL runs under an advisory lock to avoid catalog races
+        conn = await asyncpg.connect(**_postgres_params())
+        try:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", SCHEMA_LOCK_ID)
+                await conn.execute(init_schema_postgres)
+                await apply_migrations(conn)
+            logger.info("PostgreSQL schema initialized.")
+        finally:
+            await conn.close()
+
+        # With adaptive sizing the asyncpg pool is allowed to grow to the adaptive cap; the
+        # InstrumentedPool wrapper enforces the current (soft) limit
+        hard_max = settings.POSTGRES_POOL_ADAPTIVE_MAX if settings.POSTGRES_POOL_ADAPTIVE else settings.POSTGRES_POOL_MAX
+        pool = await asyncpg.create_pool(
+            **_postgres_params(),
+            min_size=settings.POSTGRES_POOL_MIN,
+            max_size=hard_max,
+            max_inactive_connection_lifetime=settings.POSTGRES_POOL_MAX_IDLE_SECONDS,
+            connection_class=PreparedConnection,
+            init=prepare_statements,
         )
+        db.postgres_pool = InstrumentedPool(pool, settings.POSTGRES_POOL_MAX)
+        metrics.db_pool_limit.labels(database="postgres").set(settings.POSTGRES_POOL_MAX)
 
         logger.debug("PostgreSQL pool initialized.")
         metrics.db_connection_status.labels(database="postgres").set(1)
-
-        async with db.postgres_pool.acquire() as conn:
-            await conn.execute(init_schema_postgres)
-            logger.info("PostgreSQL schema initialized.")
+        return True
     except Exception as e:
         logger.error(f"Failed to initialize PostgreSQL pool: {e}")
         db.postgres_pool = None
         metrics.db_connection_status.labels(database="postgres").set(0)
+        return False
 
-async def init_mongodb():
+async def init_mongodb() -> bool:
     try:
-        db.mongo_client = AsyncIOMotorClient(f"mongodb://{settings.MONGO_HOST}:{settings.MONGO_PORT}")
+        db.mongo_client = AsyncIOMotorClient(
+            f"mongodb://{settings.MONGO_HOST}:{settings.MONGO_PORT}",
+            minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+            maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+            event_listeners=[MongoPoolListener()],
+        )
+        metrics.db_pool_limit.labels(database="mongodb").set(settings.MONGO_MAX_POOL_SIZE)
         db.mongo_db = db.mongo_client[settings.MONGO_DB]
         await db.mongo_client.admin.command("ping")
+        await conversation_store.ensure_indexes()
+        await media_store.ensure_indexes()
         logger.info("MongoDB client initialized.")
         metrics.db_connection_status.labels(database="mongodb").set(1)
+        return True
     except Exception as e:
         logger.error(f"Failed to initialize MongoDB: {e}")
+        if db.mongo_client is not None:
+            db.mongo_client.close()  # stop its monitor threads before the next attempt
         db.mongo_client = None
         db.mongo_db = None
         metrics.db_connection_status.labels(database="mongodb").set(0)
+        return False
+
+async def init_redis() -> bool:
+    return await get_redis_client() is not None
+
+async def connect_with_retry(name: str, connect) -> bool:
+    attempts = settings.STARTUP_CONNECT_ATTEMPTS
+    for attempt in range(1, attempts + 1):
+        if await connect():
+            return True
+        if attempt < attempts:
+            # Jitter keeps restarted workers from retrying a recovering server in lockstep
+            delay = min(settings.STARTUP_BACKOFF_SECONDS * 2 ** (attempt - 1), settings.STARTUP_BACKOFF_MAX_SECONDS)
+            delay *= random.uniform(0.5, 1.0)
+            logger.warning(f"{name} unavailable (attempt {attempt}/{attempts}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    logger.error(f"{name} still unavailable after {attempts} attempts; starting without it")
+    return False
 
 async def db_connect():
+    # The three stores are independent, so they connect (and back off) concurrently; startup
+    # takes as long as the slowest one instead of the sum
     logger.info("Database.connect() called")
-    await init_postgres()
-    await init_mongodb()
+    await asyncio.gather(
+        connect_with_retry("PostgreSQL", init_postgres),
+        connect_with_retry("MongoDB", init_mongodb),
+        connect_with_retry("Redis", init_redis),
+    )
     logger.info(f"Database connection pools: postgres_pool={db.postgres_pool}, mongo_client={db.mongo_client}")
     logger.info(f"[connect] Database instance id: {id(db.get_id())}")
 
@@ -0,0 +1,101 @@
+"""Deduplicate stored media into content-addressed blobs and report the bytes reclaimed.
+
+Handles two kinds of existing data:
+  * documents in the legacy `media` collection, which hold the whole file in a `data` field
+  * GridFS files written before content addressing (no metadata.sha256)
+Each becomes a reference in media_refs pointing at the blob for its SHA-256; duplicate copies are
+deleted. Safe to re-run: already converted data is skipped.
+
+    python -m app.db.dedupe_media [--dry-run]
+"""
+import argparse
+import asyncio
+import hashlib
+from app.core.config import logger
+from app.db.database import db
+from app.db.db_instance import init_mongodb
+from app.service import media_store
+
+
+async def _single_chunk(data: bytes):
+    yield data
+
+
+async def dedupe_legacy_documents(dry_run: bool) -> tuple[int, int]:
+    processed = reclaimed = 0
+    seen = set()
+    async for doc in db.mongo_db.media.find({"data": {"$exists": True}}):
+        data = doc["data"]
+        sha256 = hashlib.sha256(data).hexdigest()
+        processed += 1
+        if dry_run:
+            if sha256 in seen or await media_store.files_collection().find_one({"metadata.sha256": sha256}, {"_id": 1}):
+                reclaimed += len(data)
+            seen.add(sha256)
+            continue
+        blob_id, created = await media_store.store_blob(sha256, doc.get("content"), lambda: _single_chunk(data))
+        if not created:
+            reclaimed += len(data)
+        # Legacy uploads were not linked to a user or avatar
+        await media_store.create_ref(
+            blob_id, sha256, len(data), doc.get("filename"), doc.get("content"), None, None, legacy_id=doc["_id"]
+        )
+        await db.mongo_db.media.delete_one({"_id": doc["_id"]})
+    return processed, reclaimed
+
+
+async def dedupe_gridfs_files(dry_run: bool) -> tuple[int, int]:
+    processed = reclaimed = 0
+    seen = set()
+    async for doc in media_store.files_collection().find({"metadata.sha256": {"$exists": False}}):
+        digest = hashlib.sha256()
+        async for chunk in media_store.stream_range(doc["_id"], 0, doc["length"] - 1):
+            digest.update(chunk)
+        sha256 = digest.hexdigest()
+        metadata = doc.get("metadata") or {}
+        processed += 1
+        if dry_run:
+            if sha256 in seen or await media_store.files_collection().find_one({"metadata.sha256": sha256}, {"_id": 1}):
+                reclaimed += doc["length"]
+            seen.add(sha256)
+            continue
+
+        blob = await media_store.acquire_blob(sha256)
+        if blob is None:
+            # First copy of this content: promote the file itself to a blob
+            await media_store.files_collection().update_one(
+                {"_id": doc["_id"]},
+                {"$set": {"metadata.sha256": sha256, "metadata.refcount": 1}},
+            )
+            blob_id = doc["_id"]
+        else:
+            blob_id = blob["_id"]
+        await media_store.create_ref(
+            blob_id, sha256, doc["length"], doc.get("filename"), metadata.get("content_type"),
+            metadata.get("user_id"), metadata.get("avatar_id"),
+        )
+        if blob is not None:
+            await media_store.files_collection().delete_one({"_id": doc["_id"]})
+            await media_store.chunks_collection().delete_many({"files_id": doc["_id"]})
+            reclaimed += doc["length"]
+    return processed, reclaimed
+
+
+async def dedupe(dry_run: bool = False):
+    await init_mongodb()
+    if db.mongo_db is None:
+        raise SystemExit("MongoDB is not reachable")
+    legacy, legacy_reclaimed = await dedupe_legacy_documents(dry_run)
+    files, files_reclaimed = await dedupe_gridfs_files(dry_run)
+    logger.info(
+        f"{'Dry run' if dry_run else 'Deduplication'} complete: {legacy} legacy documents, {files} GridFS files, "
+        f"{legacy_reclaimed + files_reclaimed} bytes {'reclaimable' if dry_run else 'reclaimed'}"
+    )
+    db.mongo_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deduplicate stored media into content-addressed blobs")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the bytes that would be reclaimed")
+    args = parser.parse_args()
+    asyncio.run(dedupe(args.dry_run))
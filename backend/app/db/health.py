@@ -0,0 +1,110 @@
+import asyncio
+import time
+from app.core.config import settings, logger
+from app.core.monitoring import metrics
+from app.core.redis_instance import get_redis_client
+from app.db.database import db
+
+# Cached dependency health.
+# A background task probes Postgres, MongoDB and Redis concurrently every HEALTH_PROBE_INTERVAL,
+# each bounded by HEALTH_PROBE_TIMEOUT, and keeps the last result in memory. /db/health and /ready
+# answer from that snapshot without any network round trip. A result older than three intervals
+# counts as down, since it means the prober itself is stuck. Only state changes are logged.
+# The Postgres probe goes through the pool, so a pool saturated past the timeout reads as down.
+
+DEPENDENCIES = ("postgres", "mongodb", "redis")
+
+_status = {}  # dependency -> {"ok", "latency_ms", "error", "checked_at"}
+
+
+async def _probe_postgres():
+    if db.postgres_pool is None:
+        raise RuntimeError("pool not initialized")
+    async with db.postgres_pool.acquire() as conn:
+        await conn.execute("SELECT 1")
+
+
+async def _probe_mongodb():
+    if db.mongo_client is None:
+        raise RuntimeError("client not initialized")
+    await db.mongo_client.admin.command("ping")
+
+
+async def _probe_redis():
+    redis_client = await get_redis_client()  # reconnects if the startup attempt failed
+    if redis_client is None:
+        raise RuntimeError("client not initialized")
+    await redis_client.ping()
+
+
+_PROBES = {"postgres": _probe_postgres, "mongodb": _probe_mongodb, "redis": _probe_redis}
+
+
+async def _probe(name: str):
+    start = time.perf_counter()
+    error = None
+    try:
+        await asyncio.wait_for(_PROBES[name](), settings.HEALTH_PROBE_TIMEOUT)
+    except asyncio.TimeoutError:
+        error = f"timed out after {settings.HEALTH_PROBE_TIMEOUT}s"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    latency = time.perf_counter() - start
+    metrics.dependency_probe_seconds.labels(database=name).observe(latency)
+    metrics.db_connection_status.labels(database=name).set(0 if error else 1)
+
+    previous = _status.get(name)
+    if error and (previous is None or previous["ok"]):
+        logger.error(f"{name} health probe failed: {error}")
+    elif not error and previous is not None and not previous["ok"]:
+        logger.info(f"{name} health probe recovered")
+    _status[name] = {"ok": error is None, "latency_ms": round(latency * 1000, 3), "error": error, "checked_at": time.time()}
+
+
+async def probe_all():
+    await asyncio.gather(*(_probe(name) for name in DEPENDENCIES))
+
+
+def snapshot() -> dict:
+    now = time.time()
+    stale_after = 3 * settings.HEALTH_PROBE_INTERVAL
+    checks = {}
+    for name in DEPENDENCIES:
+        status = _status.get(name)
+        if status is None:
+            checks[name] = {"ok": False, "latency_ms": None, "error": "not probed yet", "age_seconds": None}
+            continue
+        age = now - status["checked_at"]
+        ok = status["ok"] and age <= stale_after
+        error = status["error"] or (None if ok else f"last probe is {age:.0f}s old")
+        checks[name] = {"ok": ok, "latency_ms": status["latency_ms"], "error": error, "age_seconds": round(age, 3)}
+    return checks
+
+
+def is_ready(checks: dict = None) -> bool:
+    checks = checks or snapshot()
+    return all(check["ok"] for check in checks.values())
+
+
+async def _probe_loop():
+    # The first round runs during startup (probe_all), so the loop starts with a sleep
+    while True:
+        await asyncio.sleep(settings.HEALTH_PROBE_INTERVAL)
+        try:
+            await probe_all()
+        except Exception as e:
+            logger.error(f"Health prober failed: {e}")
+
+
+_probe_task = None
+
+def start_health_prober():
+    global _probe_task
+    if _probe_task is None or _probe_task.done():
+        _probe_task = asyncio.create_task(_probe_loop())
+
+def stop_health_prober():
+    global _probe_task
+    if _probe_task is not None:
+        _probe_task.cancel()
+        _probe_task = None
@@ -0,0 +1,84 @@
+"""Bulk-import a historical conversation archive into one avatar's conversation.
+
+Reads NDJSON ({"role", "content"[, "ts"]} per line) or a WhatsApp "Export chat" text file, plain
+or gzip-compressed (by .gz suffix), or "-" for stdin. The file is streamed, so archives of any
+size import in constant memory. Same pipeline as POST /avatars/{avatar_id}/import:
+
+    python -m app.db.import_conversations history.ndjson.gz --user-id <uuid> --avatar-id <uuid>
+    python -m app.db.import_conversations chat.txt --format whatsapp --avatar-name "Grandpa" --user-id <uuid> --avatar-id <uuid>
+"""
+import argparse
+import asyncio
+import sys
+import time
+from uuid import UUID
+from app.core.config import settings, logger
+from app.core.redis_instance import get_redis_client, close_redis_client
+from app.db.database import db
+from app.db.db_instance import init_mongodb
+from app.service import conversation_import
+
+READ_SIZE = 1024 * 1024
+
+
+async def read_file(path: str):
+    # File reads are blocking; each 1 MB read runs in a thread so in-flight bulk writes keep going
+    f = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, READ_SIZE)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+
+async def run(args):
+    await init_mongodb()
+    if db.mongo_db is None:
+        raise SystemExit("MongoDB is not reachable")
+    await get_redis_client()  # for the hot-window rebuild; the import itself only needs MongoDB
+
+    last_report = 0.0
+
+    async def report(progress: dict):
+        nonlocal last_report
+        if time.time() - last_report >= args.progress_interval or progress["status"] != "running":
+            last_report = time.time()
+            logger.info(
+                f"[{progress['status']}] {progress['lines']} lines, {progress['imported']} imported, "
+                f"{progress['invalid']} invalid, {progress['failed']} failed ({progress['messages_per_second']:.0f} msg/s)"
+            )
+
+    chunks = read_file(args.path)
+    if args.path.endswith(".gz"):
+        chunks = conversation_import.gunzip(chunks)
+    job = conversation_import.ConversationImport(args.user_id, str(args.avatar_id), args.index, on_progress=report)
+    try:
+        progress = await job.run(chunks, args.format, args.avatar_name)
+    except conversation_import.ImportFormatError as e:
+        raise SystemExit(str(e))
+    finally:
+        db.mongo_client.close()
+        await close_redis_client()
+    for error in progress["errors"]:
+        logger.warning(f"line {error['line']}: {error['error']}")
+    return progress
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-import a conversation archive for one avatar")
+    parser.add_argument("path", help="NDJSON or WhatsApp export (.gz allowed), or - for stdin")
+    parser.add_argument("--user-id", required=True, help="Owner's user id (UUID)")
+    parser.add_argument("--avatar-id", required=True, type=UUID, help="Avatar id (UUID), as returned by /avatars/create")
+    parser.add_argument("--format", choices=conversation_import.FORMATS, default="ndjson")
+    parser.add_argument("--avatar-name", help="WhatsApp sender whose messages become the avatar's")
+    parser.add_argument("--index", action="store_true", help="Also add the messages to the avatar's retrieval index")
+    parser.add_argument("--batch-size", type=int, default=settings.IMPORT_BATCH_SIZE)
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="Seconds between progress lines")
+    args = parser.parse_args()
+    settings.IMPORT_BATCH_SIZE = args.batch_size
+    progress = asyncio.run(run(args))
+    sys.exit(0 if progress["status"] == "completed" else 1)
@@ -0,0 +1,61 @@
+"""Split legacy avatar_conversations documents into bucket documents.
+
+Before bucketing, each user/avatar pair kept its whole history in one `messages` array. This
+tool moves those arrays into avatar_conversation_buckets and leaves only the metadata document
+(with message_count) behind. Messages the bucketed write path already stored for the same pair
+are kept and renumbered after the legacy ones.
+
+Run it while message writes are paused (the write-behind queue in Redis will hold new messages):
+
+    python -m app.db.migrate_conversation_buckets [--dry-run]
+"""
+import argparse
+import asyncio
+from app.core.config import logger
+from app.db.database import db
+from app.db.db_instance import init_mongodb
+from app.service import conversation_store
+
+
+async def migrate_document(doc: dict, dry_run: bool = False) -> int:
+    avatar_id, user_id = doc["avatar_id"], doc["user_id"]
+    legacy = doc.get("messages", [])
+    newer = []
+    if doc.get("message_count"):
+        newer, _ = await conversation_store.read_messages(avatar_id, user_id, doc["message_count"])
+    combined = legacy + newer
+    if dry_run:
+        return len(combined)
+
+    buckets = db.mongo_db[conversation_store.BUCKETS_COLLECTION]
+    await buckets.delete_many({"user_id": user_id, "avatar_id": avatar_id})
+    if combined:
+        operations = conversation_store.bucket_operations(avatar_id, user_id, 0, combined)
+        await conversation_store.write_buckets([operation for operation, _ in operations])
+    await db.mongo_db[conversation_store.META_COLLECTION].update_one(
+        {"_id": doc["_id"]},
+        {"$set": {"message_count": len(combined)}, "$unset": {"messages": ""}},
+    )
+    return len(combined)
+
+
+async def migrate(dry_run: bool = False):
+    await init_mongodb()
+    if db.mongo_db is None:
+        raise SystemExit("MongoDB is not reachable")
+    meta = db.mongo_db[conversation_store.META_COLLECTION]
+    conversations = messages = 0
+    async for doc in meta.find({"messages": {"$exists": True}}):
+        moved = await migrate_document(doc, dry_run)
+        conversations += 1
+        messages += moved
+        logger.info(f"{'Would migrate' if dry_run else 'Migrated'} avatar {doc['avatar_id']} / user {doc['user_id']}: {moved} messages")
+    logger.info(f"{'Dry run' if dry_run else 'Migration'} complete: {conversations} conversations, {messages} messages")
+    db.mongo_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split legacy conversation documents into buckets")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be migrated")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.dry_run))
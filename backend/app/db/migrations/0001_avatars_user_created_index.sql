@@ -0,0 +1,5 @@
+-- Keyset pagination of a user's avatars orders by (created_at, id); give created_at a value on
+-- every row and index the whole ordering so each page is an index range scan
+UPDATE avatars SET created_at = now() WHERE created_at IS NULL;
+ALTER TABLE avatars ALTER COLUMN created_at SET NOT NULL;
+CREATE INDEX IF NOT EXISTS avatars_user_created_idx ON avatars (user_id, created_at DESC, id DESC);
@@ -0,0 +1,32 @@
+from pathlib import Path
+from app.core.config import logger
+
+# Versioned schema migrations.
+# Files are named NNNN_description.sql and applied once each, in order, after
+# init_schema_postgres. Applied versions are recorded in schema_migrations. The caller holds the
+# schema advisory lock and an open transaction, so concurrent workers never apply one twice.
+
+migrations_dir = Path(__file__).parent
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version TEXT PRIMARY KEY,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+)
+"""
+
+
+def pending_files(applied: set) -> list:
+    return [f for f in sorted(migrations_dir.glob("*.sql")) if f.stem not in applied]
+
+
+async def apply_migrations(conn) -> list:
+    await conn.execute(CREATE_TABLE)
+    applied = {row["version"] for row in await conn.fetch("SELECT version FROM schema_migrations")}
+    versions = []
+    for migration in pending_files(applied):
+        await conn.execute(migration.read_text(encoding="utf-8"))
+        await conn.execute("INSERT INTO schema_migrations (version) VALUES ($1)", migration.stem)
+        logger.info(f"Applied migration {migration.stem}")
+        versions.append(migration.stem)
+    return versions
@@ -1,3 +1,4 @@
+from uuid import UUID
 from pydantic import BaseModel
 
 class AvatarCreate(BaseModel):
@@ -5,6 +6,6 @@ class AvatarCreate(BaseModel):
     description: str | None = None
 
 class Message(BaseModel):
-    avatar_id: int
+    avatar_id: UUID
     role: str  # "user" or "avatar"
     content: str
\ No newline at end of file
@@ -0,0 +1,156 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from pymongo import monitoring
+from app.core.config import settings, logger
+from app.core.monitoring import metrics
+from app.db.database import db
+
+# Connection-pool instrumentation for Postgres, MongoDB and Redis.
+#
+# Postgres: InstrumentedPool wraps the asyncpg pool so every acquire() is timed and in-use
+# connections are counted. The asyncpg pool is created with POSTGRES_POOL_ADAPTIVE_MAX as its hard
+# cap when adaptive sizing is on, and the wrapper gates acquires at a soft `limit` the monitor
+# moves between POSTGRES_POOL_MAX and that cap based on observed acquire wait. Connections above
+# the limit go idle and are closed by asyncpg's max_inactive_connection_lifetime.
+# MongoDB: a pymongo ConnectionPoolListener tracks pool size, checkouts and checkout wait.
+# Redis: the connection pool is sampled by the monitor loop.
+
+
+class InstrumentedPool:
+    def __init__(self, pool, limit: int):
+        self._pool = pool
+        self.limit = limit
+        self.in_use = 0
+        self._peak_in_use = 0
+        self._wait_total = 0.0
+        self._wait_count = 0
+        self._gate = asyncio.Condition()
+
+    def __getattr__(self, attr):
+        return getattr(self._pool, attr)
+
+    @asynccontextmanager
+    async def acquire(self):
+        start = time.perf_counter()
+        async with self._gate:
+            await self._gate.wait_for(lambda: self.in_use < self.limit)
+            self.in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self.in_use)
+        try:
+            async with self._pool.acquire() as conn:
+                wait = time.perf_counter() - start
+                metrics.db_pool_acquire_seconds.labels(database="postgres").observe(wait)
+                self._wait_total += wait
+                self._wait_count += 1
+                metrics.db_pool_in_use.labels(database="postgres").set(self.in_use)
+                yield conn
+        finally:
+            async with self._gate:
+                self.in_use -= 1
+                self._gate.notify()
+            metrics.db_pool_in_use.labels(database="postgres").set(self.in_use)
+
+    async def set_limit(self, limit: int):
+        async with self._gate:
+            self.limit = limit
+            self._gate.notify_all()
+
+    def take_window(self) -> tuple[float, int]:
+        # Average acquire wait and peak in-use since the previous call
+        avg_wait = self._wait_total / self._wait_count if self._wait_count else 0.0
+        peak = self._peak_in_use
+        self._wait_total, self._wait_count, self._peak_in_use = 0.0, 0, self.in_use
+        return avg_wait, peak
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        metrics.db_pool_size.labels(database="mongodb").set(0)
+        metrics.db_pool_in_use.labels(database="mongodb").set(0)
+
+    def connection_created(self, event):
+        metrics.db_pool_size.labels(database="mongodb").inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        metrics.db_pool_size.labels(database="mongodb").dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+    def connection_checked_out(self, event):
+        metrics.db_pool_in_use.labels(database="mongodb").inc()
+        duration = getattr(event, "duration", None)  # pymongo >= 4.7
+        if duration is not None:
+            metrics.db_pool_acquire_seconds.labels(database="mongodb").observe(duration)
+
+    def connection_checked_in(self, event):
+        metrics.db_pool_in_use.labels(database="mongodb").dec()
+
+
+def _sample_redis():
+    from app.core.redis_instance import _redis_client
+    if _redis_client is None:
+        return
+    pool = _redis_client.connection_pool
+    in_use = len(getattr(pool, "_in_use_connections", ()))
+    idle = len(getattr(pool, "_available_connections", ()))
+    metrics.db_pool_size.labels(database="redis").set(in_use + idle)
+    metrics.db_pool_in_use.labels(database="redis").set(in_use)
+
+
+async def _adapt_postgres(pool: InstrumentedPool):
+    avg_wait, peak = pool.take_window()
+    target = settings.POSTGRES_POOL_TARGET_WAIT_MS / 1000
+    limit = pool.limit
+    if avg_wait > target and limit < settings.POSTGRES_POOL_ADAPTIVE_MAX:
+        limit = min(limit * 2, settings.POSTGRES_POOL_ADAPTIVE_MAX)
+    elif avg_wait < target / 4 and peak < limit // 2 and limit > settings.POSTGRES_POOL_MAX:
+        limit = max(limit - 1, settings.POSTGRES_POOL_MAX)
+    if limit != pool.limit:
+        logger.info(f"Postgres pool limit {pool.limit} -> {limit} (avg acquire wait {avg_wait * 1000:.1f} ms, peak in use {peak})")
+        await pool.set_limit(limit)
+
+
+async def _monitor_loop():
+    while True:
+        await asyncio.sleep(settings.POOL_METRICS_INTERVAL)
+        try:
+            pool = db.postgres_pool
+            if isinstance(pool, InstrumentedPool):
+                metrics.db_pool_size.labels(database="postgres").set(pool.get_size())
+                metrics.db_pool_limit.labels(database="postgres").set(pool.limit)
+                if settings.POSTGRES_POOL_ADAPTIVE:
+                    await _adapt_postgres(pool)
+            _sample_redis()
+        except Exception as e:
+            logger.error(f"Pool monitor failed: {e}")
+
+
+_monitor_task = None
+
+def start_pool_monitor():
+    global _monitor_task
+    if _monitor_task is None or _monitor_task.done():
+        _monitor_task = asyncio.create_task(_monitor_loop())
+
+def stop_pool_monitor():
+    global _monitor_task
+    if _monitor_task is not None:
+        _monitor_task.cancel()
+        _monitor_task = None
@@ -11,3 +11,11 @@ for sql_file in sql_dir.glob("*.sql"):
 
 # Optional: list of all available SQL variables for introspection
 __all__ = [f.stem for f in sql_dir.glob("*.sql")]
+
+# Statements prepared on every pool connection (see app.db.statements). Schema scripts hold
+# several statements and run once at startup, so they are not prepared.
+statements = {
+    f.stem: f.read_text(encoding="utf-8")
+    for f in sql_dir.glob("*.sql")
+    if not f.stem.startswith("init_")
+}
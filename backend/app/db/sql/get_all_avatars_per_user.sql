@@ -1 +0,0 @@
-SELECT id, name, description, created_at FROM avatars WHERE user_id = $1
\ No newline at end of file
@@ -0,0 +1,3 @@
+SELECT id
+FROM avatars
+WHERE id = $1 AND user_id = $2;
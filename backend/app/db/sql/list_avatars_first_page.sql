@@ -0,0 +1,4 @@
+SELECT id, name, description, created_at FROM avatars
+WHERE user_id = $1
+ORDER BY created_at DESC, id DESC
+LIMIT $2
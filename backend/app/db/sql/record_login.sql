@@ -0,0 +1,2 @@
+-- Successful login: stamp last_login and, when the cost factor changed, store the upgraded hash ($3 NULL keeps the current one)
+UPDATE users SET last_login = $2, password = COALESCE($3, password) WHERE id = $1
\ No newline at end of file
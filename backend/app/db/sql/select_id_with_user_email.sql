@@ -1 +0,0 @@
-SELECT id FROM users WHERE email = $1
\ No newline at end of file
@@ -1 +1 @@
-INSERT INTO users (username, email, password, created_at, last_login) VALUES ($1, $2, $3, $4, DEFAULT)
\ No newline at end of file
+INSERT INTO users (username, email, password, created_at, last_login) VALUES ($1, $2, $3, $4, $4) RETURNING id
\ No newline at end of file
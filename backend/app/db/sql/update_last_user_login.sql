@@ -1 +0,0 @@
-UPDATE users SET last_login = $1 WHERE id = $2
\ No newline at end of file
@@ -0,0 +1,69 @@
+import asyncpg
+import time
+from datetime import datetime
+from uuid import UUID
+from app.core.monitoring import metrics
+from app.db.sql import statements
+
+# Prepared-statement registry.
+# Every query in app/db/sql is prepared once per pool connection by the pool's `init` hook, so
+# requests never pay for parsing or planning. The helpers below are the typed entry points
+# routes use instead of passing raw SQL strings around.
+
+
+class PreparedConnection(asyncpg.Connection):
+    # asyncpg.Connection uses __slots__; the subclass gets a __dict__ to hold the statements
+    pass
+
+
+async def prepare_statements(conn: PreparedConnection):
+    conn.prepared = {name: await conn.prepare(sql) for name, sql in statements.items()}
+
+
+async def _statement(conn, name: str):
+    prepared = getattr(conn, "prepared", None)
+    if prepared is not None and name in prepared:
+        return prepared[name]
+    return await conn.prepare(statements[name])  # connection not created by our pool
+
+
+async def _run(conn, name: str, method: str, *args):
+    # Latency is labelled by statement name, a fixed set, so cardinality stays bounded
+    start = time.perf_counter()
+    try:
+        return await getattr(await _statement(conn, name), method)(*args)
+    finally:
+        metrics.sql_statement_seconds.labels(statement=name).observe(time.perf_counter() - start)
+
+
+async def signup_user(conn, username: str, email: str, password_hash: str, now: datetime) -> UUID:
+    # INSERT ... RETURNING id also stamps last_login: one round trip for the whole signup
+    return await _run(conn, "signup_user", "fetchval", username, email, password_hash, now)
+
+
+async def login_user(conn, email: str) -> asyncpg.Record | None:
+    return await _run(conn, "login_user", "fetchrow", email)
+
+
+async def record_login(conn, user_id: UUID, now: datetime, new_password_hash: str | None = None):
+    await _run(conn, "record_login", "fetch", user_id, now, new_password_hash)
+
+
+async def get_current_user_profile(conn, user_id) -> asyncpg.Record | None:
+    return await _run(conn, "get_current_user_profile", "fetchrow", user_id)
+
+
+async def create_avatar(conn, user_id: UUID, name: str, description: str | None) -> UUID:
+    return await _run(conn, "create_avatar_sql", "fetchval", user_id, name, description)
+
+
+async def get_user_avatar(conn, avatar_id: UUID, user_id: UUID) -> UUID | None:
+    # None when the avatar does not exist or belongs to someone else
+    return await _run(conn, "get_user_avatar", "fetchval", avatar_id, user_id)
+
+
+async def list_avatars(conn, user_id: UUID, limit: int, after: tuple[datetime, UUID] | None = None) -> list[asyncpg.Record]:
+    # Keyset page, newest first: `after` is the (created_at, id) of the last row already seen
+    if after is None:
+        return await _run(conn, "list_avatars_first_page", "fetch", user_id, limit)
+    return await _run(conn, "list_avatars_after", "fetch", user_id, after[0], after[1], limit)
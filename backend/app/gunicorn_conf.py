@@ -0,0 +1,26 @@
+# Multi-worker serving. Run from the app directory (as in Dockerfile.backend):
+#   PROMETHEUS_MULTIPROC_DIR=/tmp/prometheus gunicorn main:app -c gunicorn_conf.py
+# Each worker has its own database pools, inference executor and Whisper models, so size
+# WEB_CONCURRENCY x INFERENCE_WORKERS to the cores and memory available. The ngrok tunnel and gist
+# update happen once per deployment via the Redis tunnel lease (app.core.ngrok_instance).
+import os
+from prometheus_client import multiprocess
+
+bind = f"0.0.0.0:{os.environ.get('FASTAPI_PORT', '8765')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+graceful_timeout = 30  # lets shutdown drain the write-behind queue
+
+
+def on_starting(server):
+    # Stale per-pid metric files from a previous run would be summed into this one
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            os.remove(os.path.join(path, name))
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
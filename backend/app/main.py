@@ -1,24 +1,36 @@
-from fastapi import FastAPI
+import os
+import time
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
 import uvicorn
-from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
-from fastapi.responses import Response
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST, CollectorRegistry, multiprocess
+from fastapi.responses import JSONResponse, Response
+from starlette.routing import Match
 
 # Configurations & Metrics
-from app.core.ngrok_instance import get_ngrok_client, close_ngrok_tunnel
+from app.core.ngrok_instance import start_tunnel_election, close_ngrok_tunnel
 from core.config import settings
 from core.monitoring import metrics
 from core.config import logger
 # from core import redis_instance 
 from app.db.db_instance import db_connect, db_disconnect
+from app.db.health import probe_all, snapshot, is_ready, start_health_prober, stop_health_prober
 
 # API Routes
 from api.db_routes import router as db_router
 from api.transcription_routes import router as transcription_router
 from api.media_routes import router as media_router
 
-from app.core.redis_instance import get_redis_client, close_redis_client
+from app.core.redis_instance import close_redis_client
+from app.service.transcription import start_warmup, shutdown_inference
+from app.service.write_behind import conversation_writer
+from app.service.auth import start_revocation_listener, stop_revocation_listener
+from app.core.security import shutdown_hash_executor
+from app.db.pool import start_pool_monitor, stop_pool_monitor
+from app.service.conversation_cache import start_cache_stats, stop_cache_stats
+from app.service.retrieval import shutdown_retrieval
+from app.service.transcription_jobs import start_events_listener, stop_events_listener
 
 app = FastAPI(title="Real-Time Whisper Transcription Service")
 
@@ -36,26 +48,81 @@ app.include_router(db_router, tags=["Database"])
 app.include_router(transcription_router, prefix="/transcription", tags=["Transcription"])
 app.include_router(media_router, prefix="/media", tags=["Media"])
 
+KNOWN_METHODS = {"GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"}
+
+def _route_template(request: Request) -> str:
+    # Label by template ("/media/{file_id}"), never the raw path, so ids do not create new series
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = "5xx"
+    try:
+        response = await call_next(request)
+        status = f"{response.status_code // 100}xx"
+        return response
+    finally:
+        method = request.method if request.method in KNOWN_METHODS else "other"
+        metrics.http_request_duration.labels(method=method, route=_route_template(request), status=status).observe(time.perf_counter() - start)
+
 # Store ngrok public URL
 @app.on_event("startup")
 async def startup_event():
-    await db_connect()
-    await get_redis_client()
-    await get_ngrok_client()
+    start_warmup()  # loads Whisper in the background while the databases connect
+    await db_connect()  # Postgres, MongoDB and Redis concurrently, each with retry/backoff
+    await conversation_writer.start()
+    start_revocation_listener()
+    start_events_listener()
+    start_pool_monitor()
+    start_cache_stats()
+    await probe_all()  # /ready reflects real state from the first request on
+    start_health_prober()
+    if settings.NGROK_ENABLED:
+        await start_tunnel_election()  # only one worker per deployment opens the tunnel
+    else:
+        logger.info("NGROK_ENABLED is off; serving without a public tunnel")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     await close_ngrok_tunnel()
+    stop_health_prober()
+    stop_revocation_listener()
+    stop_events_listener()
+    stop_pool_monitor()
+    stop_cache_stats()
+    await conversation_writer.stop()  # flush queued messages while MongoDB and Redis are still up
     await db_disconnect()
     await close_redis_client()
-    
+    shutdown_inference()
+    shutdown_hash_executor()
+    shutdown_retrieval()
+
 @app.get("/health")
 async def health():
     metrics.health_requests.inc()
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def ready():
+    # Readiness (vs. /health liveness): every dependency passed its last background probe
+    checks = snapshot()
+    if not is_ready(checks):
+        return JSONResponse(status_code=503, content={"status": "not ready", "checks": checks})
+    return {"status": "ready", "checks": checks}
+
 @app.get("/metrics")
 def metrics_endpoint():
+    # Under gunicorn (PROMETHEUS_MULTIPROC_DIR set) every worker writes its samples to that
+    # directory; aggregate them so a scrape sees the whole deployment, not one random worker
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
     return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 if __name__ == "__main__":
@@ -1,15 +1,42 @@
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import HTTPException, status, Depends
-from app.core.config import settings
+from app.core.config import settings, logger
+from app.core.monitoring import metrics
+from app.core.redis_instance import get_redis_client
+from app.core.ttl_cache import TTLCache
+import asyncio
+import json
 import jwt
+from uuid import UUID
 from datetime import datetime, timedelta
 from app.db.database import db
-from app.db.sql import get_current_user_profile
+from app.db import statements
 
 # Instance-level shared components
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
+# Two-tier user cache for get_current_user:
+#   1. in-process LRU keyed by token (AUTH_LOCAL_CACHE_TTL, short)
+#   2. Redis: token:{jwt} -> user_id marks a live session (written at login/signup, deleted at
+#      logout) and user:{id}:profile holds the profile for AUTH_PROFILE_CACHE_TTL
+# Postgres is only queried when both miss. Logout publishes the token on AUTH_REVOKED_CHANNEL so
+# every process drops it from its local tier at once.
+AUTH_REVOKED_CHANNEL = "auth:revoked"
+_local_cache = TTLCache(settings.AUTH_LOCAL_CACHE_SIZE, settings.AUTH_LOCAL_CACHE_TTL)
+_revocation_task = None
+# Avatars never change owner, so a confirmed (user, avatar) pair can be remembered
+_avatar_owners = TTLCache(settings.AVATAR_OWNER_CACHE_SIZE, settings.AVATAR_OWNER_CACHE_TTL)
+
+def token_key(token: str) -> str:
+    return f"token:{token}"
+
+def profile_key(user_id) -> str:
+    return f"user:{user_id}:profile"
+
+def _to_profile(data: dict) -> dict:
+    return {"id": UUID(str(data["id"])), "username": data["username"], "email": data["email"]}
+
 # get_current_user in app.service.auth
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
@@ -18,22 +45,102 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
+        # Always verified, so cached entries can never outlive the token's exp
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         user_id = payload.get("sub")
         
         if user_id is None:
             raise credentials_exception
+        user_uuid = UUID(user_id)
     except (jwt.PyJWTError, ValueError):
         raise credentials_exception
+
+    profile = _local_cache.get(token)
+    if profile is not None:
+        metrics.auth_cache_hits.labels(tier="local").inc()
+        return profile
+
+    redis_client = await get_redis_client()
+    if redis_client is not None:
+        session_user, cached_profile = await redis_client.mget(token_key(token), profile_key(user_id))
+        if session_user is None:
+            raise credentials_exception  # logged out or never issued by this service
+        if cached_profile is not None:
+            metrics.auth_cache_hits.labels(tier="redis").inc()
+            profile = _to_profile(json.loads(cached_profile))
+            _local_cache.set(token, profile)
+            return profile
+
+    metrics.auth_cache_misses.inc()
     async with db.postgres_pool.acquire() as conn:
-        user = await conn.fetchrow(get_current_user_profile, user_id)
+        user = await statements.get_current_user_profile(conn, user_uuid)
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
-        return user
+    profile = _to_profile(user)
+    if redis_client is not None:
+        await redis_client.setex(
+            profile_key(user_id),
+            settings.AUTH_PROFILE_CACHE_TTL,
+            json.dumps({"id": str(user["id"]), "username": user["username"], "email": user["email"]}),
+        )
+    _local_cache.set(token, profile)
+    return profile
+
+async def revoke_token(token: str):
+    _local_cache.pop(token)
+    redis_client = await get_redis_client()
+    if redis_client is not None:
+        await redis_client.delete(token_key(token))
+        await redis_client.publish(AUTH_REVOKED_CHANNEL, token)
+
+async def _listen_for_revocations():
+    while True:
+        redis_client = await get_redis_client()
+        if redis_client is None:
+            await asyncio.sleep(5)
+            continue
+        try:
+            async with redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(AUTH_REVOKED_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        _local_cache.pop(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # A dropped subscription may have missed revocations; start again from a clean tier
+            logger.error(f"Token revocation listener failed: {e}")
+            _local_cache.clear()
+            await asyncio.sleep(1)
+
+def start_revocation_listener():
+    global _revocation_task
+    if _revocation_task is None or _revocation_task.done():
+        _revocation_task = asyncio.create_task(_listen_for_revocations())
+
+def stop_revocation_listener():
+    global _revocation_task
+    if _revocation_task is not None:
+        _revocation_task.cancel()
+        _revocation_task = None
+
+async def require_avatar(avatar_id: UUID, user_id) -> str:
+    """Return the avatar id as the string key conversations, media and retrieval are stored under;
+    404 unless the avatar exists and belongs to the user."""
+    key = (str(user_id), str(avatar_id))
+    if _avatar_owners.get(key):
+        return key[1]
+    if db.postgres_pool is None:
+        raise HTTPException(status_code=503, detail="Database unavailable.")
+    async with db.postgres_pool.acquire() as conn:
+        if await statements.get_user_avatar(conn, avatar_id, user_id) is None:
+            raise HTTPException(status_code=404, detail="Avatar not found.")
+    _avatar_owners.set(key, True)
+    return key[1]
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
@@ -0,0 +1,42 @@
+import base64
+import json
+from datetime import datetime
+from uuid import UUID
+from fastapi import HTTPException
+from app.core.config import settings
+from app.core.monitoring import metrics
+
+# Per-user cache of avatar list pages.
+# All cached pages of a user live in one Redis hash, user:{id}:avatars, with one field per page
+# ("{limit}:{cursor}"). create_avatar deletes the whole hash, so a new avatar is never missing
+# from any page. The hash expires AVATAR_LIST_CACHE_TTL after the last page was written.
+# Cursors are opaque to clients: base64url of "<created_at iso>|<id>" of a page's last row.
+
+def list_key(user_id) -> str:
+    return f"user:{user_id}:avatars"
+
+def encode_cursor(created_at: datetime, avatar_id: UUID) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{avatar_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, avatar_id = raw.split("|")
+        return datetime.fromisoformat(created_at), UUID(avatar_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+async def get_page(redis_client, user_id, limit: int, cursor: str | None):
+    page = await redis_client.hget(list_key(user_id), f"{limit}:{cursor or ''}")
+    metrics.avatar_list_cache.labels(result="hit" if page is not None else "miss").inc()
+    return json.loads(page) if page is not None else None
+
+async def set_page(redis_client, user_id, limit: int, cursor: str | None, page: dict):
+    key = list_key(user_id)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(key, f"{limit}:{cursor or ''}", json.dumps(page))
+        pipe.expire(key, settings.AVATAR_LIST_CACHE_TTL)
+        await pipe.execute()
+
+async def invalidate(redis_client, user_id):
+    await redis_client.delete(list_key(user_id))
@@ -0,0 +1,76 @@
+import asyncio
+from app.core.config import settings, logger
+from app.core.monitoring import metrics
+
+# Cross-connection micro-batching.
+# Every websocket session submits its ready chunk here and awaits its own future. The
+# collector gathers whatever arrives within BATCH_WAIT_MS (or until BATCH_MAX_SIZE items)
+# and runs the whole batch as one call on the inference executor, then resolves each
+# future with its own result, so results always go back to the session that sent them.
+
+
+class BatchScheduler:
+    def __init__(self, executor, batch_fn, max_batch: int = None, wait_ms: int = None):
+        self.executor = executor
+        self.batch_fn = batch_fn  # blocking: list of items -> list of results, same order
+        self.max_batch = max_batch or settings.BATCH_MAX_SIZE
+        self.wait = (wait_ms if wait_ms is not None else settings.BATCH_WAIT_MS) / 1000
+        self._queue = []
+        self._ready = None
+        self._full = None
+        self._collector = None
+        self._inflight = set()
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        if self._collector is None or self._collector.done():
+            self._ready = asyncio.Event()
+            self._full = asyncio.Event()
+            self._collector = loop.create_task(self._collect())
+        future = loop.create_future()
+        self._queue.append((item, future))
+        self._ready.set()
+        if len(self._queue) >= self.max_batch:
+            self._full.set()
+        return await future
+
+    async def _collect(self):
+        while True:
+            await self._ready.wait()
+            if len(self._queue) < self.max_batch:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.wait)
+                except asyncio.TimeoutError:
+                    pass
+            batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+            if len(self._queue) < self.max_batch:
+                self._full.clear()
+            if not self._queue:
+                self._ready.clear()
+            loop = asyncio.get_running_loop()
+            if batch:
+                task = loop.create_task(self._dispatch(batch))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch):
+        metrics.inference_batch_size.observe(len(batch))
+        try:
+            results = await self.executor.run(self.batch_fn, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def shutdown(self):
+        if self._collector is not None:
+            self._collector.cancel()
+            self._collector = None
+        for _, future in self._queue:
+            future.cancel()
+        self._queue = []
+        logger.info("Batch scheduler stopped")
@@ -0,0 +1,81 @@
+import asyncio
+import shutil
+from collections import deque
+from app.core.config import settings, logger
+
+# Audio codecs accepted on /transcription/ws, negotiated with ?codec= when the socket opens.
+#   pcm16     - raw 16-bit mono PCM at SAMPLE_RATE, used as is (~32 KB/s)
+#   webm-opus - MediaRecorder's audio/webm;codecs=opus (~3-4 KB/s). An ffmpeg process per
+#               connection decodes the container as bytes arrive and emits pcm16 into the same
+#               pipeline; it flushes on every packet, so latency stays at one MediaRecorder timeslice.
+
+PCM16 = "pcm16"
+WEBM_OPUS = "webm-opus"
+_FFMPEG_READ_SIZE = 8192
+_STDERR_TAIL_LINES = 20
+
+
+def available_codecs() -> list:
+    codecs = [PCM16]
+    if shutil.which(settings.FFMPEG_BINARY):
+        codecs.append(WEBM_OPUS)
+    return codecs
+
+
+def resolve_codec(name: str = None) -> str:
+    name = name or PCM16
+    if name not in available_codecs():
+        raise ValueError(f"Unsupported codec '{name}'. Available: {', '.join(available_codecs())}")
+    return name
+
+
+class StreamDecoder:
+    """Incremental compressed-audio to pcm16 decoder backed by an ffmpeg subprocess."""
+
+    def __init__(self, input_format: str = "webm"):
+        self.input_format = input_format
+        self._proc = None
+        self._stderr_task = None
+        self._errors = deque(maxlen=_STDERR_TAIL_LINES)
+
+    async def start(self):
+        self._proc = await asyncio.create_subprocess_exec(
+            settings.FFMPEG_BINARY, "-loglevel", "error",
+            "-fflags", "nobuffer", "-flags", "low_delay", "-probesize", "32", "-analyzeduration", "0",
+            "-f", self.input_format, "-i", "pipe:0",
+            "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(settings.SAMPLE_RATE),
+            "-flush_packets", "1", "pipe:1",
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+        self._stderr_task = asyncio.create_task(self._drain_stderr())
+
+    async def _drain_stderr(self):
+        # Read continuously so a chatty ffmpeg never blocks on a full stderr pipe; close() logs the tail
+        async for line in self._proc.stderr:
+            self._errors.append(line)
+
+    async def feed(self, data: bytes):
+        # drain() blocks while ffmpeg's stdin pipe is full, which in turn pauses the websocket read
+        self._proc.stdin.write(data)
+        await self._proc.stdin.drain()
+
+    async def read(self) -> bytes:
+        """Next block of decoded PCM; b"" once the stream has ended."""
+        return await self._proc.stdout.read(_FFMPEG_READ_SIZE)
+
+    async def finish(self):
+        # End of input: ffmpeg flushes what it has buffered, then exits and closes stdout
+        if self._proc is not None and not self._proc.stdin.is_closing():
+            self._proc.stdin.close()
+
+    async def close(self):
+        if self._proc is None:
+            return
+        if self._proc.returncode is None:
+            self._proc.kill()
+        await self._proc.wait()
+        await self._stderr_task
+        errors = b"".join(self._errors)
+        if errors:
+            logger.warning(f"ffmpeg decoder: {errors.decode(errors='replace').strip()[:500]}")
+        self._proc = None
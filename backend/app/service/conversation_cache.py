@@ -0,0 +1,125 @@
+import asyncio
+import json
+from app.core.config import settings, logger
+from app.core.monitoring import metrics
+from app.core.redis_instance import get_redis_client
+
+# Hot conversation window in Redis.
+# Each (user, avatar) conversation keeps its recent history in a Redis list of JSON-encoded
+# messages. Reads are an LRANGE over the requested window; older pages come from MongoDB.
+# Pages are addressed by a cursor counting messages back from the newest one.
+# A window is bounded three ways:
+#   - at most CONVERSATION_HOT_SIZE messages
+#   - at most CONVERSATION_HOT_MAX_BYTES of encoded JSON
+#   - a sliding CONVERSATION_CACHE_TTL, refreshed on every read and append
+# The companion meta hash tracks the encoded size, plus whether older messages exist outside
+# the window ("truncated"). Reads past the end of a truncated window are misses.
+
+_APPEND = """
+if redis.call('exists', KEYS[1]) == 0 then return -1 end
+redis.call('rpush', KEYS[1], ARGV[1])
+local size = redis.call('hincrby', KEYS[2], 'bytes', #ARGV[1])
+local len = redis.call('llen', KEYS[1])
+while len > 1 and (len > tonumber(ARGV[2]) or size > tonumber(ARGV[3])) do
+    local head = redis.call('lpop', KEYS[1])
+    size = redis.call('hincrby', KEYS[2], 'bytes', -#head)
+    redis.call('hset', KEYS[2], 'truncated', 1)
+    len = len - 1
+end
+redis.call('expire', KEYS[1], ARGV[4])
+redis.call('expire', KEYS[2], ARGV[4])
+return len
+"""
+
+def messages_key(user_id, avatar_id) -> str:
+    return f"user:{user_id}:avatar:{avatar_id}:messages"
+
+def meta_key(user_id, avatar_id) -> str:
+    return f"user:{user_id}:avatar:{avatar_id}:meta"
+
+async def append_message(redis_client, user_id, avatar_id, message: dict):
+    # Only appends to a window that is already cached. A cold conversation is rebuilt from
+    # MongoDB on the next read instead, so the list never holds a partial tail of the history.
+    await redis_client.eval(
+        _APPEND, 2, messages_key(user_id, avatar_id), meta_key(user_id, avatar_id), json.dumps(message),
+        settings.CONVERSATION_HOT_SIZE, settings.CONVERSATION_HOT_MAX_BYTES, settings.CONVERSATION_CACHE_TTL,
+    )
+
+async def read_window(redis_client, user_id, avatar_id, limit: int, before: int = 0):
+    # Returns None when the requested window is not covered by the cached list
+    key, meta = messages_key(user_id, avatar_id), meta_key(user_id, avatar_id)
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.llen(key)
+        pipe.hget(meta, "truncated")
+        pipe.lrange(key, -(before + limit), -(before + 1))
+        pipe.expire(key, settings.CONVERSATION_CACHE_TTL)
+        pipe.expire(meta, settings.CONVERSATION_CACHE_TTL)
+        cached_len, truncated, items, _, _ = await pipe.execute()
+    if cached_len == 0 or (before + limit > cached_len and truncated == "1"):
+        metrics.conversation_cache_misses.inc()
+        return None
+    metrics.conversation_cache_hits.inc()
+    return [json.loads(item) for item in items]
+
+async def rebuild(redis_client, user_id, avatar_id, messages: list, total: int):
+    # Replace the cached window with the newest messages that fit both caps; `total` is the
+    # conversation's full length, so the window knows whether older messages exist
+    encoded = [json.dumps(m) for m in messages[-settings.CONVERSATION_HOT_SIZE:]]
+    size = sum(len(item) for item in encoded)
+    while len(encoded) > 1 and size > settings.CONVERSATION_HOT_MAX_BYTES:
+        size -= len(encoded.pop(0))
+    key, meta = messages_key(user_id, avatar_id), meta_key(user_id, avatar_id)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.delete(key, meta)
+        if encoded:
+            pipe.rpush(key, *encoded)
+            pipe.hset(meta, mapping={"bytes": size, "truncated": int(total > len(encoded))})
+            pipe.expire(key, settings.CONVERSATION_CACHE_TTL)
+            pipe.expire(meta, settings.CONVERSATION_CACHE_TTL)
+        await pipe.execute()
+
+async def _sample_memory(redis_client):
+    # Walks the meta hashes with SCAN (incremental, so the server never blocks) and sums the
+    # tracked payload sizes, one pipelined HGET per batch of keys
+    conversations, total_bytes = 0, 0
+    batch = []
+    async for key in redis_client.scan_iter(match="user:*:avatar:*:meta", count=1000):
+        batch.append(key)
+        if len(batch) >= 1000:
+            total_bytes += await _sum_bytes(redis_client, batch)
+            conversations += len(batch)
+            batch = []
+    if batch:
+        total_bytes += await _sum_bytes(redis_client, batch)
+        conversations += len(batch)
+    metrics.conversation_cache_conversations.set(conversations)
+    metrics.conversation_cache_bytes.set(total_bytes)
+
+async def _sum_bytes(redis_client, keys: list) -> int:
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.hget(key, "bytes")
+        return sum(int(size or 0) for size in await pipe.execute())
+
+async def _stats_loop():
+    while True:
+        try:
+            redis_client = await get_redis_client()
+            if redis_client is not None:
+                await _sample_memory(redis_client)
+        except Exception as e:
+            logger.error(f"Conversation cache stats failed: {e}")
+        await asyncio.sleep(settings.CONVERSATION_CACHE_STATS_INTERVAL)
+
+_stats_task = None
+
+def start_cache_stats():
+    global _stats_task
+    if _stats_task is None or _stats_task.done():
+        _stats_task = asyncio.create_task(_stats_loop())
+
+def stop_cache_stats():
+    global _stats_task
+    if _stats_task is not None:
+        _stats_task.cancel()
+        _stats_task = None
@@ -0,0 +1,291 @@
+import asyncio
+import json
+import re
+import time
+import zlib
+from pymongo.errors import BulkWriteError
+from app.core.config import settings, logger
+from app.core.monitoring import metrics
+from app.core.redis_instance import get_redis_client
+from app.service import conversation_cache, conversation_store, retrieval
+from app.service.write_behind import conversation_writer
+
+# Bulk import of historical conversations into one (user, avatar) conversation.
+# The input is consumed as a stream of byte chunks (HTTP body or file), split into lines and parsed
+# incrementally, so memory stays bounded by IMPORT_BATCH_SIZE whatever the archive size:
+#   ndjson   - one {"role", "content"[, "ts"]} object per line
+#   whatsapp - WhatsApp "Export chat" text; messages sent by `avatar_name` become avatar messages
+# Records are validated per batch; each valid batch claims its sequence numbers in one
+# reserve_sequence and is written with a single unordered bulk_write over the touched buckets.
+# Up to IMPORT_MAX_INFLIGHT batches are written while the next one is parsed. Imported messages
+# go after the conversation's existing ones. The Redis hot window is rebuilt once at the end.
+# Bucket updates that fail are retried up to IMPORT_WRITE_ATTEMPTS times with the sequence numbers
+# their batch already reserved, so a transient failure leaves no gap; a gap that remains is
+# reported with its seq range.
+
+FORMATS = ("ndjson", "whatsapp")
+ROLE_ALIASES = {"user": "user", "human": "user", "avatar": "avatar", "assistant": "avatar", "bot": "avatar"}
+
+_WHATSAPP_HEADER = re.compile(
+    r"^\u200e?\[?\d{1,4}[./-]\d{1,2}[./-]\d{1,4},? \d{1,2}:\d{2}(?::\d{2})?(?:\s?[APap]\.?[Mm]\.?)?\]?(?: -)? (?P<rest>.*)$"
+)
+_RETRY_BACKOFF_SECONDS = 0.5
+_WHATSAPP_OMITTED = {"<Media omitted>", "image omitted", "video omitted", "audio omitted", "sticker omitted"}
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+async def gunzip(chunks):
+    # Streaming gzip decoding; max_length bounds the output of any single step
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = decoder.decompress(chunk, settings.IMPORT_MAX_LINE_BYTES)
+        while data:
+            yield data
+            data = decoder.decompress(decoder.unconsumed_tail, settings.IMPORT_MAX_LINE_BYTES)
+    tail = decoder.flush()
+    if tail:
+        yield tail
+
+
+async def iter_lines(chunks):
+    """Yield (line_number, text) per line; text is None for lines that are too long or not UTF-8."""
+    carry = b""
+    number = 0
+    oversized = False
+    async for chunk in chunks:
+        lines = (carry + chunk).split(b"\n")
+        carry = lines.pop()
+        for line in lines:
+            number += 1
+            if oversized:
+                oversized = False
+                yield number, None
+                continue
+            try:
+                yield number, line.rstrip(b"\r").decode("utf-8-sig" if number == 1 else "utf-8")
+            except UnicodeDecodeError:
+                yield number, None
+        if len(carry) > settings.IMPORT_MAX_LINE_BYTES:
+            carry = b""
+            oversized = True  # drop the rest of this line, report it once it ends
+    if carry or oversized:
+        number += 1
+        try:
+            yield number, None if oversized else carry.rstrip(b"\r").decode("utf-8-sig" if number == 1 else "utf-8")
+        except UnicodeDecodeError:
+            yield number, None
+
+
+async def parse_ndjson(lines):
+    async for number, text in lines:
+        if text is None:
+            yield number, "line too long or not UTF-8"
+        elif text.strip():
+            try:
+                yield number, json.loads(text)
+            except ValueError:
+                yield number, "invalid JSON"
+
+
+async def parse_whatsapp(lines, avatar_name: str):
+    # Lines without a timestamp header continue the previous message
+    pending, pending_line = None, 0
+    async for number, text in lines:
+        if text is None:
+            yield number, "line too long or not UTF-8"
+            continue
+        header = _WHATSAPP_HEADER.match(text)
+        if header is None:
+            if pending is not None and len(pending["content"]) < settings.IMPORT_MAX_CONTENT_CHARS:
+                pending["content"] += "\n" + text
+            continue
+        if pending is not None:
+            yield pending_line, pending
+            pending = None
+        sender, separator, content = header.group("rest").partition(": ")
+        if not separator or content.strip() in _WHATSAPP_OMITTED:
+            continue  # system notice ("Messages are end-to-end encrypted") or a media placeholder
+        pending = {"role": "avatar" if sender.strip() == avatar_name else "user", "content": content}
+        pending_line = number
+    if pending is not None:
+        yield pending_line, pending
+
+
+def validate(record) -> dict | str:
+    """Normalise one parsed record into a stored message, or return why it was rejected."""
+    if isinstance(record, str):
+        return record
+    if not isinstance(record, dict):
+        return "not a JSON object"
+    role = ROLE_ALIASES.get(str(record.get("role", "")).lower())
+    if role is None:
+        return f"unknown role {record.get('role')!r}"
+    content = record.get("content")
+    if not isinstance(content, str) or not content.strip():
+        return "missing content"
+    if len(content) > settings.IMPORT_MAX_CONTENT_CHARS:
+        return "content too long"
+    message = {"role": role, "content": content.strip()}
+    ts = record.get("ts")
+    if isinstance(ts, (int, float)) and not isinstance(ts, bool):
+        message["ts"] = ts
+    return message
+
+
+class ConversationImport:
+    def __init__(self, user_id: str, avatar_id, index: bool = False, on_progress=None):
+        self.user_id = user_id
+        self.avatar_id = avatar_id
+        self.index = index
+        self.on_progress = on_progress
+        self.started = time.time()
+        self.lines = 0
+        self.imported = 0
+        self.invalid = 0
+        self.failed = 0
+        self.errors = []
+        self.status = "running"
+        self._inflight = set()
+        self._error = None
+        self._slots = asyncio.Semaphore(settings.IMPORT_MAX_INFLIGHT)
+
+    @property
+    def progress(self) -> dict:
+        elapsed = time.time() - self.started
+        return {
+            "status": self.status,
+            "avatar_id": self.avatar_id,
+            "lines": self.lines,
+            "imported": self.imported,
+            "invalid": self.invalid,
+            "failed": self.failed,
+            "errors": self.errors,
+            "elapsed_seconds": round(elapsed, 2),
+            "messages_per_second": round(self.imported / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+    async def run(self, chunks, format: str = "ndjson", avatar_name: str = None) -> dict:
+        if format not in FORMATS:
+            raise ImportFormatError(f"Unknown format '{format}'. Available: {', '.join(FORMATS)}")
+        if format == "whatsapp" and not avatar_name:
+            raise ImportFormatError("avatar_name is required for WhatsApp exports")
+        lines = self._count_lines(iter_lines(chunks))
+        records = parse_ndjson(lines) if format == "ndjson" else parse_whatsapp(lines, avatar_name)
+        try:
+            batch = []
+            async for number, record in records:
+                batch.append((number, record))
+                if len(batch) >= settings.IMPORT_BATCH_SIZE:
+                    await self._submit(batch)
+                    batch = []
+            if batch:
+                await self._submit(batch)
+            await self._drain()
+            await self._rebuild_hot_window()
+            self.status = "completed"
+        except Exception:
+            self.status = "failed"
+            raise
+        finally:
+            for task in self._inflight:
+                task.cancel()
+            await self._report()
+        logger.info(f"Imported {self.imported} messages into avatar {self.avatar_id} ({self.invalid} invalid, {self.failed} failed)")
+        return self.progress
+
+    async def _count_lines(self, lines):
+        async for number, text in lines:
+            self.lines = number
+            yield number, text
+
+    async def _submit(self, batch: list):
+        if self._error is not None:
+            raise self._error
+        messages = []
+        for number, record in batch:
+            result = validate(record)
+            if isinstance(result, str):
+                self.invalid += 1
+                if len(self.errors) < settings.IMPORT_MAX_ERRORS:
+                    self.errors.append({"line": number, "error": result})
+            else:
+                messages.append(result)
+        metrics.conversation_import_messages.labels(result="invalid").inc(len(batch) - len(messages))
+        if not messages:
+            return
+        # Sequence numbers are claimed here, in input order; the bucket writes may then land in any order
+        first_seq = await conversation_store.reserve_sequence(self.avatar_id, self.user_id, len(messages))
+        await self._slots.acquire()
+        task = asyncio.create_task(self._write(first_seq, messages))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _write(self, first_seq: int, messages: list):
+        try:
+            await self._write_batch(first_seq, messages)
+        except Exception as e:
+            self._error = self._error or e  # raised by the next _submit or by _drain
+        finally:
+            self._slots.release()
+
+    async def _write_batch(self, first_seq: int, messages: list):
+        start = time.perf_counter()
+        pending = conversation_store.bucket_operations(self.avatar_id, self.user_id, first_seq, messages)
+        for attempt in range(1, settings.IMPORT_WRITE_ATTEMPTS + 1):
+            try:
+                await conversation_store.write_buckets([operation for operation, _ in pending])
+                pending = []
+                break
+            except BulkWriteError as e:
+                # ordered=False: every other bucket update was applied; keep only the failed ones
+                write_errors = e.details.get("writeErrors", [])
+                failed_ops = {error["index"] for error in write_errors}
+                pending = [operation for index, operation in enumerate(pending) if index in failed_ops]
+                last_error = write_errors[0].get("errmsg") if write_errors else str(e)
+            if attempt < settings.IMPORT_WRITE_ATTEMPTS:
+                await asyncio.sleep(_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+        failed = sum(len(offsets) for _, offsets in pending)
+        if pending and len(self.errors) < settings.IMPORT_MAX_ERRORS:
+            seqs = [first_seq + offset for _, offsets in pending for offset in offsets]
+            self.errors.append({
+                "line": None,
+                "error": f"{len(pending)} bucket writes failed {settings.IMPORT_WRITE_ATTEMPTS} times, seq {min(seqs)}-{max(seqs)} left empty: {last_error}",
+            })
+        metrics.conversation_import_batch_seconds.observe(time.perf_counter() - start)
+        metrics.conversation_import_messages.labels(result="imported").inc(len(messages) - failed)
+        metrics.conversation_import_messages.labels(result="failed").inc(failed)
+        self.imported += len(messages) - failed
+        self.failed += failed
+        if self.index:
+            await retrieval.index_messages(self.user_id, self.avatar_id, messages)
+        await self._report()
+
+    async def _drain(self):
+        while self._inflight:
+            await asyncio.gather(*list(self._inflight))
+        if self._error is not None:
+            raise self._error
+
+    async def _rebuild_hot_window(self):
+        redis_client = await get_redis_client()
+        if redis_client is None:
+            return
+        await conversation_writer.flush()  # live messages queued during the import land first
+        page = await conversation_store.read_messages(self.avatar_id, self.user_id, settings.CONVERSATION_HOT_SIZE)
+        if page is not None:
+            messages, total = page
+            await conversation_cache.rebuild(redis_client, self.user_id, self.avatar_id, messages, total)
+
+    async def _report(self):
+        if self.on_progress is not None:
+            try:
+                await self.on_progress(self.progress)
+            except Exception as e:
+                logger.warning(f"Import progress report failed: {e}")
+
+
+def status_key(user_id, import_id: str) -> str:
+    return f"user:{user_id}:import:{import_id}"
@@ -0,0 +1,152 @@
+from datetime import datetime
+import bson
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from app.core.config import settings
+from app.db.database import db
+
+# Bucketed conversation storage in MongoDB.
+# avatar_conversations keeps one small metadata document per user/avatar pair holding a
+# message_count sequence. Messages live in avatar_conversation_buckets, CONVERSATION_BUCKET_SIZE
+# per document, keyed by (user_id, avatar_id, bucket). Every message carries its sequence number
+# `seq`; bucket = seq // CONVERSATION_BUCKET_SIZE, so a page of history touches at most a couple of
+# bounded documents. Buckets are also capped by size: each push carries its estimated BSON size
+# and only lands in a bucket part that stays under CONVERSATION_BUCKET_MAX_BYTES; otherwise the
+# upsert collides on the unique key and the push moves on to the next part (bucket, part + 1).
+# Reads fetch every part of the buckets they need, so a few huge messages never push a document
+# towards the 16 MB limit.
+
+META_COLLECTION = "avatar_conversations"
+BUCKETS_COLLECTION = "avatar_conversation_buckets"
+DUPLICATE_KEY = 11000
+
+
+def _meta():
+    return db.mongo_db[META_COLLECTION]
+
+
+def _buckets():
+    return db.mongo_db[BUCKETS_COLLECTION]
+
+
+async def ensure_indexes():
+    await _meta().create_index([("user_id", ASCENDING), ("avatar_id", ASCENDING)], unique=True)
+    await _buckets().create_index(
+        [("user_id", ASCENDING), ("avatar_id", ASCENDING), ("bucket", ASCENDING), ("part", ASCENDING)], unique=True
+    )
+
+
+async def reserve_sequence(avatar_id, user_id: str, count: int, last_updated: datetime = None) -> int:
+    # Atomically claim `count` sequence numbers and return the first one
+    meta = await _meta().find_one_and_update(
+        {"avatar_id": avatar_id, "user_id": user_id},
+        {"$inc": {"message_count": count}, "$set": {"last_updated": last_updated or datetime.utcnow()}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return meta["message_count"] - count
+
+
+def bucket_operations(avatar_id, user_id: str, first_seq: int, messages: list) -> list:
+    """Build the bucket pushes for messages numbered from `first_seq`, one per touched bucket
+    (more if a bucket's messages exceed CONVERSATION_BUCKET_MAX_BYTES), to pass to write_buckets.
+
+    Returns (operation, offsets) pairs, offsets being the indexes into `messages` the operation
+    writes, so a caller can retry exactly the messages of a failed operation. $sort keeps a
+    bucket ordered even when concurrent writers land their pushes out of sequence order.
+    """
+    return sequenced_operations(avatar_id, user_id, [{**message, "seq": first_seq + offset} for offset, message in enumerate(messages)])
+
+
+def sequenced_operations(avatar_id, user_id: str, messages: list) -> list:
+    # Same as bucket_operations, for messages that already carry their `seq` (e.g. a retried batch)
+    size = settings.CONVERSATION_BUCKET_SIZE
+    per_bucket = {}
+    for offset, message in enumerate(messages):
+        per_bucket.setdefault(message["seq"] // size, []).append((offset, message))
+    operations = []
+    for bucket, entries in per_bucket.items():
+        operation = None
+        for offset, message in entries:
+            nbytes = len(bson.encode(message))
+            if operation is None or operation[0]["bytes"] + nbytes > settings.CONVERSATION_BUCKET_MAX_BYTES:
+                operation = ({"user_id": user_id, "avatar_id": avatar_id, "bucket": bucket, "part": 0, "messages": [], "bytes": 0}, [])
+                operations.append(operation)
+            operation[0]["messages"].append(message)
+            operation[0]["bytes"] += nbytes
+            operation[1].append(offset)
+    return operations
+
+
+def _update(operation: dict) -> UpdateOne:
+    # Matches the part only while it has room; a full (or missing) part makes the upsert insert,
+    # which collides with a full part on the unique key
+    return UpdateOne(
+        {
+            "user_id": operation["user_id"], "avatar_id": operation["avatar_id"],
+            "bucket": operation["bucket"], "part": operation["part"],
+            "bytes": {"$lte": settings.CONVERSATION_BUCKET_MAX_BYTES - operation["bytes"]},
+        },
+        {
+            "$push": {"messages": {"$each": operation["messages"], "$sort": {"seq": 1}}},
+            "$inc": {"count": len(operation["messages"]), "bytes": operation["bytes"]},
+        },
+        upsert=True,
+    )
+
+
+async def append_messages(avatar_id, user_id: str, messages: list, last_updated: datetime = None):
+    first_seq = await reserve_sequence(avatar_id, user_id, len(messages), last_updated)
+    operations = bucket_operations(avatar_id, user_id, first_seq, messages)
+    await write_buckets([operation for operation, _ in operations])
+
+
+async def write_buckets(operations: list):
+    """Apply bucket_operations in one unordered bulk_write, moving pushes that found their bucket
+    part full on to the next part. Other failures raise BulkWriteError, with `index` pointing into
+    `operations`."""
+    pending = list(range(len(operations)))
+    failed = []
+    while pending:
+        try:
+            await _buckets().bulk_write([_update(operations[index]) for index in pending], ordered=False)
+            break
+        except BulkWriteError as e:
+            full = []
+            for error in e.details.get("writeErrors", []):
+                index = pending[error["index"]]
+                if error.get("code") == DUPLICATE_KEY:
+                    operations[index]["part"] += 1
+                    full.append(index)
+                else:
+                    failed.append({**error, "index": index})
+            if not full and not failed:
+                raise
+            pending = full
+    if failed:
+        raise BulkWriteError({"writeErrors": failed, "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []})
+
+
+async def read_messages(avatar_id, user_id: str, limit: int, before: int = 0):
+    """Return up to `limit` messages preceding cursor `before` (0 = newest), oldest first,
+    together with the conversation's total message count. Returns None if there is no conversation.
+    """
+    meta = await _meta().find_one({"avatar_id": avatar_id, "user_id": user_id}, {"message_count": 1})
+    if not meta:
+        return None
+    total = meta.get("message_count", 0)
+    end = max(total - before, 0)
+    start = max(end - limit, 0)
+    if start >= end:
+        return [], total
+
+    size = settings.CONVERSATION_BUCKET_SIZE
+    cursor = _buckets().find(
+        {"user_id": user_id, "avatar_id": avatar_id, "bucket": {"$gte": start // size, "$lte": (end - 1) // size}},
+        {"messages": 1},
+    ).sort("bucket", ASCENDING)
+    messages = []
+    async for bucket in cursor:
+        messages.extend(message for message in bucket.get("messages", []) if start <= message["seq"] < end)
+    messages.sort(key=lambda message: message["seq"])  # a bucket split into parts interleaves
+    return [{k: v for k, v in message.items() if k != "seq"} for message in messages], total
@@ -0,0 +1,246 @@
+import asyncio
+from fastapi import WebSocketDisconnect
+from app.core.config import settings, logger
+from app.core.monitoring import metrics
+from app.service.codecs import PCM16, StreamDecoder
+
+# Flow control for /transcription/ws.
+# Each connection reads audio in its own receiver task into a preallocated ring buffer, so a
+# slow decode never leaves bytes piling up unaccounted. When the buffer passes its high
+# watermark, WS_OVERLOAD_POLICY decides what happens:
+#   drop_oldest - overwrite the oldest audio; the session stays live but loses old speech
+#   coalesce    - never drop audio; the processor skips partial results and merges queued chunks
+#                 into fewer, larger decodes, and reading pauses (TCP backpressure) when full
+#   slow_down   - never drop audio; tell the client {"type": "slow_down"}, and {"type": "resume"}
+#                 once drained below the low watermark; reading pauses when full
+# Compressed codecs are decoded to pcm16 before the buffer, so caps and policies count PCM.
+# Admission control caps concurrent sessions per worker process at that process's inference
+# capacity (its own executor and batch scheduler), so the deployment-wide cap scales with workers.
+
+BYTES_PER_SAMPLE = 2
+DECODER_FLUSH_TIMEOUT = 2.0  # seconds ffmpeg gets to emit its buffered audio once the client leaves
+OVERLOAD_POLICIES = ("drop_oldest", "coalesce", "slow_down")
+
+
+class AudioRingBuffer:
+    """Fixed-capacity FIFO of PCM bytes backed by a single preallocated buffer."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity - capacity % BYTES_PER_SAMPLE
+        self._buf = bytearray(self.capacity)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def free(self) -> int:
+        return self.capacity - self._size
+
+    def write(self, data) -> int:
+        """Append data, overwriting the oldest bytes if needed. Returns the number of bytes dropped."""
+        data = memoryview(data)
+        dropped = 0
+        if len(data) > self.capacity:
+            excess = len(data) - self.capacity
+            dropped += excess
+            data = data[excess:]
+        overflow = len(data) - self.free
+        if overflow > 0:
+            dropped += self.skip(overflow + overflow % BYTES_PER_SAMPLE)  # keep sample alignment
+        end = (self._start + self._size) % self.capacity
+        first = min(len(data), self.capacity - end)
+        self._view[end:end + first] = data[:first]
+        self._view[:len(data) - first] = data[first:]
+        self._size += len(data)
+        return dropped
+
+    def read(self, n: int = None) -> bytes:
+        n = self._size if n is None else min(n, self._size)
+        first = min(n, self.capacity - self._start)
+        out = bytes(self._view[self._start:self._start + first]) + bytes(self._view[:n - first])
+        self.skip(n)
+        return out
+
+    def skip(self, n: int) -> int:
+        n = min(n, self._size)
+        self._start = (self._start + n) % self.capacity
+        self._size -= n
+        return n
+
+
+class AudioInlet:
+    """Connects a websocket receiver task to the transcription loop through an AudioRingBuffer."""
+
+    def __init__(self, websocket, policy: str = None, buffer_seconds: float = None, codec: str = PCM16):
+        self.websocket = websocket
+        self.codec = codec
+        self.policy = policy or settings.WS_OVERLOAD_POLICY
+        if self.policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"Unknown overload policy '{self.policy}'. Available: {', '.join(OVERLOAD_POLICIES)}")
+        seconds = buffer_seconds or settings.WS_BUFFER_SECONDS
+        self.ring = AudioRingBuffer(int(settings.SAMPLE_RATE * seconds) * BYTES_PER_SAMPLE)
+        self.high = int(self.ring.capacity * settings.WS_HIGH_WATERMARK)
+        self.low = int(self.ring.capacity * settings.WS_LOW_WATERMARK)
+        self.slowed = False
+        self.closed = False
+        self._data = asyncio.Event()
+        self._space = asyncio.Event()
+        self._carry = b""
+
+    @property
+    def pressured(self) -> bool:
+        return len(self.ring) >= self.high
+
+    async def receive_loop(self):
+        try:
+            if self.codec == PCM16:
+                while True:
+                    await self._put(self._aligned(await self._receive()))
+            else:
+                await self._receive_compressed()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.closed = True
+            self._data.set()
+
+    async def _receive(self) -> bytes:
+        data = await self.websocket.receive_bytes()
+        metrics.ws_received_bytes.labels(codec=self.codec).inc(len(data))
+        return data
+
+    async def _receive_compressed(self):
+        decoder = StreamDecoder()
+        await decoder.start()
+        pump = asyncio.create_task(self._pump(decoder))
+        try:
+            while not pump.done():
+                data = await self._receive()
+                await decoder.feed(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except WebSocketDisconnect:
+            # End of input: ffmpeg flushes the audio it still holds, the pump moves it into the buffer
+            await decoder.finish()
+            try:
+                await asyncio.wait_for(pump, DECODER_FLUSH_TIMEOUT)
+            except (asyncio.TimeoutError, BrokenPipeError, ConnectionResetError):
+                pass
+            raise
+        finally:
+            pump.cancel()
+            await decoder.close()
+        # Still connected but ffmpeg gave up: the client is not sending the codec it negotiated
+        logger.warning(f"Audio decoder stopped for a {self.codec} session")
+        await self._control("error", error=f"Could not decode {self.codec} audio")
+
+    async def _pump(self, decoder: StreamDecoder):
+        while True:
+            pcm = await decoder.read()
+            if not pcm:
+                return
+            await self._put(self._aligned(pcm))
+
+    def _aligned(self, data: bytes) -> bytes:
+        # A sample split across two frames/reads keeps its first byte until the rest arrives
+        data = self._carry + data
+        cut = len(data) - len(data) % BYTES_PER_SAMPLE
+        self._carry = data[cut:]
+        return data[:cut]
+
+    async def _put(self, data: bytes):
+        if self.policy == "drop_oldest":
+            dropped = self.ring.write(data)
+            if dropped:
+                metrics.ws_audio_dropped_seconds.inc(dropped / BYTES_PER_SAMPLE / settings.SAMPLE_RATE)
+        else:
+            # Write what fits and stop reading until the processor makes room for the rest; the
+            # client then sees TCP backpressure. A chunk larger than the whole ring goes in piece by
+            # piece as it drains, so no audio is dropped.
+            view = memoryview(data)
+            while view:
+                while self.ring.free == 0:
+                    self._space.clear()
+                    await self._space.wait()
+                written = min(len(view), self.ring.free)
+                self.ring.write(view[:written])
+                view = view[written:]
+                self._data.set()
+                if self.policy == "slow_down" and not self.slowed and self.pressured:
+                    self.slowed = True
+                    metrics.ws_slow_down_signals.inc()
+                    await self._control("slow_down")
+        self._data.set()
+
+    async def get(self, min_bytes: int = 1, max_bytes: int = None, multiple: int = 1) -> bytes:
+        """Wait for at least min_bytes of audio and take up to max_bytes (all buffered audio by
+        default), rounded down to a multiple of `multiple`.
+
+        Raises WebSocketDisconnect once the client is gone and nothing usable is left.
+        """
+        while len(self.ring) < min_bytes:
+            if self.closed:
+                raise WebSocketDisconnect()
+            self._data.clear()
+            await self._data.wait()
+        available = len(self.ring) if max_bytes is None else min(len(self.ring), max_bytes)
+        data = self.ring.read(available - available % multiple)
+        self._space.set()
+        if self.slowed and len(self.ring) <= self.low:
+            self.slowed = False
+            await self._control("resume")
+        return data
+
+    async def _control(self, kind: str, **fields):
+        seconds = len(self.ring) / BYTES_PER_SAMPLE / settings.SAMPLE_RATE
+        try:
+            await self.websocket.send_json({"type": kind, "buffered_seconds": round(seconds, 2), **fields})
+        except RuntimeError as e:
+            logger.debug(f"Could not send {kind}: {e}")
+
+
+class SessionLimiter:
+    """Caps concurrent transcription sessions in this worker; extra sessions wait in a short queue or are rejected."""
+
+    def __init__(self, limit: int = None, max_waiting: int = None, timeout: float = None):
+        self.limit = limit or settings.WS_MAX_SESSIONS_PER_WORKER or settings.INFERENCE_WORKERS * max(settings.BATCH_MAX_SIZE, 1)
+        self.max_waiting = max_waiting if max_waiting is not None else settings.WS_ADMISSION_QUEUE
+        self.timeout = timeout if timeout is not None else settings.WS_ADMISSION_TIMEOUT
+        self.active = 0
+        self.waiting = 0
+        self._released = asyncio.Condition()
+
+    async def acquire(self, on_queued=None) -> bool:
+        async with self._released:
+            if self.active < self.limit and self.waiting == 0:
+                self._admit()
+                return True
+            if self.waiting >= self.max_waiting:
+                metrics.ws_admission_rejected.inc()
+                return False
+            self.waiting += 1
+            metrics.ws_admission_waiting.set(self.waiting)
+        try:
+            if on_queued is not None:
+                await on_queued(self.waiting)
+            async with self._released:
+                await asyncio.wait_for(self._released.wait_for(lambda: self.active < self.limit), self.timeout)
+                self._admit()
+                return True
+        except asyncio.TimeoutError:
+            metrics.ws_admission_rejected.inc()
+            return False
+        finally:
+            self.waiting -= 1
+            metrics.ws_admission_waiting.set(self.waiting)
+
+    def _admit(self):
+        self.active += 1
+
+    async def release(self):
+        async with self._released:
+            self.active -= 1
+            self._released.notify()
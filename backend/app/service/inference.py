@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.core.config import settings, logger
+from app.core.monitoring import metrics
+
+# Bounded executor for blocking model inference.
+# Jobs run on a small thread pool so the event loop keeps serving HTTP and websockets
+# while Whisper decodes. At most INFERENCE_WORKERS jobs run and INFERENCE_QUEUE_SIZE
+# wait; anything beyond that is rejected immediately instead of piling up latency.
+
+
+class InferenceBusyError(RuntimeError):
+    pass
+
+
+class InferenceTimeoutError(RuntimeError):
+    pass
+
+
+class InferenceExecutor:
+    def __init__(self, initializer=None, workers: int = None, max_queue: int = None, timeout: float = None):
+        self.initializer = initializer
+        self.workers = workers or settings.INFERENCE_WORKERS
+        self.max_queue = max_queue if max_queue is not None else settings.INFERENCE_QUEUE_SIZE
+        self.timeout = timeout or settings.INFERENCE_TIMEOUT
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _ensure_executor(self):
+        if self._executor is None:
+            # initializer runs once per worker thread, e.g. to load a model private to that thread
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="inference",
+                initializer=self.initializer,
+            )
+        return self._executor
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                metrics.inference_rejected.inc()
+                raise InferenceBusyError(f"Inference queue full ({self._pending} jobs pending)")
+            self._pending += 1
+        metrics.inference_queue_depth.inc()
+
+        future = self._ensure_executor().submit(self._run_job, time.perf_counter(), fn, args)
+        future.add_done_callback(self._job_done)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            # A queued job is cancelled; a running one finishes in the background but its slot
+            # stays taken until it does, so a stuck worker still applies backpressure.
+            metrics.inference_timeouts.inc()
+            raise InferenceTimeoutError(f"Inference did not finish within {self.timeout}s")
+
+    async def broadcast(self, fn, *args):
+        # Run fn once on every worker thread, e.g. to load or warm a per-thread model.
+        # The barrier keeps each call on its own thread; if threads cannot all be reached in time
+        # the remaining calls just run wherever they land.
+        barrier = threading.Barrier(self.workers)
+
+        def job():
+            try:
+                barrier.wait(timeout=60)
+            except threading.BrokenBarrierError:
+                pass
+            return fn(*args)
+
+        executor = self._ensure_executor()
+        return await asyncio.gather(*[asyncio.wrap_future(executor.submit(job)) for _ in range(self.workers)])
+
+    def _run_job(self, submitted: float, fn, args):
+        metrics.inference_queue_depth.dec()
+        metrics.inference_queue_wait.observe(time.perf_counter() - submitted)
+        return fn(*args)
+
+    def _job_done(self, future):
+        if future.cancelled():
+            metrics.inference_queue_depth.dec()  # never reached _run_job
+        with self._lock:
+            self._pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            logger.info("Shutting down inference executor")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,211 @@
+import hashlib
+from datetime import datetime
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from app.core.config import settings
+from app.db.database import db
+
+# Content-addressed media storage in GridFS.
+# Blobs are GridFS files keyed by the SHA-256 of their content (metadata.sha256, unique) and carry
+# a reference count. What a user uploads to an avatar is a lightweight document in media_refs
+# pointing at a blob, so the same photo uploaded to several avatars is stored once. Blobs are
+# written MEDIA_CHUNK_SIZE bytes at a time, so memory per upload stays constant, and downloads
+# read only the chunks covering the requested byte range.
+# A blob whose refcount reached zero is dead: acquire_blob never revives it and whoever finds it
+# (release_blob, or an upload colliding with it on the sha256 key) deletes it, after which the
+# upload is retried as a new blob.
+
+REFS_COLLECTION = "media_refs"
+_STORE_ATTEMPTS = 3
+
+_bucket = None
+
+def get_bucket() -> AsyncIOMotorGridFSBucket:
+    global _bucket
+    if _bucket is None:
+        _bucket = AsyncIOMotorGridFSBucket(
+            db.mongo_db, bucket_name=settings.MEDIA_BUCKET, chunk_size_bytes=settings.MEDIA_CHUNK_SIZE
+        )
+    return _bucket
+
+def files_collection():
+    return db.mongo_db[f"{settings.MEDIA_BUCKET}.files"]
+
+def chunks_collection():
+    return db.mongo_db[f"{settings.MEDIA_BUCKET}.chunks"]
+
+def refs_collection():
+    return db.mongo_db[REFS_COLLECTION]
+
+async def ensure_indexes():
+    await files_collection().create_index(
+        "metadata.sha256", unique=True, partialFilterExpression={"metadata.sha256": {"$exists": True}}
+    )
+    await refs_collection().create_index([("user_id", ASCENDING), ("avatar_id", ASCENDING)])
+    await refs_collection().create_index("sha256")
+
+def parse_object_id(file_id: str):
+    try:
+        return ObjectId(file_id)
+    except (InvalidId, TypeError):
+        return None
+
+async def hash_upload(upload) -> tuple[str, int]:
+    # The request body is already spooled locally by Starlette; hashing it first means a duplicate
+    # never touches MongoDB. The file is rewound for the upload pass.
+    digest = hashlib.sha256()
+    length = 0
+    while True:
+        chunk = await upload.read(settings.MEDIA_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        length += len(chunk)
+    await upload.seek(0)
+    return digest.hexdigest(), length
+
+async def acquire_blob(sha256: str):
+    # Take a reference on an existing blob; a blob whose count already dropped to zero is being
+    # deleted and is not resurrected
+    return await files_collection().find_one_and_update(
+        {"metadata.sha256": sha256, "metadata.refcount": {"$gt": 0}},
+        {"$inc": {"metadata.refcount": 1}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+async def write_blob(sha256: str, content_type: str, chunks):
+    """Store a new blob from an async iterator of byte chunks, holding one reference.
+
+    Returns (blob_id, created). If a concurrent upload stored the same content first, the copy
+    just written is discarded and a reference on the existing blob is taken instead. If that blob
+    is being deleted, it is removed and (None, False) is returned so the caller can upload again.
+    """
+    metadata = {"sha256": sha256, "refcount": 1, "content_type": content_type}
+    grid_in = get_bucket().open_upload_stream(sha256, metadata=metadata)
+    try:
+        async for chunk in chunks:
+            await grid_in.write(chunk)
+    except BaseException:
+        await grid_in.abort()
+        raise
+    try:
+        await grid_in.close()
+        return grid_in._id, True
+    except DuplicateKeyError:
+        await chunks_collection().delete_many({"files_id": grid_in._id})
+        existing = await acquire_blob(sha256)
+        if existing is not None:
+            return existing["_id"], False
+        dead = await files_collection().find_one({"metadata.sha256": sha256}, {"_id": 1})
+        if dead is not None:
+            await _delete_dead_blob(dead["_id"])
+        return None, False
+
+async def store_blob(sha256: str, content_type: str, open_chunks):
+    """Take a reference on the blob holding this content, uploading it if there is none.
+
+    `open_chunks()` returns a fresh async iterator over the content; it is called again when the
+    upload collides with an identical blob that is being deleted. Returns (blob_id, created).
+    """
+    for _ in range(_STORE_ATTEMPTS):
+        blob = await acquire_blob(sha256)
+        if blob is not None:
+            return blob["_id"], False
+        blob_id, created = await write_blob(sha256, content_type, open_chunks())
+        if blob_id is not None:
+            return blob_id, created
+    raise RuntimeError(f"Could not store blob {sha256}: an identical blob kept being deleted")
+
+async def _delete_dead_blob(blob_id):
+    # Only a blob nobody references; acquire_blob cannot revive it, so this cannot race with one
+    deleted = await files_collection().delete_one({"_id": blob_id, "metadata.refcount": {"$lte": 0}})
+    if deleted.deleted_count:
+        await chunks_collection().delete_many({"files_id": blob_id})
+
+async def release_blob(blob_id):
+    blob = await files_collection().find_one_and_update(
+        {"_id": blob_id}, {"$inc": {"metadata.refcount": -1}}, return_document=ReturnDocument.AFTER
+    )
+    if blob is not None and blob["metadata"]["refcount"] <= 0:
+        await _delete_dead_blob(blob_id)
+
+async def _read_chunks(upload):
+    await upload.seek(0)
+    while True:
+        chunk = await upload.read(settings.MEDIA_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+async def create_ref(blob_id, sha256: str, length: int, filename: str, content_type: str, user_id, avatar_id, **extra) -> dict:
+    ref = {
+        "user_id": user_id,
+        "avatar_id": avatar_id,
+        "blob_id": blob_id,
+        "sha256": sha256,
+        "filename": filename,
+        "content_type": content_type,
+        "length": length,
+        "created_at": datetime.utcnow(),
+        **extra,
+    }
+    result = await refs_collection().insert_one(ref)
+    ref["_id"] = result.inserted_id
+    return ref
+
+async def save_upload(upload, user_id: str, avatar_id: str) -> dict:
+    sha256, length = await hash_upload(upload)
+    blob_id, created = await store_blob(sha256, upload.content_type, lambda: _read_chunks(upload))
+    ref = await create_ref(blob_id, sha256, length, upload.filename, upload.content_type, user_id, avatar_id)
+    return {
+        "id": str(ref["_id"]),
+        "filename": upload.filename,
+        "length": length,
+        "sha256": sha256,
+        "deduplicated": not created,
+    }
+
+async def find_file(ref_id: str, user_id: str):
+    oid = parse_object_id(ref_id)
+    if oid is None:
+        return None
+    return await refs_collection().find_one({"_id": oid, "user_id": user_id})
+
+async def delete_ref(ref_id: str, user_id: str) -> bool:
+    oid = parse_object_id(ref_id)
+    if oid is None:
+        return False
+    ref = await refs_collection().find_one_and_delete({"_id": oid, "user_id": user_id})
+    if ref is None:
+        return False
+    await release_blob(ref["blob_id"])
+    return True
+
+async def set_transcription(ref_id: str, **fields):
+    # Offline transcription state on the reference: job_id, model, status, error
+    await refs_collection().update_one(
+        {"_id": parse_object_id(ref_id)}, {"$set": {f"transcription.{key}": value for key, value in fields.items()}}
+    )
+
+async def set_transcript(ref_id: str, transcript: dict):
+    await refs_collection().update_one({"_id": parse_object_id(ref_id)}, {"$set": {"transcript": transcript}})
+
+async def find_transcript(sha256: str, model: str):
+    # Any reference to the same content already transcribed with this model
+    ref = await refs_collection().find_one({"sha256": sha256, "transcript.model": model}, {"transcript": 1})
+    return ref["transcript"] if ref else None
+
+async def stream_range(blob_id, start: int, end: int):
+    # Yields bytes [start, end] (inclusive), one GridFS chunk at a time
+    grid_out = await get_bucket().open_download_stream(blob_id)
+    grid_out.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        data = await grid_out.read(min(settings.MEDIA_CHUNK_SIZE, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield data
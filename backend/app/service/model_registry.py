@@ -0,0 +1,75 @@
+import threading
+import time
+import numpy as np
+from app.core.config import settings, logger
+from app.core.monitoring import metrics
+
+# Lazy Whisper model registry.
+# Nothing heavy is imported or loaded until a model is first needed (or warmed up at startup),
+# so importing the app, running tests or starting a worker that never transcribes stays cheap.
+# Whisper installs kv-cache hooks on the model while decoding, so an instance must not be used
+# by two threads at once: each inference worker thread holds its own copy of a size, and every
+# session routed to that worker shares it.
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._device = None
+        self.stats = {}
+        self.ready = False
+
+    @property
+    def device(self) -> str:
+        if self._device is None:
+            if settings.DEVICE != "auto":
+                self._device = settings.DEVICE
+            else:
+                import torch
+                self._device = "cuda" if torch.cuda.is_available() else "cpu"
+        return self._device
+
+    def resolve(self, name: str = None) -> str:
+        name = name or settings.WHISPER_DEFAULT_MODEL
+        if name not in settings.WHISPER_MODELS:
+            raise ValueError(f"Unknown model '{name}', expected one of {settings.WHISPER_MODELS}")
+        return name
+
+    def get(self, name: str = None):
+        # Must be called from the inference worker thread that will use the model
+        name = self.resolve(name)
+        models = getattr(self._local, "models", None)
+        if models is None:
+            models = self._local.models = {}
+        if name not in models:
+            models[name] = self._load(name)
+        return models[name]
+
+    def _load(self, name: str):
+        import whisper
+        start = time.perf_counter()
+        model = whisper.load_model(name, device=self.device)
+        elapsed = time.perf_counter() - start
+        nbytes = sum(p.numel() * p.element_size() for p in model.parameters())
+        with self._lock:
+            entry = self.stats.setdefault(name, {"instances": 0, "load_seconds": 0.0, "bytes": 0})
+            entry["instances"] += 1
+            entry["load_seconds"] = round(elapsed, 3)
+            entry["bytes"] += nbytes
+        metrics.whisper_model_load_seconds.labels(model=name).set(elapsed)
+        metrics.whisper_model_memory_bytes.labels(model=name).inc(nbytes)
+        logger.info(f"Whisper '{name}' loaded on {self.device} in {threading.current_thread().name}: {elapsed:.2f}s, {nbytes / 2**20:.0f} MiB")
+        return model
+
+    def warmup(self, name: str = None):
+        # Load the model and run one short decode so the first real request skips lazy init
+        model = self.get(name)
+        model.transcribe(np.zeros(settings.SAMPLE_RATE, dtype=np.float32), language="en", fp16=self.device == "cuda")
+
+    def set_ready(self, ready: bool):
+        self.ready = ready
+        metrics.whisper_models_ready.set(1 if ready else 0)
+
+
+model_registry = ModelRegistry()
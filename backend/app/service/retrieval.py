@@ -0,0 +1,289 @@
+import asyncio
+import fcntl
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+from app.core.config import settings, logger
+from app.core.monitoring import metrics
+from app.core.ttl_cache import TTLCache
+
+# Per-avatar retrieval index over chat messages and uploaded text documents.
+# Each (user, avatar) index is a directory under RETRIEVAL_INDEX_DIR:
+#   docs.jsonl   - one snippet per line: {"text", "source", "ref", "ts"}
+#   vectors.f32  - row i is the L2-normalised embedding of snippet i, read through np.memmap
+#   meta.json    - embedding model and dimension; vectors are re-embedded if either changes
+# Appends take an exclusive flock, so several worker processes can share one index; readers
+# notice growth from the file sizes and remap. Queries score every snippet in one matrix-vector
+# product (cosine) blended with BM25, so keyword matches still rank when embeddings are weak.
+# Embeddings come from a local sentence-transformers model when RETRIEVAL_EMBEDDING_MODEL is set
+# (imported lazily, CPU), otherwise from a dependency-free feature-hashing embedder.
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def split_passages(text: str, size: int = None) -> list:
+    # Paragraph-aware chunking: paragraphs are packed up to `size` chars, long ones are cut
+    size = size or settings.RETRIEVAL_PASSAGE_CHARS
+    passages, current = [], ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        while len(paragraph) > size:
+            cut = paragraph.rfind(" ", 0, size)
+            cut = cut if cut > size // 2 else size
+            passages.append(paragraph[:cut])
+            paragraph = paragraph[cut:].strip()
+        if current and len(current) + len(paragraph) + 1 > size:
+            passages.append(current)
+            current = ""
+        current = f"{current} {paragraph}".strip()
+    if current:
+        passages.append(current)
+    return passages
+
+
+class HashingEmbedder:
+    """Signed feature hashing of unigrams and bigrams; needs no model download."""
+
+    name = "hashing"
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def encode(self, texts: list) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+                out[row, digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        return _normalize(out)
+
+
+class SentenceEmbedder:
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.name = model_name
+        self._model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self._model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: list) -> np.ndarray:
+        return _normalize(self._model.encode(texts, batch_size=32, convert_to_numpy=True).astype(np.float32))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def get_embedder():
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            if settings.RETRIEVAL_EMBEDDING_MODEL:
+                try:
+                    _embedder = SentenceEmbedder(settings.RETRIEVAL_EMBEDDING_MODEL)
+                except Exception as e:
+                    logger.error(f"Could not load embedding model {settings.RETRIEVAL_EMBEDDING_MODEL}, using hashing embedder: {e}")
+            if _embedder is None:
+                _embedder = HashingEmbedder(settings.RETRIEVAL_HASH_DIM)
+            logger.info(f"Retrieval embedder: {_embedder.name} ({_embedder.dim} dims)")
+        return _embedder
+
+
+class AvatarIndex:
+    def __init__(self, path: Path, embedder):
+        self.path = path
+        self.embedder = embedder
+        self.docs_path = path / "docs.jsonl"
+        self.vectors_path = path / "vectors.f32"
+        self.lock = threading.Lock()
+        self.docs = []
+        self.vectors = np.zeros((0, embedder.dim), dtype=np.float32)
+        self._docs_offset = 0
+        self._term_postings = {}  # term -> (doc indices, term frequencies)
+        self._doc_lengths = []
+        path.mkdir(parents=True, exist_ok=True)
+        self._check_meta()
+        self.refresh()
+
+    def _check_meta(self):
+        meta_path = self.path / "meta.json"
+        meta = {"model": self.embedder.name, "dim": self.embedder.dim}
+        with open(self.path / ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            stored = json.loads(meta_path.read_text()) if meta_path.exists() else None
+            if stored != meta:
+                if stored is not None and self.docs_path.exists():
+                    # Embedding model changed: re-embed every stored snippet
+                    texts = [json.loads(line)["text"] for line in self.docs_path.read_text().splitlines() if line]
+                    vectors = self.embedder.encode(texts) if texts else np.zeros((0, self.embedder.dim), np.float32)
+                    vectors.astype(np.float32).tofile(self.vectors_path)
+                    logger.info(f"Re-embedded {len(texts)} snippets in {self.path} for {meta}")
+                meta_path.write_text(json.dumps(meta))
+
+    def refresh(self):
+        """Pick up snippets appended by this or another process since the last call."""
+        if not self.docs_path.exists():
+            return
+        with open(self.docs_path, "rb") as f:
+            f.seek(self._docs_offset)
+            data = f.read()
+        complete = data[:data.rfind(b"\n") + 1]  # ignore a line still being written
+        self._docs_offset += len(complete)
+        for line in complete.splitlines():
+            self._add_terms(json.loads(line))
+        rows = self.vectors_path.stat().st_size // (4 * self.embedder.dim) if self.vectors_path.exists() else 0
+        rows = min(rows, len(self.docs))
+        if rows != len(self.vectors):
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.embedder.dim)) if rows else self.vectors[:0]
+
+    def _add_terms(self, doc: dict):
+        index = len(self.docs)
+        self.docs.append(doc)
+        counts = Counter(tokenize(doc["text"]))
+        self._doc_lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            postings = self._term_postings.setdefault(term, ([], []))
+            postings[0].append(index)
+            postings[1].append(tf)
+
+    def add(self, snippets: list):
+        vectors = self.embedder.encode([s["text"] for s in snippets]).astype(np.float32)
+        lines = b"".join(json.dumps(s).encode() + b"\n" for s in snippets)
+        with open(self.path / ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Vectors first: a reader never sees a snippet without its vector row
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self.docs_path, "ab") as f:
+                f.write(lines)
+        self.refresh()
+
+    def bm25(self, terms: list) -> np.ndarray:
+        n = len(self.vectors)
+        scores = np.zeros(n, dtype=np.float32)
+        if n == 0:
+            return scores
+        lengths = np.asarray(self._doc_lengths[:n], dtype=np.float32)
+        avg_length = max(float(lengths.mean()), 1.0)
+        for term in set(terms):
+            postings = self._term_postings.get(term)
+            if not postings:
+                continue
+            docs = np.asarray(postings[0])
+            tfs = np.asarray(postings[1], dtype=np.float32)
+            keep = docs < n
+            docs, tfs = docs[keep], tfs[keep]
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = tfs + BM25_K1 * (1 - BM25_B + BM25_B * lengths[docs] / avg_length)
+            scores[docs] += idf * tfs * (BM25_K1 + 1) / norm
+        return scores
+
+    def search(self, query: str, k: int) -> list:
+        n = len(self.vectors)
+        if n == 0:
+            return []
+        keyword = self.bm25(tokenize(query))
+        if keyword.max() > 0:
+            keyword /= keyword.max()
+        semantic = self.vectors @ self.embedder.encode([query])[0]
+        weight = settings.RETRIEVAL_VECTOR_WEIGHT
+        scores = weight * semantic + (1 - weight) * keyword
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {**self.docs[i], "score": round(float(scores[i]), 4), "semantic": round(float(semantic[i]), 4), "keyword": round(float(keyword[i]), 4)}
+            for i in top
+        ]
+
+
+# Open indexes, bounded so idle avatars release their memory maps
+_indexes = TTLCache(settings.RETRIEVAL_OPEN_INDEXES, settings.RETRIEVAL_INDEX_IDLE_SECONDS)
+_indexes_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=settings.RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
+def _index_path(user_id, avatar_id) -> Path:
+    # The ids become path components: anything that would land outside RETRIEVAL_INDEX_DIR/<user>/ is refused
+    root = Path(settings.RETRIEVAL_INDEX_DIR).resolve()
+    path = (root / str(user_id) / str(avatar_id)).resolve()
+    if not path.is_relative_to(root) or path.parent.parent != root:
+        raise ValueError(f"Invalid retrieval index path for avatar {avatar_id!r}")
+    return path
+
+def _get_index(user_id, avatar_id) -> AvatarIndex:
+    key = (str(user_id), str(avatar_id))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = AvatarIndex(_index_path(*key), get_embedder())
+            _indexes.set(key, index)
+        return index
+
+def _add_blocking(user_id, avatar_id, snippets: list):
+    index = _get_index(user_id, avatar_id)
+    with index.lock:
+        index.add(snippets)
+
+def _search_blocking(user_id, avatar_id, query: str, k: int) -> list:
+    if not _index_path(user_id, avatar_id).exists():
+        return []  # nothing indexed yet; don't create an empty index just to search it
+    index = _get_index(user_id, avatar_id)
+    with index.lock:
+        index.refresh()
+        return index.search(query, k)
+
+async def _run(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+async def _index(user_id, avatar_id, snippets: list, source: str):
+    # Called from FastAPI background tasks, after the response is sent
+    try:
+        await _run(_add_blocking, user_id, avatar_id, snippets)
+        metrics.retrieval_snippets_indexed.labels(source=source).inc(len(snippets))
+    except Exception as e:
+        logger.error(f"Retrieval indexing failed for avatar {avatar_id}: {e}")
+
+async def index_message(user_id, avatar_id, message: dict):
+    await index_messages(user_id, avatar_id, [message])
+
+async def index_messages(user_id, avatar_id, messages: list):
+    now = time.time()
+    snippets = [
+        {"text": m["content"].strip(), "source": "message", "ref": m.get("role"), "ts": m.get("ts", now)}
+        for m in messages if m.get("content", "").strip()
+    ]
+    if snippets:
+        await _index(user_id, avatar_id, snippets, "message")
+
+async def index_document(user_id, avatar_id, filename: str, text: str, ref_id: str):
+    now = time.time()
+    snippets = [{"text": passage, "source": "document", "ref": ref_id, "filename": filename, "ts": now} for passage in split_passages(text)]
+    if snippets:
+        await _index(user_id, avatar_id, snippets, "document")
+
+async def search(user_id, avatar_id, query: str, k: int) -> list:
+    start = time.perf_counter()
+    try:
+        return await _run(_search_blocking, user_id, avatar_id, query, k)
+    finally:
+        metrics.retrieval_query_seconds.observe(time.perf_counter() - start)
+
+def shutdown_retrieval():
+    _executor.shutdown(wait=True)
@@ -0,0 +1,119 @@
+from collections import deque
+import numpy as np
+from app.core.config import settings
+
+# Streaming segmentation for /transcription/ws.
+# Raw 16-bit mono PCM is cut into short VAD frames. Silent frames are dropped before
+# they ever reach Whisper; speech frames grow the current segment, which is decoded
+# as a partial hypothesis every PARTIAL_INTERVAL_MS and finalized at a speech pause.
+
+BYTES_PER_SAMPLE = 2
+
+
+class EnergyVAD:
+    """Energy based voice activity detector with an adaptive noise floor."""
+
+    def __init__(self, threshold: float = None, noise_ratio: float = None):
+        self.threshold = threshold if threshold is not None else settings.VAD_ENERGY_THRESHOLD
+        self.noise_ratio = noise_ratio if noise_ratio is not None else settings.VAD_NOISE_RATIO
+        self.noise_floor = self.threshold / self.noise_ratio
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        rms = float(np.sqrt(np.mean(np.square(frame, dtype=np.float32))))
+        speech = rms > max(self.threshold, self.noise_floor * self.noise_ratio)
+        if not speech:
+            # Track background noise slowly so a noisy room does not read as constant speech
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+        return speech
+
+
+class StreamingSegmenter:
+    """Turns an incoming PCM byte stream into ("partial" | "final", pcm_bytes) events."""
+
+    def __init__(self, sample_rate: int = None, vad: EnergyVAD = None):
+        self.sample_rate = sample_rate or settings.SAMPLE_RATE
+        self.vad = vad or EnergyVAD()
+        self.frame_bytes = self.sample_rate * settings.VAD_FRAME_MS // 1000 * BYTES_PER_SAMPLE
+        self.preroll_frames = max(1, settings.VAD_PREROLL_MS // settings.VAD_FRAME_MS)
+        self.end_silence_frames = max(1, settings.VAD_END_SILENCE_MS // settings.VAD_FRAME_MS)
+        self.min_speech_frames = max(1, settings.VAD_MIN_SPEECH_MS // settings.VAD_FRAME_MS)
+        self.partial_interval_frames = max(1, settings.PARTIAL_INTERVAL_MS // settings.VAD_FRAME_MS)
+        self.max_segment_frames = settings.MAX_SEGMENT_DURATION * 1000 // settings.VAD_FRAME_MS
+
+        self._pending = bytearray()
+        self._preroll = deque(maxlen=self.preroll_frames)
+        self._segment = bytearray()
+        self._segment_frames = 0
+        self._speech_frames = 0
+        self._silence_run = 0
+        self._frames_since_partial = 0
+        self.skipped_seconds = 0.0
+
+    @property
+    def in_speech(self) -> bool:
+        return self._segment_frames > 0
+
+    def feed(self, data: bytes) -> list:
+        """Consume PCM bytes and return the events they complete.
+
+        At most one partial is returned per call; a stale partial is never worth decoding
+        once newer audio is available.
+        """
+        self._pending.extend(data)
+        events = []
+        partial_due = False
+        usable = len(self._pending) - len(self._pending) % self.frame_bytes
+        raw = bytes(self._pending[:usable])
+        del self._pending[:usable]
+        samples = np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
+        frame_samples = self.frame_bytes // BYTES_PER_SAMPLE
+        for offset in range(0, usable, self.frame_bytes):
+            frame_bytes = raw[offset:offset + self.frame_bytes]
+            start = offset // BYTES_PER_SAMPLE
+            frame = samples[start:start + frame_samples]
+            speech = self.vad.is_speech(frame)
+
+            if not self.in_speech:
+                if speech:
+                    for buffered in self._preroll:
+                        self._append(buffered, speech=False)
+                    self._preroll.clear()
+                    self._append(frame_bytes, speech=True)
+                else:
+                    if len(self._preroll) == self._preroll.maxlen:
+                        self.skipped_seconds += settings.VAD_FRAME_MS / 1000
+                    self._preroll.append(frame_bytes)
+                continue
+
+            self._append(frame_bytes, speech=speech)
+            if self._silence_run >= self.end_silence_frames or self._segment_frames >= self.max_segment_frames:
+                final = self._finalize()
+                if final is not None:
+                    events.append(("final", final))
+                partial_due = False
+            elif self._frames_since_partial >= self.partial_interval_frames and self._speech_frames >= self.min_speech_frames:
+                self._frames_since_partial = 0
+                partial_due = True
+
+        if partial_due and self.in_speech:
+            events.append(("partial", bytes(self._segment)))
+        return events
+
+    def _append(self, frame_bytes, speech: bool):
+        self._segment.extend(frame_bytes)
+        self._segment_frames += 1
+        self._frames_since_partial += 1
+        if speech:
+            self._speech_frames += 1
+            self._silence_run = 0
+        else:
+            self._silence_run += 1
+
+    def _finalize(self):
+        segment = bytes(self._segment) if self._speech_frames >= self.min_speech_frames else None
+        self._segment = bytearray()
+        self._segment_frames = 0
+        self._speech_frames = 0
+        self._silence_run = 0
+        self._frames_since_partial = 0
+        return segment
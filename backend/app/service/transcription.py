@@ -1,47 +1,115 @@
+import asyncio
+import time
+from functools import partial
 import numpy as np
-import tempfile
-import wave
-import soundfile as sf
-import torch
-import whisper
 from ..core.config import settings
+from ..core.monitoring import metrics
+from .inference import InferenceExecutor
+from .batching import BatchScheduler
+from .model_registry import model_registry
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Initialize Whisper model
-model = whisper.load_model("base", device=settings.DEVICE)
-
-async def transcribe_audio(audio_data: bytes) -> dict:
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmpfile:
-        with wave.open(tmpfile.name, "wb") as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)  # 16-bit
-            wf.setframerate(settings.SAMPLE_RATE)
-            wf.writeframes(audio_data)
-
-        try:
-            data, samplerate = sf.read(tmpfile.name)
-            duration = len(data) / samplerate
-            amplitude = float(np.max(np.abs(data)))
-            logger.info(f"Audio duration: {duration:.2f} sec, Max amplitude: {amplitude}")
-        except Exception as e:
-            logger.error(f"Error loading audio: {e}")
-            return {"error": str(e)}
-
-        logger.info(f"Transcribing {tmpfile.name}")
-        result = model.transcribe(tmpfile.name, language="en", fp16=settings.DEVICE == "cuda")
-        transcript = result.get("text", "").strip()
-        segments = result.get("segments", [])
-        confidence = segments[0].get("no_speech_prob", 0.0) if segments else 0.0
-        avg_logprob = segments[0].get("avg_logprob", 0.0) if segments else 0.0
-
-        logger.info(f"Transcript: {transcript}, Confidence: {confidence}, Logprob: {avg_logprob}")
-
-        return {
-            "transcript": transcript,
-            "duration": duration,
-            "amplitude": amplitude,
-            "no_speech_prob": confidence,
-            "avg_logprob": avg_logprob,
-        }
\ No newline at end of file
+# torch and whisper are imported inside the worker functions so importing this module stays cheap
+WHISPER_WINDOW_SECONDS = 30
+
+def _transcribe_blocking(model_name: str, audio: np.ndarray) -> dict:
+    model = model_registry.get(model_name)
+    return model.transcribe(audio, language="en", fp16=model_registry.device == "cuda")
+
+def decode_batch(model_name: str, batch: list) -> list:
+    # One padded forward pass for every chunk in the batch: each clip is padded to Whisper's
+    # 30 s window, the mels are stacked and decoded together. Blocking: run it on an inference
+    # thread (the live BatchScheduler and the offline TranscriptionWorker both do).
+    import torch
+    import whisper
+    model = model_registry.get(model_name)
+    mels = torch.stack([
+        whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(audio)), model.dims.n_mels)
+        for audio in batch
+    ]).to(model.device)
+    options = whisper.DecodingOptions(language="en", fp16=model_registry.device == "cuda", without_timestamps=True)
+    results = whisper.decode(model, mels, options)
+    return [
+        {"text": r.text, "segments": [{"no_speech_prob": r.no_speech_prob, "avg_logprob": r.avg_logprob}]}
+        for r in results
+    ]
+
+inference_executor = InferenceExecutor()
+# Batches must not mix model sizes, so there is one scheduler per model name
+batch_schedulers = {}
+
+def get_batch_scheduler(model_name: str) -> BatchScheduler:
+    if model_name not in batch_schedulers:
+        batch_schedulers[model_name] = BatchScheduler(inference_executor, partial(decode_batch, model_name))
+    return batch_schedulers[model_name]
+
+async def warmup_models():
+    model_registry.set_ready(False)
+    try:
+        for name in settings.WHISPER_WARMUP_MODELS:
+            await inference_executor.broadcast(model_registry.warmup, name)
+        model_registry.set_ready(True)
+        logger.info(f"Whisper warmup complete: {model_registry.stats}")
+    except Exception as e:
+        logger.error(f"Whisper warmup failed: {e}")
+
+_warmup_task = None
+
+def start_warmup():
+    # Fire and forget from startup; readiness stays false until the task finishes
+    global _warmup_task
+    if _warmup_task is None or _warmup_task.done():
+        _warmup_task = asyncio.create_task(warmup_models())
+    return _warmup_task
+
+def shutdown_inference():
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+    for scheduler in batch_schedulers.values():
+        scheduler.shutdown()
+    inference_executor.shutdown()
+
+def pcm16_to_float32(audio_data: bytes) -> np.ndarray:
+    # Whisper expects mono float32 in [-1, 1] at 16 kHz; view the int16 PCM in place and scale once
+    return np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32768.0
+
+async def transcribe_audio(audio_data: bytes, model_name: str = None) -> dict:
+    model_name = model_registry.resolve(model_name)
+    try:
+        with metrics.transcription_stage_seconds.labels(stage="decode").time():
+            audio = pcm16_to_float32(audio_data)
+        duration = len(audio) / settings.SAMPLE_RATE
+        amplitude = float(np.max(np.abs(audio))) if audio.size else 0.0
+        logger.info(f"Audio duration: {duration:.2f} sec, Max amplitude: {amplitude}")
+    except Exception as e:
+        logger.error(f"Error loading audio: {e}")
+        return {"error": str(e)}
+
+    # Raises InferenceBusyError / InferenceTimeoutError; callers decide how to tell the client.
+    # Inference time includes the queue wait, so the RTF is what a client actually experiences
+    start = time.perf_counter()
+    if settings.BATCH_MAX_SIZE > 1 and duration <= WHISPER_WINDOW_SECONDS:
+        result = await get_batch_scheduler(model_name).submit(audio)
+    else:
+        result = await inference_executor.run(partial(_transcribe_blocking, model_name), audio)
+    elapsed = time.perf_counter() - start
+    metrics.transcription_stage_seconds.labels(stage="inference").observe(elapsed)
+    if duration > 0:
+        metrics.transcription_rtf.labels(model=model_name).set(elapsed / duration)
+    transcript = result.get("text", "").strip()
+    segments = result.get("segments", [])
+    confidence = segments[0].get("no_speech_prob", 0.0) if segments else 0.0
+    avg_logprob = segments[0].get("avg_logprob", 0.0) if segments else 0.0
+
+    logger.info(f"Transcript: {transcript}, Confidence: {confidence}, Logprob: {avg_logprob}")
+
+    return {
+        "transcript": transcript,
+        "duration": duration,
+        "amplitude": amplitude,
+        "no_speech_prob": confidence,
+        "avg_logprob": avg_logprob,
+        "model": model_name,
+    }
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import time
+from uuid import uuid4
+from app.core.config import settings, logger
+from app.core.redis_instance import get_redis_client
+
+# Offline transcription jobs for uploaded audio.
+# The API enqueues a job by creating its state hash (transcription:job:{id}) and appending its id to
+# the JOBS_STREAM Redis stream. Worker processes (app.service.transcription_worker) read the stream
+# through the JOBS_GROUP consumer group, so each job goes to exactly one of them; add processes to
+# drain a backlog faster. A job a crashed worker left pending is claimed by another worker once it
+# has gone TRANSCRIPTION_JOB_CLAIM_IDLE_SECONDS without a heartbeat.
+# Every state change is written to the hash and published in full on the job's events channel,
+# so clients can poll the hash or follow the channel (server-sent events).
+# Followers do not hold Redis connections: each process keeps one pattern subscription to every
+# job's events channel and fans messages out to its local followers, at most
+# TRANSCRIPTION_EVENTS_MAX_FOLLOWERS of them.
+
+JOBS_STREAM = "transcription:jobs"
+JOBS_GROUP = "transcription-workers"
+TERMINAL_STATUSES = ("completed", "failed")
+AUDIO_CONTENT_TYPES = ("audio/", "video/")
+EVENTS_PATTERN = "transcription:job:*:events"
+_NUMERIC_FIELDS = {"segments_done": int, "segments_total": int, "attempts": int, "duration": float, "progress": float, "created_at": float, "updated_at": float}
+
+
+def job_key(job_id: str) -> str:
+    return f"transcription:job:{job_id}"
+
+
+def events_channel(job_id: str) -> str:
+    return f"transcription:job:{job_id}:events"
+
+
+def _decode(raw: dict) -> dict | None:
+    if not raw:
+        return None
+    job = {field: _NUMERIC_FIELDS[field](value) if field in _NUMERIC_FIELDS else value for field, value in raw.items()}
+    job["error"] = job.get("error") or None
+    return job
+
+
+async def enqueue(redis_client, user_id: str, media_id: str, model: str, force: bool = False) -> dict:
+    job_id = uuid4().hex
+    now = time.time()
+    job = {
+        "job_id": job_id, "user_id": user_id, "media_id": media_id, "model": model, "force": int(force), "status": "queued",
+        "segments_done": 0, "segments_total": 0, "progress": 0.0, "duration": 0.0, "attempts": 0,
+        "error": "", "created_at": now, "updated_at": now,
+    }
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(job_key(job_id), mapping=job)
+        pipe.expire(job_key(job_id), settings.TRANSCRIPTION_JOB_TTL)
+        pipe.xadd(JOBS_STREAM, {"job_id": job_id}, maxlen=settings.TRANSCRIPTION_STREAM_MAXLEN, approximate=True)
+        await pipe.execute()
+    return _decode(job)
+
+
+async def get_job(redis_client, job_id: str) -> dict | None:
+    return _decode(await redis_client.hgetall(job_key(job_id)))
+
+
+async def update_job(redis_client, job_id: str, **fields) -> dict:
+    fields["updated_at"] = time.time()
+    if "error" in fields:
+        fields["error"] = fields["error"] or ""
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(job_key(job_id), mapping=fields)
+        pipe.expire(job_key(job_id), settings.TRANSCRIPTION_JOB_TTL)
+        pipe.hgetall(job_key(job_id))
+        *_, raw = await pipe.execute()
+    job = _decode(raw)
+    await redis_client.publish(events_channel(job_id), json.dumps(job))
+    return job
+
+
+_followers = {}  # events channel -> set of follower queues in this process
+_events_task = None
+
+
+def follower_count() -> int:
+    return sum(len(queues) for queues in _followers.values())
+
+
+def accepting_followers() -> bool:
+    return follower_count() < settings.TRANSCRIPTION_EVENTS_MAX_FOLLOWERS
+
+
+async def _listen_for_events():
+    while True:
+        redis_client = await get_redis_client()
+        if redis_client is None:
+            await asyncio.sleep(5)
+            continue
+        try:
+            async with redis_client.pubsub() as pubsub:
+                await pubsub.psubscribe(EVENTS_PATTERN)
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        for queue in _followers.get(message["channel"], ()):
+                            queue.put_nowait(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Followers re-read the job hash at every keepalive, so events missed here are recovered
+            logger.error(f"Transcription events listener failed: {e}")
+            await asyncio.sleep(1)
+
+
+def start_events_listener():
+    global _events_task
+    if _events_task is None or _events_task.done():
+        _events_task = asyncio.create_task(_listen_for_events())
+
+
+def stop_events_listener():
+    global _events_task
+    if _events_task is not None:
+        _events_task.cancel()
+        _events_task = None
+
+
+async def follow(redis_client, job_id: str):
+    """Server-sent events: the current job state, then every change until the job finishes."""
+    channel = events_channel(job_id)
+    queue = asyncio.Queue()
+    # Registered before reading the state, so no change can slip between the two
+    _followers.setdefault(channel, set()).add(queue)
+    try:
+        job = await get_job(redis_client, job_id)
+        sent = None
+        while job is not None:
+            if job != sent:
+                yield f"data: {json.dumps(job)}\n\n"
+                sent = job
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            try:
+                job = json.loads(await asyncio.wait_for(queue.get(), settings.TRANSCRIPTION_EVENTS_KEEPALIVE))
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                job = await get_job(redis_client, job_id)
+    finally:
+        queues = _followers.get(channel)
+        queues.discard(queue)
+        if not queues:
+            del _followers[channel]
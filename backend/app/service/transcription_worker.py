@@ -0,0 +1,298 @@
+"""Offline transcription worker for jobs queued by POST /media/{file_id}/transcribe.
+
+Each process joins the jobs consumer group (app.service.transcription_jobs) and runs up to
+--concurrency jobs at a time. A job decodes the media with ffmpeg into a memory-mapped PCM file,
+cuts it into Whisper-window segments at quiet points, and decodes the segments in batches on
+--threads inference threads (each with its own model copy). The transcript and its timed segments
+are stored on the media record. Backlog throughput scales with the number of processes:
+
+    python -m app.service.transcription_worker --concurrency 1 --threads 2 --metrics-port 9101
+"""
+import argparse
+import asyncio
+import os
+import signal
+import tempfile
+import time
+from datetime import datetime
+from functools import partial
+import numpy as np
+from prometheus_client import start_http_server
+from redis.exceptions import ResponseError
+from app.core.config import settings, logger
+from app.core.leader import WORKER_ID
+from app.core.monitoring import metrics
+from app.core.redis_instance import get_redis_client, close_redis_client
+from app.db.database import db
+from app.db.db_instance import init_mongodb
+from app.service import media_store
+from app.service import transcription_jobs as jobs
+from app.service.inference import InferenceExecutor
+from app.service.model_registry import model_registry
+from app.service.transcription import WHISPER_WINDOW_SECONDS, decode_batch
+
+BYTES_PER_SAMPLE = 2
+CUT_FRAME_SECONDS = 0.1
+
+
+class JobError(RuntimeError):
+    """A job that cannot succeed however often it is retried (deleted media, undecodable file)."""
+
+
+async def decode_to_pcm(blob_id, length: int, workdir: str) -> np.ndarray:
+    # GridFS -> temp file -> ffmpeg -> pcm16 file, memory-mapped so long recordings never sit in RAM.
+    # ffmpeg reads a file rather than a pipe: MP4/M4A files with a trailing index cannot be piped
+    source, pcm = os.path.join(workdir, "source"), os.path.join(workdir, "audio.pcm")
+    with open(source, "wb") as f:
+        if length:
+            async for chunk in media_store.stream_range(blob_id, 0, length - 1):
+                await asyncio.to_thread(f.write, chunk)
+    proc = await asyncio.create_subprocess_exec(
+        settings.FFMPEG_BINARY, "-nostdin", "-loglevel", "error", "-i", source,
+        "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(settings.SAMPLE_RATE), "-y", pcm,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise JobError(f"Could not decode media: {stderr.decode(errors='replace').strip()[:300]}")
+    samples = os.path.getsize(pcm) // BYTES_PER_SAMPLE
+    if samples == 0:
+        return np.zeros(0, dtype=np.int16)
+    return np.memmap(pcm, dtype=np.int16, mode="r", shape=(samples,))
+
+
+def plan_segments(audio: np.ndarray, sample_rate: int = None) -> list:
+    """Cut audio into (start, end) sample ranges no longer than Whisper's window.
+
+    Each cut moves back to the quietest 100 ms of the preceding TRANSCRIPTION_CUT_SEARCH_SECONDS,
+    so segment boundaries fall in pauses rather than mid-word.
+    """
+    sample_rate = sample_rate or settings.SAMPLE_RATE
+    max_len = int(min(settings.TRANSCRIPTION_SEGMENT_SECONDS, WHISPER_WINDOW_SECONDS) * sample_rate)
+    search = min(int(settings.TRANSCRIPTION_CUT_SEARCH_SECONDS * sample_rate), max_len // 2)
+    frame = max(int(CUT_FRAME_SECONDS * sample_rate), 1)
+    segments, start = [], 0
+    while len(audio) - start > max_len:
+        window_start = start + max_len - search
+        window = np.asarray(audio[window_start:start + max_len], dtype=np.float32)
+        frames = window[:len(window) // frame * frame].reshape(-1, frame)
+        quietest = int(np.argmin(np.square(frames).mean(axis=1))) if len(frames) else 0
+        cut = window_start + quietest * frame + frame // 2
+        segments.append((start, cut))
+        start = cut
+    if len(audio) > start:
+        segments.append((start, len(audio)))
+    return segments
+
+
+def is_silent(clip: np.ndarray) -> bool:
+    # Same energy gate as the live VAD: no frame above VAD_ENERGY_THRESHOLD means nothing to decode
+    frame = int(settings.SAMPLE_RATE * settings.VAD_FRAME_MS / 1000)
+    frames = clip[:len(clip) // frame * frame].reshape(-1, frame)
+    return not len(frames) or float(np.sqrt(np.square(frames).mean(axis=1)).max()) <= settings.VAD_ENERGY_THRESHOLD
+
+
+class TranscriptionWorker:
+    def __init__(self, concurrency: int = None, threads: int = None):
+        self.concurrency = concurrency or settings.TRANSCRIPTION_JOB_CONCURRENCY
+        self.threads = threads or settings.TRANSCRIPTION_JOB_THREADS
+        self.executor = InferenceExecutor(
+            workers=self.threads, max_queue=self.concurrency * self.threads, timeout=settings.TRANSCRIPTION_SEGMENT_TIMEOUT
+        )
+        self._decode_slots = asyncio.Semaphore(self.threads)
+        self._tasks = set()
+        self._stopping = False
+        self._next_reclaim = 0.0
+
+    async def transcribe(self, redis_client, job: dict, ref: dict, model: str) -> dict:
+        job_id = job["job_id"]
+        with tempfile.TemporaryDirectory(prefix="transcribe-") as workdir:
+            audio = await decode_to_pcm(ref["blob_id"], ref["length"], workdir)
+            duration = len(audio) / settings.SAMPLE_RATE
+            plan = plan_segments(audio)
+            await jobs.update_job(redis_client, job_id, segments_total=len(plan), duration=round(duration, 2))
+            results = [None] * len(plan)
+            done = 0
+
+            async def run_batch(first: int, batch: list):
+                nonlocal done
+                # Clips are materialised only once a decode slot is free, so memory stays at
+                # threads x batch size whatever the file length
+                async with self._decode_slots:
+                    clips = [np.asarray(audio[s:e], dtype=np.float32) / 32768.0 for s, e in batch]
+                    speech = [i for i, clip in enumerate(clips) if not is_silent(clip)]
+                    texts = [""] * len(batch)
+                    if speech:
+                        decoded = await self.executor.run(partial(decode_batch, model), [clips[i] for i in speech])
+                        for i, result in zip(speech, decoded):
+                            texts[i] = result["text"].strip()
+                for offset, ((s, e), text) in enumerate(zip(batch, texts)):
+                    results[first + offset] = {"start": round(s / settings.SAMPLE_RATE, 2), "end": round(e / settings.SAMPLE_RATE, 2), "text": text}
+                done += len(batch)
+                metrics.transcription_job_segments.inc(len(batch))
+                await jobs.update_job(redis_client, job_id, segments_done=done, progress=round(done / len(plan), 4))
+
+            size = settings.TRANSCRIPTION_BATCH_SIZE
+            await asyncio.gather(*(run_batch(i, plan[i:i + size]) for i in range(0, len(plan), size)))
+
+        segments = [segment for segment in results if segment["text"]]
+        return {
+            "model": model,
+            "language": "en",
+            "duration": round(duration, 2),
+            "text": " ".join(segment["text"] for segment in segments),
+            "segments": segments,
+        }
+
+    async def run_job(self, redis_client, job: dict):
+        ref = await media_store.find_file(job["media_id"], job["user_id"])
+        if ref is None:
+            raise JobError("Media was deleted")
+        try:
+            model = model_registry.resolve(job["model"])
+        except ValueError as e:
+            raise JobError(str(e))
+        transcript = None
+        if job.get("force") != "1":
+            # Uploads are content-addressed: the same audio transcribed with the same model is reused
+            transcript = await media_store.find_transcript(ref["sha256"], model)
+        if transcript is None:
+            transcript = await self.transcribe(redis_client, job, ref, model)
+            metrics.transcription_job_audio_seconds.inc(transcript["duration"])
+        transcript = {**transcript, "job_id": job["job_id"], "completed_at": datetime.utcnow()}
+        await media_store.set_transcript(job["media_id"], transcript)
+        return transcript
+
+    async def _handle(self, redis_client, entry_id: str, job_id: str):
+        heartbeat = asyncio.create_task(self._heartbeat(redis_client, entry_id))
+        acknowledge = True
+        try:
+            job = await jobs.get_job(redis_client, job_id)
+            if job is None or job["status"] in jobs.TERMINAL_STATUSES:
+                return  # expired, or finished just before a reclaim
+            attempts = job["attempts"] + 1
+            if attempts > settings.TRANSCRIPTION_JOB_MAX_ATTEMPTS:
+                raise JobError(f"Gave up after {attempts - 1} attempts: {job['error']}")
+            await jobs.update_job(redis_client, job_id, status="running", attempts=attempts, worker=WORKER_ID, error=None)
+            await media_store.set_transcription(job["media_id"], status="running")
+            start = time.perf_counter()
+            transcript = await self.run_job(redis_client, job)
+            await jobs.update_job(redis_client, job_id, status="completed", progress=1.0, duration=transcript["duration"])
+            await media_store.set_transcription(job["media_id"], status="completed")
+            metrics.transcription_jobs.labels(status="completed").inc()
+            metrics.transcription_job_seconds.observe(time.perf_counter() - start)
+            logger.info(f"Transcription job {job_id} completed ({transcript['duration']:.0f}s of audio in {time.perf_counter() - start:.1f}s)")
+        except JobError as e:
+            logger.error(f"Transcription job {job_id} failed: {e}")
+            await self._fail(redis_client, job_id, str(e))
+        except asyncio.CancelledError:
+            acknowledge = False  # shutting down: the job stays pending and another worker reclaims it
+            raise
+        except Exception as e:
+            # Possibly transient (database or Redis hiccup): leave the entry pending, to be
+            # reclaimed and retried once its claim goes idle
+            acknowledge = False
+            logger.error(f"Transcription job {job_id} attempt failed, will retry: {type(e).__name__}: {e}")
+            metrics.transcription_jobs.labels(status="retried").inc()
+            await jobs.update_job(redis_client, job_id, status="queued", error=f"{type(e).__name__}: {e}")
+        finally:
+            heartbeat.cancel()
+            if acknowledge:
+                await redis_client.xack(jobs.JOBS_STREAM, jobs.JOBS_GROUP, entry_id)
+
+    async def _fail(self, redis_client, job_id: str, error: str):
+        job = await jobs.update_job(redis_client, job_id, status="failed", error=error)
+        metrics.transcription_jobs.labels(status="failed").inc()
+        if job.get("media_id"):
+            await media_store.set_transcription(job["media_id"], status="failed", error=error)
+
+    async def _heartbeat(self, redis_client, entry_id: str):
+        # Re-claiming our own entry resets its idle time, so long jobs are not taken over
+        while True:
+            await asyncio.sleep(settings.TRANSCRIPTION_JOB_CLAIM_IDLE_SECONDS / 3)
+            try:
+                await redis_client.xclaim(jobs.JOBS_STREAM, jobs.JOBS_GROUP, WORKER_ID, 0, [entry_id], justid=True)
+            except Exception as e:
+                logger.warning(f"Transcription job heartbeat failed: {e}")
+
+    async def _next_entry(self, redis_client):
+        if time.time() >= self._next_reclaim:
+            self._next_reclaim = time.time() + settings.TRANSCRIPTION_JOB_CLAIM_IDLE_SECONDS / 4
+            _, claimed, *_ = await redis_client.xautoclaim(
+                jobs.JOBS_STREAM, jobs.JOBS_GROUP, WORKER_ID,
+                int(settings.TRANSCRIPTION_JOB_CLAIM_IDLE_SECONDS * 1000), start_id="0-0", count=1,
+            )
+            if claimed:
+                logger.info(f"Reclaimed stalled transcription job entry {claimed[0][0]}")
+                return claimed[0]
+        response = await redis_client.xreadgroup(jobs.JOBS_GROUP, WORKER_ID, {jobs.JOBS_STREAM: ">"}, count=1, block=5000)
+        if response:
+            return response[0][1][0]
+        return None
+
+    async def run(self):
+        redis_client = await get_redis_client()
+        if redis_client is None or db.mongo_db is None:
+            raise SystemExit("Redis and MongoDB are required")
+        try:
+            await redis_client.xgroup_create(jobs.JOBS_STREAM, jobs.JOBS_GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        slots = asyncio.Semaphore(self.concurrency)
+        logger.info(f"Transcription worker {WORKER_ID} started ({self.concurrency} jobs x {self.threads} threads)")
+        while not self._stopping:
+            await slots.acquire()
+            try:
+                entry = await self._next_entry(redis_client)
+            except Exception as e:
+                logger.error(f"Reading transcription jobs failed: {e}")
+                entry = None
+                await asyncio.sleep(1)
+            if entry is None:
+                slots.release()
+                continue
+            entry_id, fields = entry
+            task = asyncio.create_task(self._handle(redis_client, entry_id, fields["job_id"]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    def stop(self):
+        self._stopping = True
+        for task in list(self._tasks):
+            task.cancel()
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+async def main(args):
+    await init_mongodb()
+    worker = TranscriptionWorker(args.concurrency, args.threads)
+    loop = asyncio.get_running_loop()
+    runner = asyncio.create_task(worker.run())
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: (worker.stop(), runner.cancel()))
+    try:
+        await runner
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await asyncio.gather(*worker._tasks, return_exceptions=True)
+        worker.shutdown()
+        if db.mongo_client is not None:
+            db.mongo_client.close()
+        await close_redis_client()
+        logger.info("Transcription worker stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run offline transcription jobs from the Redis stream")
+    parser.add_argument("--concurrency", type=int, default=settings.TRANSCRIPTION_JOB_CONCURRENCY, help="Jobs processed at once")
+    parser.add_argument("--threads", type=int, default=settings.TRANSCRIPTION_JOB_THREADS, help="Inference threads, each with its own model copy")
+    parser.add_argument("--metrics-port", type=int, default=0, help="Serve Prometheus metrics on this port (0 = off)")
+    args = parser.parse_args()
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    asyncio.run(main(args))
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+from pymongo.errors import BulkWriteError
+from app.core.config import settings, logger
+from app.core.monitoring import metrics
+from app.core.redis_instance import get_redis_client
+from app.db.database import db
+from app.service import conversation_store
+
+# Write-behind persistence of chat messages to MongoDB.
+# MESSAGE_PERSISTENCE selects the durability/latency trade-off:
+#   sync   - written to MongoDB before the request returns
+#   async  - the message is acknowledged once it is queued in Redis; a background flusher
+#            writes queued messages to MongoDB in bulk_write batches
+#   hybrid - queued like async, but the request waits (up to WRITE_BEHIND_HYBRID_TIMEOUT) for
+#            the next flush, i.e. group commit: one MongoDB round trip for many requests
+# The queue is a Redis list popped with LPOP <count>, so several processes can flush safely.
+# Within a process flushes are serialized, so sequence numbers are claimed in pop order and a
+# reader that flushes for read-your-writes also waits out a flush already in progress. A failed
+# batch goes back to the head of the queue with the `seq` each entry was given, so the retry
+# writes the same numbers instead of claiming new ones and leaving holes.
+
+PENDING_KEY = "conversation:pending"
+
+
+class ConversationWriter:
+    def __init__(self):
+        self._task = None
+        self._wake = None
+        self._next_cycle = None
+        self._stopping = False
+        self._flush_lock = asyncio.Lock()
+
+    async def persist(self, avatar_id, user_id: str, message: dict):
+        if settings.MESSAGE_PERSISTENCE == "sync":
+            await conversation_store.append_messages(avatar_id, user_id, [message])
+            return
+
+        entry = {"avatar_id": avatar_id, "user_id": user_id, "message": message, "ts": time.time()}
+        redis_client = await get_redis_client()
+        queued = await redis_client.rpush(PENDING_KEY, json.dumps(entry))
+        metrics.write_behind_queue_length.set(queued)
+        if self._task is None:
+            return  # no flusher in this process; another worker will drain the queue
+        if queued >= settings.WRITE_BEHIND_BATCH_SIZE:
+            self._wake.set()
+        if settings.MESSAGE_PERSISTENCE == "hybrid":
+            cycle = self._next_cycle
+            self._wake.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(cycle), settings.WRITE_BEHIND_HYBRID_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("Write-behind flush did not finish in time; message stays queued in Redis")
+
+    async def start(self):
+        if self._task is not None or settings.MESSAGE_PERSISTENCE == "sync":
+            return
+        loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._next_cycle = loop.create_future()
+        self._stopping = False
+        self._task = loop.create_task(self._run())
+        logger.info(f"Write-behind flusher started ({settings.MESSAGE_PERSISTENCE})")
+
+    async def stop(self):
+        # Stop the loop, then drain whatever is still queued so shutdown never strands messages
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        await self.flush()
+        logger.info("Write-behind flusher stopped")
+
+    async def _run(self):
+        interval = settings.WRITE_BEHIND_INTERVAL_MS / 1000
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            # Swapped under the lock: messages queued while waiting for it are covered by this flush
+            done, self._next_cycle = self._next_cycle, asyncio.get_running_loop().create_future()
+            flushed = 0
+            try:
+                while True:
+                    count = await self._flush_batch()
+                    flushed += count
+                    if count < settings.WRITE_BEHIND_BATCH_SIZE:
+                        break
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {e}")
+                metrics.write_behind_errors.inc()
+            finally:
+                if done is not None and not done.done():
+                    done.set_result(flushed)
+            return flushed
+
+    async def _requeue(self, redis_client, entries: list):
+        # Back at the head of the queue, in order, so the next cycle retries them first
+        await redis_client.lpush(PENDING_KEY, *[json.dumps(entry) for entry in reversed(entries)])
+
+    async def _flush_batch(self) -> int:
+        redis_client = await get_redis_client()
+        if redis_client is None or db.mongo_db is None:
+            return 0
+        items = await redis_client.lpop(PENDING_KEY, settings.WRITE_BEHIND_BATCH_SIZE)
+        if not items:
+            metrics.write_behind_queue_length.set(0)
+            return 0
+        entries = [json.loads(item) for item in items]
+
+        # Group per conversation, claim sequence numbers for the entries that have none yet, then
+        # write every touched bucket of every conversation in a single bulk_write
+        grouped = {}
+        for entry in entries:
+            group = grouped.setdefault((entry["avatar_id"], entry["user_id"]), {"entries": [], "ts": entry["ts"]})
+            group["entries"].append(entry)
+            group["ts"] = max(group["ts"], entry["ts"])
+        claims = [
+            (key, [entry for entry in group["entries"] if "seq" not in entry], group["ts"])
+            for key, group in grouped.items()
+        ]
+        claims = [claim for claim in claims if claim[1]]
+        first_seqs = await asyncio.gather(*[
+            conversation_store.reserve_sequence(avatar_id, user_id, len(unsequenced), datetime.utcfromtimestamp(ts))
+            for (avatar_id, user_id), unsequenced, ts in claims
+        ], return_exceptions=True)
+        failure = None
+        for (_, unsequenced, _), first_seq in zip(claims, first_seqs):
+            if isinstance(first_seq, BaseException):
+                failure = failure or first_seq
+                continue
+            for offset, entry in enumerate(unsequenced):
+                entry["seq"] = first_seq + offset
+        if failure is not None:
+            # Conversations whose claim succeeded keep their numbers in the requeued entries
+            await self._requeue(redis_client, entries)
+            raise failure
+
+        operations = []
+        for (avatar_id, user_id), group in grouped.items():
+            messages = [{**entry["message"], "seq": entry["seq"]} for entry in group["entries"]]
+            for operation, offsets in conversation_store.sequenced_operations(avatar_id, user_id, messages):
+                operations.append((operation, [group["entries"][offset] for offset in offsets]))
+        try:
+            await conversation_store.write_buckets([operation for operation, _ in operations])
+        except BulkWriteError as e:
+            # Requeue only the messages of failed bucket updates; the rest are already written
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            retry = [entry for index, (_, op_entries) in enumerate(operations) if index in failed for entry in op_entries]
+            if retry:
+                await self._requeue(redis_client, retry)
+            raise
+        except Exception:
+            await self._requeue(redis_client, entries)
+            raise
+
+        metrics.write_behind_batch_size.observe(len(entries))
+        metrics.write_behind_lag.set(time.time() - min(entry["ts"] for entry in entries))
+        metrics.write_behind_queue_length.set(await redis_client.llen(PENDING_KEY))
+        return len(entries)
+
+
+conversation_writer = ConversationWriter()
@@ -0,0 +1,91 @@
+"""Per-chunk audio preparation overhead: temp WAV round trip vs in-memory np.frombuffer.
+
+Run from backend/:  python benchmarks/bench_audio_path.py [--iterations 200] [--seconds 5]
+
+Only the work done before model.transcribe is measured. The old path also paid an
+ffmpeg subprocess inside whisper.load_audio; that step is timed too when whisper
+and ffmpeg are available.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def temp_wav_path(audio_data: bytes) -> float:
+    # Mirrors the previous transcribe_audio: write WAV, read it back, hand the path to Whisper
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmpfile:
+        with wave.open(tmpfile.name, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(SAMPLE_RATE)
+            wf.writeframes(audio_data)
+        try:
+            import soundfile as sf
+            data, _ = sf.read(tmpfile.name)
+        except ImportError:
+            with wave.open(tmpfile.name, "rb") as rf:
+                data = np.frombuffer(rf.readframes(rf.getnframes()), dtype=np.int16) / 32768.0
+        amplitude = float(np.max(np.abs(data)))
+    os.unlink(tmpfile.name)  # the old code leaked this file; clean up so the benchmark doesn't
+    return amplitude
+
+
+def ffmpeg_decode(audio_data: bytes) -> float:
+    import whisper
+    with tempfile.NamedTemporaryFile(suffix=".wav") as tmpfile:
+        with wave.open(tmpfile.name, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(SAMPLE_RATE)
+            wf.writeframes(audio_data)
+        return float(whisper.load_audio(tmpfile.name).max())
+
+
+def in_memory_path(audio_data: bytes) -> float:
+    audio = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32768.0
+    return float(np.max(np.abs(audio)))
+
+
+def bench(fn, audio_data: bytes, iterations: int) -> list:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(audio_data)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name: str, timings: list):
+    ms = np.array(timings)
+    print(f"{name:<22} mean={ms.mean():8.3f} ms  p50={np.percentile(ms, 50):8.3f} ms  p95={np.percentile(ms, 95):8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    samples = (rng.normal(0, 0.1, int(SAMPLE_RATE * args.seconds)) * 32767).clip(-32768, 32767)
+    audio_data = samples.astype(np.int16).tobytes()
+    print(f"{args.seconds:.1f} s chunk ({len(audio_data)} bytes), {args.iterations} iterations")
+
+    report("temp wav + read", bench(temp_wav_path, audio_data, args.iterations))
+    if shutil.which("ffmpeg"):
+        try:
+            report("whisper ffmpeg decode", bench(ffmpeg_decode, audio_data, max(1, args.iterations // 10)))
+        except ImportError:
+            pass
+    report("np.frombuffer", bench(in_memory_path, audio_data, args.iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,440 @@
+"""End-to-end load test for the REST and websocket paths, with a JSON report for commit-to-commit comparison.
+
+Backing services come from benchmarks/docker-compose.yml (Postgres, MongoDB, Redis):
+
+    docker compose -f benchmarks/docker-compose.yml up -d
+
+Run from backend/. --serve starts the app on a free port without the ngrok tunnel, since ngrok
+needs a public account. Without --serve, --url must point at a server that is already running.
+
+    python benchmarks/load_test.py --serve --concurrency 20 --requests 200 --ws-sessions 8 --output run.json
+    python benchmarks/load_test.py --serve --output new.json --compare run.json --fail-threshold 15
+
+--fake-redis and --fake-mongo swap the containers for in-process fakes (fakeredis, mongomock-motor).
+mongomock has no GridFS, so --fake-mongo skips the upload scenario and the document check. Postgres has no fake.
+
+Before the timed scenarios, a check uploads a text document to a new avatar and fails the run unless
+/avatars/{avatar_id}/context returns its passage (upload -> retrieval index -> top-k search).
+
+Scenarios:
+- REST: signup, login, avatars_create, avatars_list, message, select and upload. Each runs --requests
+  calls at --concurrency and reports throughput plus p50/p95/p99 latency. message, select and upload
+  go to the avatars created by avatars_create, as their owners.
+- Websocket: --ws-sessions concurrent sessions each stream --ws-seconds of synthetic 16 kHz PCM.
+  The audio alternates speech-like bursts with silence, paced at --ws-pace times real time.
+  final_latency is measured from the end of a speech burst to its final transcript, so it includes the
+  VAD end-of-speech wait. With --ws-pace 0, rtf is session wall time / audio seconds.
+The report also scrapes the server's transcription stage histograms and real-time-factor gauge from /metrics.
+Every scenario reports its success rate; the run exits non-zero if any scenario is below 100%
+(unless --allow-errors), so a regression to failing requests cannot pass as fast ones.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+SAMPLE_RATE = 16000
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+COMPOSE_ENV = {
+    "POSTGRES_DB": "avatar_bench", "POSTGRES_USER": "bench", "POSTGRES_PASSWORD": "bench", "POSTGRES_HOST": "127.0.0.1",
+    "MONGO_DB": "avatar_bench", "MONGO_HOST": "127.0.0.1",
+    "REDIS_HOST": "127.0.0.1", "REDIS_PASSWORD": "bench",
+    "SECRET_KEY": "bench-secret", "NGROK_AUTH_TOKEN": "unused", "REGISTRY_ENDPOINT": "unused",
+    "GITHUB_TOKEN": "unused", "VITE_GITHUB_GIST_ID": "unused",
+}
+
+# Runs inside the server process (cwd backend/app, like the Dockerfile)
+SERVER_BOOT = """
+import sys, uvicorn, main
+port, fake_redis, fake_mongo = int(sys.argv[1]), sys.argv[2] == "1", sys.argv[3] == "1"
+if fake_redis:
+    import fakeredis.aioredis
+    import app.core.redis_instance as redis_instance
+    redis_instance._redis_client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+if fake_mongo:
+    from mongomock_motor import AsyncMongoMockClient
+    import app.db.db_instance as db_instance
+    db_instance.AsyncIOMotorClient = lambda url, **kwargs: AsyncMongoMockClient()
+uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args):
+    port = free_port()
+    env = {**COMPOSE_ENV, **os.environ, "NGROK_ENABLED": "false", "PYTHONPATH": f"{BACKEND_DIR}{os.pathsep}{BACKEND_DIR / 'app'}"}
+    proc = subprocess.Popen(
+        [sys.executable, "-c", SERVER_BOOT, str(port), str(int(args.fake_redis)), str(int(args.fake_mongo))],
+        cwd=BACKEND_DIR / "app", env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited during startup (code {proc.returncode})")
+        try:
+            if httpx.get(f"{url}/ready", timeout=1).status_code == 200:
+                return proc, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    proc.terminate()
+    raise RuntimeError("Server did not become healthy in time")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.walls = {}
+        self.extra = {}
+
+    def record(self, name: str, seconds: float, ok: bool):
+        self.latencies.setdefault(name, [])
+        self.errors.setdefault(name, 0)
+        if ok:
+            self.latencies[name].append(seconds)
+        else:
+            self.errors[name] += 1
+
+    def summary(self) -> dict:
+        results = {}
+        for name, samples in self.latencies.items():
+            ms = np.array(samples) * 1000 if samples else np.zeros(1)
+            wall = self.walls.get(name)
+            requests = len(samples) + self.errors[name]
+            results[name] = {
+                "requests": requests,
+                "errors": self.errors[name],
+                "success_rate": round(len(samples) / requests, 4) if requests else None,
+                "throughput_rps": round(len(samples) / wall, 2) if wall else None,
+                "mean_ms": round(float(ms.mean()), 2),
+                "p50_ms": round(float(np.percentile(ms, 50)), 2),
+                "p95_ms": round(float(np.percentile(ms, 95)), 2),
+                "p99_ms": round(float(np.percentile(ms, 99)), 2),
+                **self.extra.get(name, {}),
+            }
+        return results
+
+
+async def run_phase(name: str, rec: Recorder, total: int, concurrency: int, call):
+    # `call(i)` returns an httpx.Response; non-2xx counts as an error
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await call(i)
+                ok = response.is_success
+            except httpx.HTTPError:
+                ok = False
+            rec.record(name, time.perf_counter() - start, ok)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    rec.walls[name] = time.perf_counter() - start
+
+
+async def check_document_context(client: httpx.AsyncClient, headers: dict, timeout: float = 15.0):
+    """Upload a text document to a new avatar and wait until /context returns its passage."""
+    response = await client.post("/avatars/create", json={"name": "context-check", "description": "bench"}, headers=headers)
+    response.raise_for_status()
+    avatar_id = response.json()["avatar_id"]
+    marker = f"marker{uuid.uuid4().hex[:12]}"
+    text = f"The lighthouse keeper wrote {marker} in the logbook.\n\nAn unrelated paragraph about the weather."
+    response = await client.post("/media/upload", headers=headers, data={"avatar_id": avatar_id},
+                                 files={"file": ("context-check.txt", text.encode(), "text/plain")})
+    response.raise_for_status()
+    deadline = time.time() + timeout
+    while time.time() < deadline:  # documents are indexed in a background task after the upload returns
+        response = await client.get(f"/avatars/{avatar_id}/context", params={"q": marker}, headers=headers)
+        response.raise_for_status()
+        if any(r["source"] == "document" and marker in r["text"] for r in response.json()["results"]):
+            return
+        await asyncio.sleep(0.25)
+    raise RuntimeError("An uploaded text document never came back from /avatars/{avatar_id}/context")
+
+
+async def run_rest(client: httpx.AsyncClient, args, rec: Recorder):
+    run_id = uuid.uuid4().hex[:8]
+    password = "bench-password"
+    users = []
+
+    async def signup(i):
+        email = f"bench-{run_id}-{i}@example.com"
+        response = await client.post("/signup", json={"username": f"bench-{run_id}-{i}", "email": email, "password": password})
+        if response.is_success:
+            users.append((email, {"Authorization": f"Bearer {response.json()['access_token']}"}))
+        return response
+
+    # Signups are bounded by bcrypt cost, so the user pool is capped at --users
+    await run_phase("signup", rec, args.users, args.concurrency, signup)
+    if not users:
+        raise RuntimeError("No user could sign up; is Postgres reachable?")
+    pick = lambda i: users[i % len(users)]
+    if not args.fake_mongo:
+        await check_document_context(client, users[0][1])
+
+    await run_phase("login", rec, args.requests, args.concurrency,
+                    lambda i: client.post("/login", data={"username": pick(i)[0], "password": password}))
+    avatars = []  # (owner's headers, avatar_id) for every avatar created below
+
+    async def create_avatar(i):
+        headers = pick(i)[1]
+        response = await client.post("/avatars/create", json={"name": f"avatar-{i}", "description": "bench"}, headers=headers)
+        if response.is_success:
+            avatars.append((headers, response.json()["avatar_id"]))
+        return response
+
+    await run_phase("avatars_create", rec, args.requests, args.concurrency, create_avatar)
+    await run_phase("avatars_list", rec, args.requests, args.concurrency,
+                    lambda i: client.get("/avatars", headers=pick(i)[1]))
+    if not avatars:
+        raise RuntimeError("No avatar could be created; the message, select and upload scenarios need one")
+    owned = lambda i: avatars[i % len(avatars)]
+
+    await run_phase("message", rec, args.requests, args.concurrency,
+                    lambda i: client.post("/avatars/message", json={"avatar_id": owned(i)[1], "role": "user", "content": f"message {i}"}, headers=owned(i)[0]))
+    await run_phase("select", rec, args.requests, args.concurrency,
+                    lambda i: client.get(f"/avatars/{owned(i)[1]}/select", headers=owned(i)[0]))
+    if args.fake_mongo:
+        return
+    payload = np.random.default_rng(0).bytes(args.upload_kb * 1024)
+    await run_phase("upload", rec, args.requests, args.concurrency,
+                    lambda i: client.post("/media/upload", headers=owned(i)[0], data={"avatar_id": owned(i)[1]},
+                                          files={"file": (f"bench-{i}.bin", i.to_bytes(8, "big") + payload, "application/octet-stream")}))
+
+
+def synthetic_speech(seconds: float, seed: int) -> tuple[bytes, list]:
+    """PCM16 alternating 1.5-2.5 s voiced bursts with 1 s silences; returns (pcm, burst end offsets in seconds)."""
+    rng = np.random.default_rng(seed)
+    parts, burst_ends, elapsed = [], [], 0.0
+    while elapsed < seconds:
+        burst = rng.uniform(1.5, 2.5)
+        t = np.arange(int(burst * SAMPLE_RATE)) / SAMPLE_RATE
+        pitch = rng.uniform(100, 220)
+        voiced = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6))
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t) ** 2  # syllable-rate amplitude modulation
+        parts.append(0.2 * voiced * envelope + rng.normal(0, 0.005, t.size))
+        elapsed += burst
+        burst_ends.append(elapsed)
+        parts.append(rng.normal(0, 0.002, SAMPLE_RATE))
+        elapsed += 1.0
+    audio = np.concatenate(parts)
+    return (np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes(), burst_ends
+
+
+async def ws_session(url: str, args, seed: int, rec: Recorder, stats: dict):
+    import websockets
+
+    pcm, burst_ends = synthetic_speech(args.ws_seconds, seed)
+    audio_seconds = len(pcm) / 2 / SAMPLE_RATE
+    chunk_bytes = int(SAMPLE_RATE * args.ws_chunk_ms / 1000) * 2
+    pending_bursts = []  # wall-clock times at which each speech burst finished sending
+    finals_expected = len(burst_ends)
+    done = asyncio.Event()
+
+    async with websockets.connect(f"{url}/transcription/ws?mode=stream", max_size=None) as ws:
+        start = time.perf_counter()
+
+        async def receive():
+            finals = 0
+            async for raw in ws:
+                message = json.loads(raw)
+                kind = message.get("type")
+                stats[kind] = stats.get(kind, 0) + 1
+                if kind == "final":
+                    finals += 1
+                    if pending_bursts:
+                        rec.record("ws_final_latency", time.perf_counter() - pending_bursts.pop(0), True)
+                    if finals >= finals_expected:
+                        break
+                elif kind in ("busy", "error"):
+                    rec.record("ws_final_latency", 0.0, False)
+            done.set()
+
+        receiver = asyncio.create_task(receive())
+        sent_seconds = 0.0
+        for offset in range(0, len(pcm), chunk_bytes):
+            await ws.send(pcm[offset:offset + chunk_bytes])
+            sent_seconds += chunk_bytes / 2 / SAMPLE_RATE
+            while burst_ends and sent_seconds >= burst_ends[0]:
+                burst_ends.pop(0)
+                pending_bursts.append(time.perf_counter())
+            if args.ws_pace > 0:
+                await asyncio.sleep(args.ws_chunk_ms / 1000 / args.ws_pace)
+        try:
+            await asyncio.wait_for(done.wait(), args.ws_drain_timeout)
+        except asyncio.TimeoutError:
+            stats["missing_finals"] = stats.get("missing_finals", 0) + len(pending_bursts)
+        receiver.cancel()
+        wall = time.perf_counter() - start
+    rec.record("ws_session", wall, True)
+    stats.setdefault("rtf", []).append(wall / audio_seconds)
+
+
+async def run_ws(base_url: str, args, rec: Recorder):
+    import websockets
+
+    ws_url = base_url.replace("http", "ws", 1)
+    stats = {}
+
+    async def session(seed):
+        try:
+            await ws_session(ws_url, args, seed, rec, stats)
+        except (websockets.ConnectionClosed, OSError) as e:
+            print(f"websocket session {seed} failed: {e!r}", file=sys.stderr)
+            rec.record("ws_session", 0.0, False)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[session(seed) for seed in range(args.ws_sessions)])
+    rec.walls["ws_session"] = time.perf_counter() - start
+    rtf = stats.pop("rtf", [])
+    rec.extra["ws_session"] = {
+        "audio_seconds_per_session": args.ws_seconds,
+        "rtf_mean": round(float(np.mean(rtf)), 3) if rtf else None,
+        "rtf_max": round(float(np.max(rtf)), 3) if rtf else None,
+        "messages": stats,
+    }
+
+
+def scrape_server_metrics(base_url: str) -> dict:
+    """Mean transcription stage latency and last real-time factor reported by the server."""
+    try:
+        text = httpx.get(f"{base_url}/metrics", timeout=5).text
+    except httpx.HTTPError:
+        return {}
+    sums, counts, rtf = {}, {}, {}
+    for line in text.splitlines():
+        if line.startswith("transcription_stage_seconds_sum"):
+            sums[line.split('stage="')[1].split('"')[0]] = float(line.rsplit(" ", 1)[1])
+        elif line.startswith("transcription_stage_seconds_count"):
+            counts[line.split('stage="')[1].split('"')[0]] = float(line.rsplit(" ", 1)[1])
+        elif line.startswith("transcription_real_time_factor{"):
+            rtf[line.split('model="')[1].split('"')[0]] = float(line.rsplit(" ", 1)[1])
+    stages = {stage: round(sums[stage] / counts[stage] * 1000, 3) for stage in sums if counts.get(stage)}
+    return {"stage_mean_ms": stages, "real_time_factor": rtf}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def failing_scenarios(report: dict) -> list:
+    return [name for name, result in report["results"].items() if result["errors"]]
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> bool:
+    """Print p95/throughput deltas against a baseline report; True if any p95 regressed past the
+    threshold or a scenario has failed requests."""
+    regressed = False
+    print(f"\nvs {baseline.get('commit', '?')}:")
+    for name, current in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or not previous.get("p95_ms"):
+            continue
+        delta = (current["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100
+        line = f"  {name:<18} p95 {previous['p95_ms']:9.2f} -> {current['p95_ms']:9.2f} ms ({delta:+6.1f}%)"
+        if current.get("throughput_rps") and previous.get("throughput_rps"):
+            line += f"  rps {previous['throughput_rps']:8.2f} -> {current['throughput_rps']:8.2f}"
+        if delta > threshold:
+            line += "  REGRESSION"
+            regressed = True
+        if current["errors"]:
+            line += f"  ERRORS ({current['success_rate']:.1%} ok)"
+            regressed = True
+        print(line)
+    return regressed
+
+
+async def run(args, base_url: str) -> dict:
+    rec = Recorder()
+    if not args.skip_rest:
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout,
+                                     limits=httpx.Limits(max_connections=args.concurrency)) as client:
+            await run_rest(client, args, rec)
+    if args.ws_sessions:
+        await run_ws(base_url, args, rec)
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": rec.summary(),
+        "server": scrape_server_metrics(base_url),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--serve", action="store_true", help="start the app in a subprocess on a free port")
+    target.add_argument("--url", help="base URL of a running server, e.g. http://127.0.0.1:8765")
+    parser.add_argument("--fake-redis", action="store_true")
+    parser.add_argument("--fake-mongo", action="store_true")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=100, help="calls per REST scenario")
+    parser.add_argument("--users", type=int, default=20, help="accounts created by the signup scenario")
+    parser.add_argument("--upload-kb", type=int, default=256)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--skip-rest", action="store_true")
+    parser.add_argument("--ws-sessions", type=int, default=4)
+    parser.add_argument("--ws-seconds", type=float, default=20.0)
+    parser.add_argument("--ws-chunk-ms", type=int, default=100)
+    parser.add_argument("--ws-pace", type=float, default=1.0, help="1 = real time, 0 = as fast as possible")
+    parser.add_argument("--ws-drain-timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="baseline JSON report to diff against")
+    parser.add_argument("--fail-threshold", type=float, default=20.0, help="p95 regression %% that fails the run")
+    parser.add_argument("--allow-errors", action="store_true", help="do not fail the run on scenarios below 100%% success")
+    args = parser.parse_args()
+
+    proc = None
+    if args.serve:
+        proc, base_url = start_server(args)
+    else:
+        base_url = args.url.rstrip("/")
+    try:
+        report = asyncio.run(run(args, base_url))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    print(json.dumps(report["results"], indent=2))
+    if report["server"]:
+        print(json.dumps(report["server"], indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    failed = False
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        failed = compare(report, baseline, args.fail_threshold)
+    failing = failing_scenarios(report)
+    if failing:
+        print(f"\nScenarios with failed requests: {', '.join(failing)}", file=sys.stderr)
+        failed = failed or not args.allow_errors
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ const AudioStreamer = ({ isTranscribing }) => {
 
   const startStreaming = async () => {
     const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
-    mediaRecorderRef.current = new MediaRecorder(stream, { mimeType: "audio/webm" });
+    mediaRecorderRef.current = new MediaRecorder(stream, { mimeType: "audio/webm;codecs=opus" });
     
     const fetch_url = import.meta.env.VITE_GITHUB_FETCH_URL_ROOT + 
                       import.meta.env.VITE_GITHUB_GIST_ID + 
@@ -15,7 +15,8 @@ const AudioStreamer = ({ isTranscribing }) => {
                       "?t=" + Date.now();
     const data = await (await fetch(fetch_url, {cache: "no-store"})).text()
     console.log("data: " + data)
-    wsRef.current = new WebSocket(data + "/transcription/ws");
+    // The server decodes Opus/WebM itself, so MediaRecorder output is sent as is
+    wsRef.current = new WebSocket(data + "/transcription/ws?codec=webm-opus");
 
     wsRef.current.onopen = () => {
       setConnected(true);
@@ -32,6 +33,10 @@ const AudioStreamer = ({ isTranscribing }) => {
       wsRef.current.onmessage = (event) => {
           try {
             const data = JSON.parse(event.data);
+            if (data.type !== "partial" && data.type !== "final") {
+              console.log("Transcription status:", data);
+              return;
+            }
             const transcript = data.transcript.trim();
 
             // Only dispatch actual transcript content or "Listening..." if empty